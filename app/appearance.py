@@ -0,0 +1,142 @@
+import numpy as np
+import cv2
+
+# HSV histogram: hue carries clothing color, saturation separates greys from colors;
+# value is left out so lighting changes at the door don't break the match
+HIST_BINS = (16, 8)
+HIST_RANGES = (0, 180, 0, 256)
+SIGNATURE_SIZE = HIST_BINS[0] * HIST_BINS[1]
+
+
+def compute_signature(frame, box, stride=2):
+    """L2-normalized HSV color histogram of a person crop, or None if the crop is empty.
+
+    The crop is subsampled by stride before conversion, which keeps this well under
+    a millisecond for typical person boxes on CPU.
+    """
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = (int(v) for v in box[:4])
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(w, x2), min(h, y2)
+    if x2 - x1 < 4 or y2 - y1 < 4:
+        return None
+
+    crop = frame[y1:y2:stride, x1:x2:stride]
+    hsv = cv2.cvtColor(np.ascontiguousarray(crop), cv2.COLOR_BGR2HSV)
+    hist = cv2.calcHist([hsv], [0, 1], None, list(HIST_BINS), list(HIST_RANGES))
+    vector = hist.reshape(-1).astype(np.float32)
+    norm = float(np.linalg.norm(vector))
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+class AppearanceIndex:
+    """Fixed-capacity nearest-neighbour index of recent person signatures.
+
+    Signatures live in one preallocated (capacity x D) float32 matrix, so a query is
+    a single matrix-vector product (cosine similarity) plus a mask. Entries older
+    than max_age seconds are evicted; when full, the stalest entry is replaced.
+    """
+
+    def __init__(self, capacity=512, max_age=600.0, dim=SIGNATURE_SIZE):
+        self.capacity = capacity
+        self.max_age = max_age
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.times = np.full(capacity, -np.inf, dtype=np.float64)
+        self.keys = [None] * capacity
+        self.slots = {}  # key: slot
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, key, signature, current_time):
+        """Insert or refresh the signature for a person record key"""
+        slot = self.slots.get(key)
+        if slot is None:
+            free = np.flatnonzero(self.times == -np.inf)
+            slot = int(free[0]) if len(free) else int(np.argmin(self.times))
+            old_key = self.keys[slot]
+            if old_key is not None:
+                self.slots.pop(old_key, None)
+            self.keys[slot] = key
+            self.slots[key] = slot
+        self.vectors[slot] = signature
+        self.times[slot] = current_time
+
+    def remove(self, key):
+        slot = self.slots.pop(key, None)
+        if slot is not None:
+            self.keys[slot] = None
+            self.times[slot] = -np.inf
+
+    def evict(self, current_time):
+        for slot in np.flatnonzero((self.times != -np.inf) & (current_time - self.times > self.max_age)):
+            self.remove(self.keys[slot])
+
+    def query(self, signature, current_time, threshold, exclude=()):
+        """Best matching key with cosine similarity >= threshold among entries not
+        older than max_age and not in exclude; returns (key, similarity) or (None, 0)"""
+        if not self.slots:
+            return None, 0.0
+        sims = self.vectors @ signature
+        valid = (self.times != -np.inf) & (current_time - self.times <= self.max_age)
+        for key in exclude:
+            slot = self.slots.get(key)
+            if slot is not None:
+                valid[slot] = False
+        if not valid.any():
+            return None, 0.0
+        sims = np.where(valid, sims, -1.0)
+        best = int(np.argmax(sims))
+        if sims[best] < threshold:
+            return None, 0.0
+        return self.keys[best], float(sims[best])
+
+
+def link_reentries(frame, detections, tracker, index, current_time, threshold, refresh_interval):
+    """Re-associate new tracker ids with recently seen people by appearance.
+
+    Runs before analytics_step: a person track id the behavior tracker has never
+    seen is matched against signatures of people currently out of view; on a match
+    the id is aliased to the existing record so update_person_behavior counts a
+    re-entry instead of a new person. People in view refresh their signature every
+    refresh_interval seconds. Returns the number of ids linked this frame.
+    """
+    people = detections.get('customer', []) + detections.get('cashier', [])
+    if not people:
+        return 0
+
+    # People detected in this frame can't be the one who re-entered
+    present = [tracker.resolve(det['track_id']) for det in people if det.get('track_id') is not None]
+    linked = 0
+    for det in people:
+        track_id = det.get('track_id')
+        if track_id is None:
+            continue
+        key = tracker.resolve(track_id)
+        rec = tracker.records.get(key)
+
+        if rec is not None or track_id in tracker.aliases:
+            # Known person: refresh the stored signature now and then
+            slot = index.slots.get(key)
+            if slot is None or current_time - index.times[slot] >= refresh_interval:
+                signature = compute_signature(frame, det['box'])
+                if signature is not None:
+                    index.add(key, signature, current_time)
+            continue
+
+        signature = compute_signature(frame, det['box'])
+        if signature is None:
+            continue
+        match, _ = index.query(signature, current_time, threshold, exclude=present)
+        if match is not None and match in tracker.records:
+            tracker.link(track_id, match)
+            index.add(match, signature, current_time)
+            present.append(match)
+            linked += 1
+        else:
+            index.add(track_id, signature, current_time)
+
+    index.evict(current_time)
+    return linked
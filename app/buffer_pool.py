@@ -0,0 +1,36 @@
+import collections
+import numpy as np
+
+
+class FrameBufferPool:
+    """Preallocated frame arrays that the capture decodes into and the loop hands back.
+
+    acquire() pops a free buffer (or allocates one when every buffer is in flight,
+    counted in overflow_allocations); release() returns it. Buffers of another
+    pool (e.g. from before a resolution change) are simply dropped on release.
+    deque append/pop are atomic, so the inference and post-processing threads can
+    release concurrently without a lock.
+    """
+
+    def __init__(self, shape, count, dtype=np.uint8):
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.count = count
+        self._free = collections.deque(np.empty(self.shape, dtype=dtype) for _ in range(count))
+        self._ids = {id(buf) for buf in self._free}
+        self.overflow_allocations = 0
+
+    def acquire(self):
+        try:
+            return self._free.pop()
+        except IndexError:
+            self.overflow_allocations += 1
+            buf = np.empty(self.shape, dtype=self.dtype)
+            if len(self._ids) < 2 * self.count:
+                # Grow up to twice the configured size, then stop tracking extras
+                self._ids.add(id(buf))
+            return buf
+
+    def release(self, buf):
+        if buf is not None and id(buf) in self._ids and buf.shape == self.shape:
+            self._free.append(buf)
@@ -0,0 +1,88 @@
+import itertools
+import queue
+import threading
+import time
+from app.metrics import event_type
+
+
+class Subscription:
+    """Bounded per-client queue; when the client falls behind the oldest events are dropped"""
+
+    def __init__(self, bus, maxsize):
+        self.bus = bus
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event):
+        """Non-blocking put used by the publisher; never waits on a slow client"""
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.dropped += 1
+            try:
+                self.queue.put_nowait(event)
+            except queue.Full:
+                self.dropped += 1
+
+    def get(self, timeout=None):
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Fan-out of analytics events to streaming clients (e.g. POS integrations).
+
+    publish() is called from the prediction loop; it costs one attribute check
+    when nobody is subscribed and a non-blocking put per subscriber otherwise.
+    """
+
+    def __init__(self, maxsize=256, max_subscribers=16):
+        self.maxsize = maxsize
+        self.max_subscribers = max_subscribers
+        self._subscribers = ()  # replaced (never mutated) so publish can iterate without a lock
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                raise RuntimeError("Too many event stream subscribers")
+            sub = Subscription(self, self.maxsize)
+            self._subscribers = self._subscribers + (sub,)
+            return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers = tuple(s for s in self._subscribers if s is not sub)
+
+    def publish(self, events, current_time, **context):
+        """Wrap raw analytics event strings and hand them to every subscriber"""
+        subscribers = self._subscribers
+        if not subscribers:
+            return
+        wall_time = time.time()
+        for message in events:
+            event = {
+                "id": next(self._ids),
+                "type": event_type(message),
+                "message": message,
+                "stream_time": round(current_time, 3),
+                "wall_time": wall_time
+            }
+            event.update(context)
+            for sub in subscribers:
+                sub.offer(event)
@@ -0,0 +1,206 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from app.metrics import event_type
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sales (
+    session_id TEXT PRIMARY KEY,
+    voucher_number TEXT,
+    cashier_id TEXT,
+    started_at REAL,
+    closed_at REAL,
+    pos_member INTEGER,
+    pos_wallet INTEGER,
+    suspicious INTEGER,
+    recording_saved INTEGER,
+    video_path TEXT,
+    prediction_summary TEXT,
+    developer_message TEXT,
+    stats TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sales_voucher ON sales (voucher_number);
+CREATE INDEX IF NOT EXISTS idx_sales_cashier_time ON sales (cashier_id, closed_at);
+CREATE INDEX IF NOT EXISTS idx_sales_closed_at ON sales (closed_at);
+
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT,
+    wall_time REAL,
+    stream_time REAL,
+    type TEXT,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_session ON events (session_id);
+CREATE INDEX IF NOT EXISTS idx_events_time ON events (wall_time);
+"""
+
+SALE_COLUMNS = (
+    "session_id", "voucher_number", "cashier_id", "started_at", "closed_at", "pos_member", "pos_wallet",
+    "suspicious", "recording_saved", "video_path", "prediction_summary", "developer_message", "stats"
+)
+JSON_COLUMNS = ("prediction_summary", "developer_message", "stats")
+
+
+class EventStore:
+    """Append-only SQLite (WAL) store for sale results and analytics events.
+
+    Producers only enqueue rows (put_nowait); a background writer drains the queue
+    and commits in batches, so neither the prediction loop nor the HTTP handlers
+    ever wait on disk. If the writer falls hopelessly behind, rows are dropped and
+    counted rather than blocking the caller.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=1.0, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def add_events(self, session_id, events, current_time):
+        """Queue analytics event strings emitted by analytics_step"""
+        wall_time = time.time()
+        for message in events:
+            self._enqueue(("event", (session_id, wall_time, current_time, event_type(message), message)))
+
+    def add_sale(self, session_id, voucher_number, cashier_id, started_at, closed_at, pos_member, pos_wallet,
+                 suspicious, recording_saved, video_path, prediction_summary, developer_message, stats):
+        """Queue the outcome of one sale (as returned by /stop_prediction)"""
+        row = (
+            session_id, voucher_number, cashier_id, started_at, closed_at, int(bool(pos_member)),
+            int(bool(pos_wallet)), int(bool(suspicious)), int(bool(recording_saved)), video_path,
+            json.dumps(prediction_summary, default=str), json.dumps(developer_message, default=str),
+            json.dumps(stats, default=str)
+        )
+        self._enqueue(("sale", row))
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is committed (control path only)"""
+        done = threading.Event()
+        try:
+            self.queue.put(("flush", done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _writer_loop(self):
+        conn = self._connect()
+        while True:
+            batch = []
+            try:
+                batch.append(self.queue.get(timeout=self.flush_interval))
+            except queue.Empty:
+                continue
+            # Drain whatever else is already waiting, up to one batch
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write_batch(conn, batch)
+
+    def _write_batch(self, conn, batch):
+        events = [row for kind, row in batch if kind == "event"]
+        sales = [row for kind, row in batch if kind == "sale"]
+        try:
+            with conn:
+                if events:
+                    conn.executemany(
+                        "INSERT INTO events (session_id, wall_time, stream_time, type, message) VALUES (?, ?, ?, ?, ?)",
+                        events
+                    )
+                if sales:
+                    conn.executemany(
+                        f"INSERT OR REPLACE INTO sales ({', '.join(SALE_COLUMNS)}) "
+                        f"VALUES ({', '.join('?' for _ in SALE_COLUMNS)})",
+                        sales
+                    )
+        except Exception as e:
+            print(f"✗ Error writing to event store: {e}")
+        for kind, payload in batch:
+            if kind == "flush":
+                payload.set()
+
+    def query_sales(self, voucher_number=None, cashier_id=None, since=None, until=None, limit=100):
+        """Sales filtered by voucher, cashier and/or closed_at range (epoch seconds), newest first"""
+        clauses, params = [], []
+        if voucher_number:
+            clauses.append("voucher_number = ?")
+            params.append(voucher_number)
+        if cashier_id:
+            clauses.append("cashier_id = ?")
+            params.append(cashier_id)
+        if since is not None:
+            clauses.append("closed_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("closed_at <= ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT {', '.join(SALE_COLUMNS)} FROM sales {where} ORDER BY closed_at DESC LIMIT ?"
+        params.append(int(limit))
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        sales = []
+        for row in rows:
+            sale = dict(zip(SALE_COLUMNS, row))
+            for column in JSON_COLUMNS:
+                sale[column] = json.loads(sale[column]) if sale[column] else None
+            for column in ("pos_member", "pos_wallet", "suspicious", "recording_saved"):
+                sale[column] = bool(sale[column])
+            sales.append(sale)
+        return sales
+
+    def query_events(self, session_id=None, since=None, until=None, event_types=None, limit=1000):
+        """Analytics events for one sale session and/or a wall-clock time range"""
+        clauses, params = [], []
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if since is not None:
+            clauses.append("wall_time >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("wall_time <= ?")
+            params.append(until)
+        if event_types:
+            clauses.append(f"type IN ({', '.join('?' for _ in event_types)})")
+            params.extend(event_types)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT id, session_id, wall_time, stream_time, type, message FROM events {where} ORDER BY id LIMIT ?"
+        params.append(int(limit))
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+        columns = ("id", "session_id", "wall_time", "stream_time", "type", "message")
+        return [dict(zip(columns, row)) for row in rows]
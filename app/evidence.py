@@ -0,0 +1,193 @@
+import json
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+import cv2
+import numpy as np
+from app.metrics import event_type
+
+# Event type -> (classes framed in the snapshot, class whose track id the message names)
+EVIDENCE_REGIONS = {
+    "item_scanned": (("item", "scanner"), "item"),
+    "payment_started": (("phone", "scanner"), None),
+    "payment_complete": (("phone", "scanner"), None),
+    "cash_detected": (("cash", "customer"), "customer"),
+    "staff_primary": (("cashier",), "cashier"),
+    "staff_secondary": (("customer",), "customer"),
+}
+_TRACK_ID = re.compile(r"#(-?[\w:]+)")
+
+
+def evidence_region(event, detections, frame_shape, margin=0.25):
+    """(x1, y1, x2, y2) pixel crop framing the objects behind an event, or None.
+
+    The object named in the message (by track id) anchors the crop, plus the
+    nearest detection of each companion class. Without an anchor all detections
+    of the event's classes are framed. margin pads each side by that fraction.
+    """
+    classes, id_class = EVIDENCE_REGIONS.get(event_type(event), ((), None))
+    anchor = None
+    if id_class is not None:
+        match = _TRACK_ID.search(event)
+        if match:
+            track_id = match.group(1)
+            anchor = next((det for det in detections.get(id_class, []) if str(det.get('track_id')) == track_id), None)
+
+    boxes = []
+    if anchor is not None:
+        boxes.append(anchor['box'])
+        for cls in classes:
+            if cls == id_class or not detections.get(cls):
+                continue
+            ax, ay = anchor['center']
+            nearest = min(detections[cls], key=lambda d: (d['center'][0] - ax) ** 2 + (d['center'][1] - ay) ** 2)
+            boxes.append(nearest['box'])
+    else:
+        for cls in classes:
+            boxes.extend(det['box'] for det in detections.get(cls, []))
+    if not boxes:
+        return None
+
+    boxes = np.asarray(boxes, dtype=np.float32)[:, :4]
+    x1, y1 = boxes[:, 0].min(), boxes[:, 1].min()
+    x2, y2 = boxes[:, 2].max(), boxes[:, 3].max()
+    pad_x, pad_y = (x2 - x1) * margin, (y2 - y1) * margin
+    height, width = frame_shape[:2]
+    x1, y1 = max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y))
+    x2, y2 = min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y))
+    if x2 <= x1 or y2 <= y1:
+        return None
+    return (x1, y1, x2, y2)
+
+
+class EvidenceWriter:
+    """Background JPEG encoder for evidence snapshots.
+
+    The loop only copies the (small) crop and enqueues it; encoding and file I/O
+    happen on this thread. When the queue is full the snapshot is dropped and
+    counted on its bundle rather than stalling the loop.
+    """
+
+    def __init__(self, quality=80, max_size=640, max_queue=64):
+        self.quality = int(quality)
+        self.max_size = max_size  # longest side of a stored snapshot (px)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, bundle, crop, record):
+        try:
+            self.queue.put_nowait((bundle, crop, record))
+            return True
+        except queue.Full:
+            bundle.dropped += 1
+            return False
+
+    def flush(self, timeout=5.0):
+        """Wait until every snapshot queued so far is on disk"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            bundle, crop, record = item
+            try:
+                longest = max(crop.shape[:2])
+                if self.max_size and longest > self.max_size:
+                    scale = self.max_size / longest
+                    crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+                ok, jpeg = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+                if not ok:
+                    continue
+                with open(os.path.join(bundle.directory, record['file']), 'wb') as f:
+                    f.write(jpeg.tobytes())
+                record['bytes'] = len(jpeg)
+                bundle.records.append(record)
+            except Exception as e:
+                print(f"✗ Error writing evidence snapshot: {e}")
+
+
+class EvidenceBundle:
+    """Snapshots and their manifest for one sale, in a directory of their own.
+
+    capture() is called by the loop with each processed frame's events; at most
+    one snapshot per event type every cooldown seconds (stream time) and
+    max_snapshots per sale are taken. close() waits for pending writes and
+    writes manifest.json.
+    """
+
+    def __init__(self, directory, writer, event_types, margin=0.25, cooldown=1.0, max_snapshots=200):
+        self.directory = directory
+        self.writer = writer
+        self.event_types = set(event_types)
+        self.margin = margin
+        self.cooldown = cooldown
+        self.max_snapshots = max_snapshots
+        self.records = []  # appended by the writer thread
+        self.taken = 0
+        self.dropped = 0
+        self._last = {}  # event type -> stream time of its last snapshot
+        os.makedirs(directory, exist_ok=True)
+
+    def capture(self, frame, detections, events, current_time):
+        """Queue snapshots for this frame's events; returns how many were queued"""
+        queued = 0
+        for event in events:
+            kind = event_type(event)
+            if kind not in self.event_types or self.taken >= self.max_snapshots:
+                continue
+            last = self._last.get(kind)
+            if last is not None and current_time - last < self.cooldown:
+                continue
+            region = evidence_region(event, detections, frame.shape, self.margin)
+            if region is None:
+                continue
+            x1, y1, x2, y2 = region
+            self._last[kind] = current_time
+            self.taken += 1
+            record = {
+                'file': f"{self.taken:04d}_{kind}.jpg",
+                'event': event,
+                'type': kind,
+                'stream_time': round(current_time, 3),
+                'wall_time': time.time(),
+                'region': [x1, y1, x2, y2]
+            }
+            # Copy: the frame buffer goes back to its pool after this frame
+            if self.writer.submit(self, frame[y1:y2, x1:x2].copy(), record):
+                queued += 1
+        return queued
+
+    def close(self):
+        self.writer.flush()
+        manifest = {
+            'snapshots': sorted(self.records, key=lambda r: r['file']),
+            'dropped': self.dropped
+        }
+        try:
+            with open(os.path.join(self.directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, indent=2, ensure_ascii=False)
+        except Exception as e:
+            print(f"✗ Error writing evidence manifest: {e}")
+
+
+def save_bundle(directory, output_path):
+    """Move a closed bundle to its final place; returns True on success"""
+    if not os.path.isdir(directory):
+        return False
+    if os.path.exists(output_path):
+        shutil.rmtree(output_path)
+    shutil.move(directory, output_path)
+    return True
+
+
+def discard_bundle(directory):
+    shutil.rmtree(directory, ignore_errors=True)
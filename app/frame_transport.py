@@ -0,0 +1,413 @@
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from app.helper_functions import preprocess_frame
+from app.recording import open_video_writer
+from app.video_source import FrameClock, open_capture, read_stream_metadata, backoff_delay
+
+# Spawned (not forked) children: the parent holds CUDA/torch state and threads
+_ctx = mp.get_context("spawn")
+
+
+def _attach_shm(name):
+    """Attach to an existing block without registering it for cleanup in this process"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFramePool:
+    """Fixed set of frame slots in one shared memory block, passed between processes by index.
+
+    A slot is taken from the free queue with refcount 1 by its producer. Every
+    consumer that keeps the frame calls retain() before the hand-off and release()
+    when done; the slot returns to the free queue when the count drops to zero.
+    Only indices travel through queues, never pixels.
+    """
+
+    def __init__(self, name, slots, slot_bytes, refs, free, owner=False):
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.refs = refs  # multiprocessing.Array('i'), guarded by its own lock
+        self.free = free  # multiprocessing.Queue of free slot indices
+        self.owner = owner
+        if owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slots * slot_bytes)
+        else:
+            self.shm = _attach_shm(name)
+        self.buffer = np.frombuffer(self.shm.buf, dtype=np.uint8)
+        self._base = self.buffer.ctypes.data
+
+    @classmethod
+    def create(cls, slots, slot_bytes):
+        pool = cls(None, slots, slot_bytes, _ctx.Array('i', slots), _ctx.Queue(), owner=True)
+        for slot in range(slots):
+            pool.free.put(slot)
+        return pool
+
+    def descriptor(self):
+        """Arguments for attach() in a child process (passed at process creation)"""
+        return (self.shm.name, self.slots, self.slot_bytes, self.refs, self.free)
+
+    @classmethod
+    def attach(cls, descriptor):
+        return cls(*descriptor)
+
+    def acquire(self, timeout=0):
+        """A free slot owned by the caller (refcount 1), or None if none frees up within timeout"""
+        try:
+            slot = self.free.get(timeout=timeout) if timeout else self.free.get_nowait()
+        except queue.Empty:
+            return None
+        with self.refs.get_lock():
+            self.refs[slot] = 1
+        return slot
+
+    def retain(self, slot, count=1):
+        with self.refs.get_lock():
+            self.refs[slot] += count
+
+    def release(self, slot):
+        with self.refs.get_lock():
+            self.refs[slot] -= 1
+            recycle = self.refs[slot] <= 0
+            if recycle:
+                self.refs[slot] = 0
+        if recycle:
+            self.free.put(slot)
+
+    def view(self, slot, shape):
+        """Array backed by the slot's memory (no copy)"""
+        size = int(np.prod(shape))
+        start = slot * self.slot_bytes
+        return self.buffer[start:start + size].reshape(shape)
+
+    def slot_of(self, frame):
+        """Slot index if frame lives in this pool, else None"""
+        offset = frame.__array_interface__['data'][0] - self._base
+        if 0 <= offset < self.slots * self.slot_bytes:
+            return offset // self.slot_bytes
+        return None
+
+    def close(self):
+        self.buffer = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # A frame view is still alive somewhere; the OS reclaims the mapping at exit
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def capture_worker_main(pool_desc, frames, skip_interval, recording, stop, path, capture_options,
+                        clock_mode, max_read_failures, base_delay, max_delay):
+    """Capture process: decode into pool slots and hand them to the inference process.
+
+    Mirrors the in-process read path: frames that won't be processed or recorded
+    are only grabbed, and a stalled or lost source is reopened with backoff here,
+    so the inference process only sees ("down",) / ("up", downtime, meta). The
+    pool is sized for the resolution at startup; a source that comes back larger
+    is reported as ("error", message) and the process exits rather than silently
+    dropping every frame.
+    """
+    pool = SharedFramePool.attach(pool_desc)
+    cap = open_capture(path, **capture_options)
+    meta = read_stream_metadata(cap, path)
+    clock = FrameClock(meta, mode=clock_mode)
+    frames.put(("meta", meta))
+
+    frame_count = 0
+    skipped = 0
+    dropped = 0
+    failures = 0
+    try:
+        while not stop.is_set():
+            should_process = frame_count % max(1, skip_interval.value) == 0
+            wanted = should_process or recording.value
+            slot = None
+            if wanted:
+                slot = pool.acquire()
+                # Files wait for the consumer; a live frame is dropped instead (grab only, keeps time)
+                while slot is None and not meta["live"] and not stop.is_set():
+                    slot = pool.acquire(timeout=0.5)
+            retrieve = slot is not None
+
+            target = pool.view(slot, (meta["height"], meta["width"], 3)) if slot is not None else None
+            frame, frame_meta = preprocess_frame(cap, clock, retrieve=retrieve, out=target)
+            if frame_meta is None:
+                if slot is not None:
+                    pool.release(slot)
+                if not meta["live"]:
+                    frames.put(("eof",))
+                    break
+                failures += 1
+                if failures < max_read_failures:
+                    continue
+                failures = 0
+                frames.put(("down",))
+                down_since = time.monotonic()
+                attempt = 0
+                while not stop.is_set():
+                    cap.release()
+                    cap = open_capture(path, **capture_options)
+                    if cap.isOpened():
+                        break
+                    stop.wait(backoff_delay(attempt, base_delay, max_delay))
+                    attempt += 1
+                if stop.is_set():
+                    break
+                meta = read_stream_metadata(cap, path)
+                if meta["width"] * meta["height"] * 3 > pool.slot_bytes:
+                    frames.put(("error", _resolution_error(meta["width"], meta["height"], pool)))
+                    break
+                clock.update_metadata(meta)
+                frames.put(("up", time.monotonic() - down_since, meta))
+                continue
+
+            failures = 0
+            frame_count += 1
+            if slot is None:
+                if wanted:
+                    dropped += 1
+                else:
+                    skipped += 1
+                continue
+            if frame is not target:
+                # Resolution changed under us: copy into the slot if it fits
+                if frame.nbytes > pool.slot_bytes:
+                    pool.release(slot)
+                    frames.put(("error", _resolution_error(frame.shape[1], frame.shape[0], pool)))
+                    break
+                target = pool.view(slot, frame.shape)
+                np.copyto(target, frame)
+            frame_meta.update(process=should_process, skipped=skipped, dropped=dropped)
+            skipped = 0
+            dropped = 0
+            frames.put(("frame", slot, target.shape, frame_meta))
+    finally:
+        cap.release()
+        target = frame = None
+        pool.close()
+
+
+def _resolution_error(width, height, pool):
+    return (f"Source resolution changed to {width}x{height}, larger than the shared frame slots "
+            f"({pool.slot_bytes} bytes); restart prediction to resize the frame pool")
+
+
+def encoder_worker_main(pool_desc, commands, results):
+    """Encoder process: owns the VideoWriters and writes frames passed by slot index.
+    Downscaling to the recording profile size also happens here, off the inference process."""
+    pool = SharedFramePool.attach(pool_desc)
+    writers = {}
+    try:
+        while True:
+            command = commands.get()
+            kind = command[0]
+            if kind == "write":
+                _, writer_id, slot, shape = command
+                writer = writers.get(writer_id)
+                try:
+                    if writer is not None:
+                        writer.write(pool.view(slot, shape))
+                finally:
+                    pool.release(slot)
+            elif kind == "open":
+                _, writer_id, path, codec, fps, size, quality, segment_seconds = command
+                writer = open_video_writer(path, codec, fps, size, quality, segment_seconds)
+                ok = writer is not None
+                if ok:
+                    writers[writer_id] = writer
+                results.put(("opened", writer_id, ok))
+            elif kind == "close":
+                writer = writers.pop(command[1], None)
+                if writer is not None:
+                    writer.release()
+                results.put(("closed", command[1], True))
+            elif kind == "stop":
+                break
+    finally:
+        for writer in writers.values():
+            writer.release()
+        pool.close()
+
+
+class CaptureWorker:
+    """Inference-side handle of the capture process"""
+
+    def __init__(self, pool, path, capture_options, clock_mode, target_skip, max_read_failures,
+                 base_delay, max_delay, on_down=None, on_up=None):
+        self.pool = pool
+        self.frames = _ctx.Queue(maxsize=pool.slots)
+        self.skip_interval = _ctx.Value('i', target_skip)
+        self.recording = _ctx.Value('b', False)
+        self.stop_event = _ctx.Event()
+        self.on_down = on_down
+        self.on_up = on_up
+        self.meta = None
+        self.eof = False
+        self.error = None  # set when the capture process gave up (e.g. resolution outgrew the pool)
+        self.process = _ctx.Process(
+            target=capture_worker_main,
+            args=(pool.descriptor(), self.frames, self.skip_interval, self.recording, self.stop_event, path,
+                  capture_options, clock_mode, max_read_failures, base_delay, max_delay),
+            daemon=True
+        )
+
+    def start(self, timeout=30.0):
+        """Start the process and wait for the stream metadata; None if it never opened"""
+        self.process.start()
+        try:
+            kind, self.meta = self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return self.meta
+
+    def set_skip_interval(self, interval):
+        self.skip_interval.value = int(interval)
+
+    def set_recording(self, recording):
+        self.recording.value = bool(recording)
+
+    def read(self, timeout=None):
+        """Next (frame, meta) from the capture process, or (None, None) on timeout,
+        outage or end of file. frame is a view into a pool slot: call release()."""
+        try:
+            message = self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None, None
+        kind = message[0]
+        if kind == "frame":
+            _, slot, shape, meta = message
+            return self.pool.view(slot, shape), meta
+        if kind == "down" and self.on_down is not None:
+            self.on_down()
+        elif kind == "up":
+            self.meta = message[2]
+            if self.on_up is not None:
+                self.on_up(message[1], message[2])
+        elif kind == "eof":
+            self.eof = True
+        elif kind == "error":
+            self.error = message[1]
+        return None, None
+
+    def release(self, frame):
+        slot = self.pool.slot_of(frame)
+        if slot is not None:
+            self.pool.release(slot)
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        # Unblock a producer waiting on a full queue, returning any slots it carried
+        while True:
+            try:
+                message = self.frames.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] == "frame":
+                self.pool.release(message[1])
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class SharedFrameWriter:
+    """VideoWriter look-alike whose frames are encoded in the encoder process"""
+
+    def __init__(self, encoder, writer_id):
+        self.encoder = encoder
+        self.writer_id = writer_id
+        self.opened = True
+
+    def isOpened(self):
+        return self.opened
+
+    def write(self, frame):
+        self.encoder.write(self.writer_id, frame)
+
+    def release(self):
+        if self.opened:
+            self.opened = False
+            self.encoder.close_writer(self.writer_id)
+
+
+class EncoderWorker:
+    """Inference-side handle of the encoder process"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.commands = _ctx.Queue()
+        self.results = _ctx.Queue()
+        self._results_lock = threading.Lock()
+        self._pending = {}  # (kind, writer_id): ok, for results read on behalf of another caller
+        self._next_id = 0
+        self.process = _ctx.Process(
+            target=encoder_worker_main,
+            args=(pool.descriptor(), self.commands, self.results),
+            daemon=True
+        )
+
+    def start(self):
+        self.process.start()
+
+    def _wait(self, kind, writer_id, timeout):
+        deadline = time.monotonic() + timeout
+        with self._results_lock:
+            while (kind, writer_id) not in self._pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                try:
+                    result_kind, result_id, ok = self.results.get(timeout=remaining)
+                except queue.Empty:
+                    return False
+                self._pending[(result_kind, result_id)] = ok
+            return self._pending.pop((kind, writer_id))
+
+    def open_writer(self, path, codec, fps, size, quality=None, segment_seconds=0, timeout=10.0):
+        self._next_id += 1
+        writer_id = self._next_id
+        self.commands.put(("open", writer_id, path, codec, fps, tuple(size), quality, segment_seconds))
+        if not self._wait("opened", writer_id, timeout):
+            return None
+        return SharedFrameWriter(self, writer_id)
+
+    def write(self, writer_id, frame):
+        slot = self.pool.slot_of(frame)
+        if slot is not None:
+            # Zero-copy: the encoder takes its own reference to the slot
+            self.pool.retain(slot)
+        else:
+            slot = self.pool.acquire(timeout=0.1)
+            if slot is None:
+                return
+            np.copyto(self.pool.view(slot, frame.shape), frame)
+        self.commands.put(("write", writer_id, slot, frame.shape))
+
+    def backlog(self):
+        """Commands (mostly frames) the encoder has not picked up yet; None where the
+        platform can't count a multiprocessing queue"""
+        try:
+            return self.commands.qsize()
+        except NotImplementedError:
+            return None
+
+    def close_writer(self, writer_id, timeout=30.0):
+        """Returns once every queued frame is encoded and the file is finalized"""
+        self.commands.put(("close", writer_id))
+        return self._wait("closed", writer_id, timeout)
+
+    def stop(self, timeout=10.0):
+        self.commands.put(("stop",))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
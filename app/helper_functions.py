@@ -1,6 +1,7 @@
 import numpy as np
 import cv2
 from app.variables import CONF_THRESHOLD,SCANNER_ITEM_DISTANCE
+from app.spatial_index import SpatialIndex
 CLASS_NAMES = {0: 'cashier', 1: 'customer', 2: 'scanner', 3: 'item', 4: 'phone', 5: 'cash', 6: 'counter'}
 CLASS_COLORS = {
     'cashier': (0, 255, 0),
@@ -39,52 +40,78 @@ def get_box_iou(box1, box2):
 
     return intersection / union if union > 0 else 0
 
-def preprocess_frame(cap, fps):
-    """Extract frame from video and calculate metadata"""
-    ret, frame = cap.read()
+def preprocess_frame(cap, clock, retrieve=True, out=None):
+    """Grab the next frame and timestamp it.
+
+    Static stream properties come from the clock's cached metadata instead of being
+    queried per frame. With retrieve=False the frame is only grabbed (no BGR
+    conversion / array allocation), which is enough to keep time for skipped frames.
+    A preallocated out array of the right shape is decoded into in place; if the
+    shape doesn't match, OpenCV returns a new array instead.
+    Returns (None, None) when the source has no more frames.
+    """
+    if retrieve:
+        ret, frame = cap.read(out) if out is not None else cap.read()
+    else:
+        ret, frame = cap.grab(), None
     if not ret:
         return None, None
 
-    # Get frame position automatically from video capture
-    frame_count = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-    current_time = frame_count / fps
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    current_time = clock.stamp(cap)
+    stream = clock.metadata
     return frame, {
-        "frame_count": frame_count,
+        "frame_count": clock.frame_index,
         "current_time": current_time,
-        "total_frames": total_frames,
-        "width": width,
-        "height": height
+        "total_frames": stream["total_frames"],
+        "width": stream["width"],
+        "height": stream["height"]
     }
 
-def predict_frame(model, frame):
-    results = model.track(frame, persist=True, conf=CONF_THRESHOLD, verbose=False)
-
+def predict_frame(model, frame, imgsz=None, tracker=None):
+    # imgsz=None keeps the model's own input size; tracker is an ultralytics tracker YAML
+    kwargs = {'imgsz': imgsz} if imgsz else {}
+    if tracker:
+        kwargs['tracker'] = tracker
+    results = model.track(frame, persist=True, conf=CONF_THRESHOLD, verbose=False, **kwargs)
+    return result_detections(results[0])
+
+def result_detections(result, offset=(0, 0)):
+    """Per-class detection dicts from one ultralytics result; offset (x, y) maps
+    boxes found in a crop back to frame coordinates"""
     detections = {k: [] for k in CLASS_NAMES.values()}
 
-    if results[0].boxes is None:
+    boxes = result.boxes
+    if boxes is None or len(boxes) == 0:
         return detections
 
-    for box in results[0].boxes:
-        cls_id = int(box.cls[0])
+    # One device-to-host transfer per field instead of several small tensors per box
+    xyxy = boxes.xyxy.cpu().numpy()
+    if offset != (0, 0):
+        xyxy = xyxy + np.array([offset[0], offset[1], offset[0], offset[1]], dtype=xyxy.dtype)
+    confs = boxes.conf.cpu().numpy().tolist()
+    classes = boxes.cls.cpu().numpy().astype(int).tolist()
+    ids = boxes.id.cpu().numpy().astype(int).tolist() if boxes.id is not None else None
+
+    for i, cls_id in enumerate(classes):
         cls_name = CLASS_NAMES.get(cls_id, 'unknown')
+        box = xyxy[i]
 
         detections[cls_name].append({
-            'box': box.xyxy[0].cpu().numpy(),
-            'conf': float(box.conf[0]),
-            'track_id': int(box.id[0]) if box.id is not None else None,
-            'center': get_center(box.xyxy[0])
+            'box': box,
+            'conf': confs[i],
+            'track_id': ids[i] if ids is not None else None,
+            'center': get_center(box)
         })
 
     return detections
 
-def analytics_step(analytics, detections, current_time):
+def analytics_step(analytics, detections, current_time, cradles=None):
     events = []
+    # One spatial index per frame, shared by every pairwise rule below
+    index = SpatialIndex(detections)
 
     scanner_status = analytics.update_scanner_movement(
-        detections['scanner'], current_time
+        detections['scanner'], current_time, cradles
     )
 
     events.extend(
@@ -92,7 +119,8 @@ def analytics_step(analytics, detections, current_time):
             detections['item'],
             detections['scanner'],
             scanner_status,
-            current_time
+            current_time,
+            index
         )
     )
 
@@ -100,7 +128,8 @@ def analytics_step(analytics, detections, current_time):
         analytics.update_payment_scanning(
             detections['phone'],
             detections['scanner'],
-            current_time
+            current_time,
+            index
         )
     )
 
@@ -108,7 +137,18 @@ def analytics_step(analytics, detections, current_time):
         analytics.detect_cash(
             detections.get('cash', []),
             detections.get('customer', []),
-            current_time
+            current_time,
+            index
+        )
+    )
+
+    # Counter boxes are the cached fixtures once the static scene is learned
+    events.extend(
+        analytics.update_customer_at_counter(
+            detections.get('customer', []),
+            detections.get('counter', []),
+            current_time,
+            index
         )
     )
 
@@ -135,7 +175,8 @@ def debug_step(frame_count, total_frames, detections, analytics):
     for scanner in detections['scanner']:
         sid = scanner.get('track_id') or 0
         moving = analytics.scanner_moving.get(sid, False)
-        print(f"  Scanner #{sid}: moving={moving}")
+        docked = analytics.scanner_docked.get(sid, False)
+        print(f"  Scanner #{sid}: moving={moving}, docked={docked}")
 
 def render_frame(frame, detections, analytics, events, current_time, width, height):
     # Bounding boxes
@@ -0,0 +1,200 @@
+import os
+import secrets
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+
+class WorkerUnavailable(ConnectionError):
+    """The inference worker is not running or not reachable"""
+
+
+def load_authkey(env_var, path, create=False):
+    """IPC shared secret: the env_var value, else the contents of path.
+
+    Messages are unpickled, so the key is what keeps other local processes from
+    running code in the worker; there is deliberately no built-in default. With
+    create (the worker) a random key is written to path (mode 0600) on first start,
+    for the web processes to read. Raises RuntimeError when no key is available.
+    """
+    value = os.environ.get(env_var, "").strip()
+    if value:
+        return value.encode()
+    try:
+        with open(path, "rb") as f:
+            key = f.read().strip()
+        if key:
+            return key
+    except FileNotFoundError:
+        pass
+    if not create:
+        raise RuntimeError(f"No IPC authkey: set {env_var} or start worker.py first to create {path}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    key = secrets.token_hex(32).encode()
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        # Another worker got there first
+        return load_authkey(env_var, path)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+    print(f"✓ Generated IPC authkey in {path}")
+    return key
+
+
+class InferenceServer:
+    """Serves SaleService methods to the web processes over a local socket/pipe.
+
+    Every request arrives on its own short-lived connection and is handled on its
+    own thread, so a slow call (e.g. closing a sale) never blocks /metrics or
+    /ready. Messages are pickled; the authkey handshake keeps other local
+    processes out. A "subscribe" request turns its connection into a one-way push
+    stream of analytics events until the client disconnects.
+    """
+
+    def __init__(self, service, address, authkey):
+        if not authkey:
+            raise ValueError("InferenceServer requires an authkey")
+        self.service = service
+        self.listener = Listener(address, authkey=authkey)
+        self._closed = threading.Event()
+
+    def serve_forever(self):
+        print(f"✓ Inference worker listening on {self.listener.address}")
+        while not self._closed.is_set():
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                if self._closed.is_set():
+                    break
+                continue
+            except Exception as e:
+                # Failed handshake (wrong authkey, client went away)
+                print(f"✗ Rejected IPC connection: {e}")
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self._closed.set()
+        self.listener.close()
+
+    def _handle(self, conn):
+        try:
+            method, kwargs = conn.recv()
+            if method == "subscribe":
+                self._stream(conn)
+                return
+            if method not in self.service.RPC_METHODS:
+                raise ValueError(f"Unknown method: {method}")
+            result = getattr(self.service, method)(**kwargs)
+            conn.send(("ok", result))
+        except (EOFError, OSError):
+            pass
+        except Exception as e:
+            try:
+                conn.send(("error", e))
+            except Exception:
+                # Exception type not picklable: keep the message
+                conn.send(("error", RuntimeError(str(e))))
+        finally:
+            conn.close()
+
+    def _stream(self, conn):
+        try:
+            subscription = self.service.subscribe()
+        except Exception as e:
+            conn.send(("error", e))
+            return
+        conn.send(("ok", None))
+        try:
+            while not self._closed.is_set():
+                event = subscription.get(timeout=1.0)
+                if event is None:
+                    # Nothing to send; notice a vanished client instead of holding the slot
+                    if conn.poll():
+                        conn.recv()
+                    continue
+                conn.send((event, subscription.dropped))
+        except (EOFError, OSError):
+            pass
+        finally:
+            subscription.close()
+
+
+class RemoteSubscription:
+    """Client side of a "subscribe" stream; same get/dropped/close as Subscription"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.dropped = 0
+
+    def get(self, timeout=None):
+        try:
+            if not self.conn.poll(timeout):
+                return None
+            event, self.dropped = self.conn.recv()
+        except (EOFError, OSError):
+            raise WorkerUnavailable("Inference worker closed the event stream")
+        return event
+
+    def close(self):
+        self.conn.close()
+
+
+class InferenceClient:
+    """Proxy used by the web processes; exposes the SaleService methods remotely.
+
+    Connections are opened per call, so the client is safe to share between
+    request threads and survives worker restarts without any reconnect logic.
+    method_timeouts overrides timeout for calls that legitimately take longer.
+    """
+
+    def __init__(self, address, authkey, timeout=30.0, method_timeouts=None):
+        if not authkey:
+            raise ValueError("InferenceClient requires an authkey")
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.method_timeouts = dict(method_timeouts or {})
+
+    def _connect(self):
+        try:
+            return Client(self.address, authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise WorkerUnavailable(f"Inference worker unavailable at {self.address}: {e}")
+
+    def _request(self, conn, method, kwargs):
+        timeout = self.method_timeouts.get(method, self.timeout)
+        try:
+            conn.send((method, kwargs))
+            answered = conn.poll(timeout)
+            if answered:
+                status, payload = conn.recv()
+        except (OSError, EOFError) as e:
+            raise WorkerUnavailable(f"Inference worker connection lost: {e}")
+        if not answered:
+            raise WorkerUnavailable(f"Inference worker did not answer {method} in {timeout}s")
+        if status == "error":
+            raise payload
+        return payload
+
+    def call(self, method, **kwargs):
+        conn = self._connect()
+        try:
+            return self._request(conn, method, kwargs)
+        finally:
+            conn.close()
+
+    def subscribe(self):
+        conn = self._connect()
+        try:
+            self._request(conn, "subscribe", {})
+        except Exception:
+            conn.close()
+            raise
+        return RemoteSubscription(conn)
+
+    def __getattr__(self, method):
+        if method.startswith("_"):
+            raise AttributeError(method)
+        return lambda **kwargs: self.call(method, **kwargs)
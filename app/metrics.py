@@ -0,0 +1,169 @@
+import threading
+import time
+from bisect import bisect_left
+
+# Latency buckets in seconds, tuned for per-frame work (decode / YOLO / analytics)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Counter:
+    """Monotonic counter, optionally split by one label.
+
+    Increments are plain attribute/dict updates so the hot path never takes a lock;
+    the prediction loop is the only writer, scrapes only read.
+    """
+
+    def __init__(self, name, help_text, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.value = 0
+        self.values = {}  # label value: count (only used when label is set)
+
+    def inc(self, amount=1, label_value=None):
+        if self.label is None:
+            self.value += amount
+        else:
+            self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        if self.label is None:
+            lines.append(f"{self.name} {self.value}")
+        else:
+            for label_value, count in sorted(self.values.items()):
+                lines.append(f'{self.name}{{{self.label}="{label_value}"}} {count}')
+        return lines
+
+
+class Gauge:
+    """Point-in-time value (fps, queue depth, up/down state)"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} gauge",
+            f"{self.name} {self.value}"
+        ]
+
+
+class Histogram:
+    """Fixed-bucket histogram: observe() is a bisect plus two additions"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {cumulative}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class RateMeter:
+    """Frames-per-second gauge recomputed at most once per window"""
+
+    def __init__(self, gauge, window=1.0):
+        self.gauge = gauge
+        self.window = window
+        self._count = 0
+        self._window_start = time.monotonic()
+
+    def tick(self):
+        self._count += 1
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.gauge.set(round(self._count / elapsed, 2))
+            self._count = 0
+            self._window_start = now
+
+
+class PipelineMetrics:
+    """All hot-path metrics for one Prediction pipeline"""
+
+    def __init__(self, prefix="erke"):
+        self.frames_captured = Counter(f"{prefix}_frames_captured_total", "Frames decoded from the video source")
+        self.frames_skipped = Counter(f"{prefix}_frames_skipped_total", "Frames skipped by the target fps decimation")
+        self.frames_dropped = Counter(f"{prefix}_frames_dropped_total", "Frames dropped because every shared frame slot was in use")
+        self.frames_processed = Counter(f"{prefix}_frames_processed_total", "Frames run through inference and analytics")
+        self.frames_propagated = Counter(f"{prefix}_frames_propagated_total", "Processed frames whose boxes were propagated instead of detected")
+        self.frame_errors = Counter(f"{prefix}_frame_errors_total", "Frames that raised while processing")
+        self.reconnects = Counter(f"{prefix}_reconnects_total", "Video source (re)connection attempts")
+        self.events = Counter(f"{prefix}_analytics_events_total", "Analytics events emitted", label="type")
+        self.reid_links = Counter(f"{prefix}_reid_links_total", "New track ids re-associated with a known person by appearance")
+        self.source_downtime = Counter(f"{prefix}_source_downtime_seconds_total", "Seconds the video source was unavailable")
+        self.source_up = Gauge(f"{prefix}_source_up", "1 while frames are being received from the video source")
+        self.capture_fps = Gauge(f"{prefix}_capture_fps", "Measured decode rate of the video source")
+        self.pipeline_queue_depth = Gauge(f"{prefix}_pipeline_queue_depth", "Inferred frames waiting for analytics/render (pipelined mode)")
+        self.recording_queue_depth = Gauge(f"{prefix}_recording_queue_depth", "Frames waiting for the encoder process (shared-memory transport)")
+        self.recording_enabled = Gauge(f"{prefix}_recording_enabled", "1 while a sale is being recorded")
+        self.record_dir_bytes = Gauge(f"{prefix}_record_dir_bytes", "Bytes used by clips in the recording output directory")
+        self.retention_deleted = Counter(f"{prefix}_retention_deleted_files_total", "Clips deleted by the retention policy", label="reason")
+        self.inference_latency = Histogram(f"{prefix}_inference_latency_seconds", "Time spent in predict_frame")
+        self.analytics_latency = Histogram(f"{prefix}_analytics_latency_seconds", "Time spent in analytics_step")
+        self.render_latency = Histogram(f"{prefix}_render_latency_seconds", "Time spent in render_frame")
+        self.recording_latency = Histogram(f"{prefix}_recording_write_seconds", "Time spent writing one frame to the recording")
+        self.capture_rate = RateMeter(self.capture_fps)
+        self._lock = threading.Lock()
+
+    def all_metrics(self):
+        return [value for value in vars(self).values() if isinstance(value, (Counter, Gauge, Histogram))]
+
+    def observe_events(self, events):
+        for event in events:
+            self.events.inc(label_value=event_type(event))
+
+    def render(self):
+        """Prometheus text exposition format; only runs when /metrics is scraped"""
+        lines = []
+        with self._lock:
+            for metric in self.all_metrics():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Event strings produced by RetailAnalytics, mapped to a stable label value
+EVENT_TYPES = (
+    ("SCANNED", "item_scanned"),
+    ("PAYMENT STARTED", "payment_started"),
+    ("PAYMENT COMPLETE", "payment_complete"),
+    ("CASH DETECTED", "cash_detected"),
+    ("CASH INTERACTION ENDED", "cash_interaction_ended"),
+    ("PRIMARY STAFF", "staff_primary"),
+    ("SECONDARY STAFF", "staff_secondary"),
+    ("CUSTOMER:", "customer_reclassified"),
+    ("AT COUNTER", "customer_at_counter"),
+    ("LEFT", "customer_left"),
+)
+
+
+def event_type(event):
+    for marker, name in EVENT_TYPES:
+        if marker in event:
+            return name
+    return "other"
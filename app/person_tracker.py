@@ -0,0 +1,384 @@
+import json
+import os
+import threading
+import time
+from app.variables import (
+    STAFF_REENTRY_THRESHOLD,
+    STAFF_CUMULATIVE_TIME,
+    REENTRY_WINDOW,
+    STAFF_CONFIDENCE_THRESHOLD,
+    REENTRY_MIN_SESSIONS,
+    STAFF_TIME_MIN_SESSIONS,
+    PERSON_RECORD_TTL
+)
+
+# Fields persisted per person; transient keys (e.g. _session_start) are folded in on save
+SNAPSHOT_FIELDS = (
+    'first_seen', 'last_seen', 'cumulative_time', 'enter_count', 'last_exit', 'reentries',
+    'reentry_times', 'classification', 'staff_source', 'staff_confidence'
+)
+TIME_FIELDS = ('first_seen', 'last_seen', 'last_exit')
+UNTRACKED_PREFIX = 'untracked:'  # keys of detections without a track id (id() of the dict)
+
+
+class PersonBehaviorTracker:
+    """Shift-long per-person behavior state used for staff/customer differentiation.
+
+    Unlike RetailAnalytics (reset after every sale), one tracker lives for the whole
+    shift so cumulative-time and re-entry signals can build up across sales. Memory
+    is bounded by a record cap and a TTL; a compact snapshot (records plus their
+    appearance signatures) is written periodically so a restarted process can
+    re-link returning people to the shift's history and staff classifications.
+    """
+
+    PRUNE_INTERVAL = 60.0  # seconds of stream time between TTL sweeps
+
+    def __init__(self, max_records=2000, record_ttl=PERSON_RECORD_TTL):
+        self.records = {}  # track_id: {first_seen, last_seen, cumulative_time, in_view, enter_count, last_exit, reentries, reentry_times, classification, staff_source, staff_confidence}
+        self.aliases = {}  # new track_id: record key it was re-associated with (see app/appearance.py)
+        self.max_records = max_records
+        self.record_ttl = record_ttl
+        self.generation = 0  # restarts since the shift began; restored keys are 'prev:<generation>:<id>'
+        self._last_prune = 0.0
+        self._last_snapshot = None
+        self._snapshot_thread = None
+
+    def resolve(self, track_id):
+        """Record key for a tracker id, following appearance-based re-association"""
+        return self.aliases.get(track_id, track_id)
+
+    def link(self, track_id, key):
+        """Treat a new tracker id as the same person as an existing record"""
+        self.aliases[track_id] = key
+
+    def _key(self, det):
+        """Record key for a detection; untracked ones get a process-local key that is never persisted"""
+        track_id = det.get('track_id')
+        if track_id is None:
+            return f"{UNTRACKED_PREFIX}{id(det)}"
+        return self.resolve(track_id)
+
+    def update(self, customers, current_time, cashiers=None):
+        """Track per-person on-screen sessions with improved staff/customer differentiation.
+        
+        IMPROVEMENTS:
+        - Confidence-based secondary staff classification (0-1 score)
+        - Better re-entry tracking: only counts recent re-entries within a window
+        - Minimum thresholds: need multiple sessions to qualify as staff
+        - Optimized for single-day operation; shift state survives restarts through
+          compact snapshots (see restore())
+        
+        customers: list of detection dicts with 'track_id' and 'center'
+        cashiers: list of cashier detection dicts with 'track_id' (primary staff indicator)
+        """
+        events = []
+        active_ids = set()
+        cashier_ids = set()
+
+        # FIRST PASS: Mark all detected cashiers as staff (primary indicator)
+        if cashiers is None:
+            cashiers = []
+        
+        for cashier in cashiers:
+            cid = self._key(cashier)
+            cashier_ids.add(cid)
+            active_ids.add(cid)
+
+            rec = self.records.get(cid)
+            if rec is None:
+                # first time seeing this cashier
+                rec = {
+                    'first_seen': current_time,
+                    'last_seen': current_time,
+                    'cumulative_time': 0.0,
+                    'in_view': True,
+                    'enter_count': 1,
+                    'last_exit': None,
+                    'reentries': 0,
+                    'reentry_times': [],
+                    'classification': 'staff',
+                    'staff_source': 'primary',
+                    'staff_confidence': 1.0
+                }
+                rec['_session_start'] = current_time
+                self.records[cid] = rec
+                events.append(f"👷 PRIMARY STAFF: CASHIER DETECTED #{cid}")
+            else:
+                # Already-seen cashier still in view
+                if not rec.get('in_view'):
+                    rec['in_view'] = True
+                    rec['enter_count'] = rec.get('enter_count', 0) + 1
+                    rec['_session_start'] = current_time
+                    rec['staff_confidence'] = 1.0
+                
+                rec['last_seen'] = current_time
+                # Ensure classification is staff (primary staff cannot be downgraded)
+                if rec.get('classification') != 'staff' or rec.get('staff_source') != 'primary':
+                    rec['classification'] = 'staff'
+                    rec['staff_source'] = 'primary'
+                    rec['staff_confidence'] = 1.0
+                    events.append(f"👷 PRIMARY STAFF: CASHIER CONFIRMED #{cid}")
+
+        # SECOND PASS: Track customers & evaluate for secondary staff classification
+        for cust in customers:
+            cid = self._key(cust)
+            active_ids.add(cid)
+
+            # Skip if already marked as primary staff cashier
+            if cid in cashier_ids:
+                continue
+
+            rec = self.records.get(cid)
+            if rec is None:
+                # First time seeing this person as customer
+                rec = {
+                    'first_seen': current_time,
+                    'last_seen': current_time,
+                    'cumulative_time': 0.0,
+                    'in_view': True,
+                    'enter_count': 1,
+                    'last_exit': None,
+                    'reentries': 0,
+                    'reentry_times': [],
+                    'classification': 'customer',
+                    'staff_source': None,
+                    'staff_confidence': 0.0
+                }
+                rec['_session_start'] = current_time
+                self.records[cid] = rec
+            else:
+                if not rec.get('in_view'):
+                    # Person re-entered after being out of view
+                    rec['in_view'] = True
+                    rec['enter_count'] = rec.get('enter_count', 0) + 1
+                    
+                    # Track re-entry time (filter to recent window)
+                    if rec.get('last_exit') is not None:
+                        rec['reentry_times'] = rec.get('reentry_times', [])
+                        rec['reentry_times'].append(current_time)
+                        
+                        # Only keep recent re-entries within REENTRY_WINDOW
+                        rec['reentry_times'] = [t for t in rec['reentry_times'] 
+                                               if current_time - t <= REENTRY_WINDOW]
+                        
+                        # Update re-entry count based on recent window
+                        rec['reentries'] = len(rec['reentry_times'])
+                    
+                    # Start new session
+                    rec['_session_start'] = current_time
+                
+                # Update last seen while in view
+                rec['last_seen'] = current_time
+
+            # SECONDARY STAFF EVALUATION: Use confidence-based approach
+            if rec.get('classification') != 'staff' or rec.get('staff_source') == 'secondary':
+                confidence = self._calculate_staff_confidence(rec, current_time)
+                rec['staff_confidence'] = confidence
+                
+                # Classify based on confidence threshold
+                is_confident_staff = confidence >= STAFF_CONFIDENCE_THRESHOLD
+                is_currently_staff = rec.get('classification') == 'staff'
+                
+                if is_confident_staff and not is_currently_staff:
+                    # Promote to secondary staff
+                    rec['classification'] = 'staff'
+                    rec['staff_source'] = 'secondary'
+                    events.append(f"👷 SECONDARY STAFF: #{cid} (confidence: {confidence:.2f})")
+                
+                elif not is_confident_staff and is_currently_staff and rec.get('staff_source') == 'secondary':
+                    # Demote from secondary staff
+                    rec['classification'] = 'customer'
+                    rec['staff_source'] = None
+                    rec['staff_confidence'] = 0.0
+                    events.append(f"👤 CUSTOMER: #{cid} (confidence: {confidence:.2f})")
+
+        # THIRD PASS: Handle exits
+        for cid, rec in list(self.records.items()):
+            if rec.get('in_view') and cid not in active_ids:
+                # Person left the view
+                rec['in_view'] = False
+                rec['last_exit'] = current_time
+                
+                # Calculate this session's duration
+                start = rec.get('_session_start', rec.get('first_seen', current_time))
+                session_time = rec.get('last_seen', current_time) - start
+                
+                if session_time > 0:
+                    rec['cumulative_time'] = rec.get('cumulative_time', 0.0) + session_time
+                
+                rec.pop('_session_start', None)
+                
+                # Final secondary staff check at exit
+                if rec.get('classification') != 'staff' or rec.get('staff_source') == 'secondary':
+                    confidence = self._calculate_staff_confidence(rec, current_time)
+                    rec['staff_confidence'] = confidence
+                    
+                    if confidence >= STAFF_CONFIDENCE_THRESHOLD and rec.get('classification') != 'staff':
+                        rec['classification'] = 'staff'
+                        rec['staff_source'] = 'secondary'
+                        events.append(f"👷 SECONDARY STAFF: #{cid} confirmed on exit (confidence: {confidence:.2f})")
+
+        # Memory management: drop people not seen for a whole shift, then cap the count
+        if current_time - self._last_prune >= self.PRUNE_INTERVAL:
+            self._last_prune = current_time
+            for k in [k for k, r in self.records.items()
+                      if not r.get('in_view') and current_time - r.get('last_seen', current_time) > self.record_ttl]:
+                del self.records[k]
+            for alias in [a for a, k in self.aliases.items() if k not in self.records]:
+                del self.aliases[alias]
+        if len(self.records) > self.max_records:
+            sorted_items = sorted(self.records.items(), key=lambda kv: kv[1].get('last_seen', 0))
+            for k, _ in sorted_items[: len(self.records) - self.max_records]:
+                del self.records[k]
+
+        return events
+
+    def _calculate_staff_confidence(self, person_rec, current_time):
+        """
+        Calculate confidence score (0-1) that a person is staff based on behavioral patterns.
+        Single-day focused: recent re-entries and cumulative time within current session.
+        
+        Factors:
+        - Recent re-entries (multiple quick returns suggest staff restocking/breaks)
+        - Cumulative time across multiple sessions (staff often spend longer)
+        """
+        confidence = 0.0
+        
+        enter_count = person_rec.get('enter_count', 0)
+        reentries = person_rec.get('reentries', 0)
+        cumulative_time = person_rec.get('cumulative_time', 0.0)
+        reentry_times = person_rec.get('reentry_times', [])
+        
+        # Factor 1: Recent re-entry pattern (4+ entries within 10-min window = strong staff indicator)
+        recent_reentries = len([t for t in reentry_times if t])
+        if recent_reentries >= STAFF_REENTRY_THRESHOLD and enter_count >= REENTRY_MIN_SESSIONS:
+            # Scale: 4 reentries = 0.5 confidence, 6+ = higher
+            reentry_score = min(0.8, (recent_reentries / STAFF_REENTRY_THRESHOLD) * 0.6)
+            confidence += reentry_score
+        
+        # Factor 2: Cumulative time (15+ minutes across 3+ sessions = moderate staff indicator)
+        if enter_count >= STAFF_TIME_MIN_SESSIONS and cumulative_time >= STAFF_CUMULATIVE_TIME:
+            # Scale: at threshold = 0.4, double threshold = 0.7
+            time_score = min(0.8, (cumulative_time / (STAFF_CUMULATIVE_TIME * 2.0)) * 0.8)
+            confidence += time_score
+        
+        # Cap at 1.0
+        return min(1.0, confidence)
+
+    def get_person_label(self, track_id):
+        """Get display label for person: shows classification, source, and confidence for secondary staff"""
+        rec = self.records.get(self.resolve(track_id))
+        if not rec:
+            return 'unknown'
+        
+        classification = rec.get('classification', 'unknown')
+        source = rec.get('staff_source')
+        confidence = rec.get('staff_confidence', 0.0)
+        
+        if classification == 'staff':
+            if source == 'primary':
+                return f"{classification}-{source}"
+            else:
+                # Secondary staff: show confidence score (0-1)
+                return f"{classification}-2nd({confidence:.2f})"
+        return classification
+
+    def compact_snapshot(self, current_time, index=None):
+        """Small, JSON-serializable copy of the state with times relative to current_time.
+
+        With an AppearanceIndex, each person's signature is saved too (if still
+        within the index's max_age), so link_reentries can match them after a restart.
+        """
+        people = {}
+        for cid, rec in self.records.items():
+            if str(cid).startswith(UNTRACKED_PREFIX):
+                continue
+            entry = {k: rec.get(k) for k in SNAPSHOT_FIELDS}
+            cumulative = rec.get('cumulative_time', 0.0)
+            if rec.get('in_view') and '_session_start' in rec:
+                # Close the open session so its time isn't lost on restart
+                cumulative += max(0.0, rec.get('last_seen', current_time) - rec['_session_start'])
+                entry['last_exit'] = rec.get('last_seen')
+            entry['cumulative_time'] = round(cumulative, 2)
+            for field in TIME_FIELDS:
+                if entry[field] is not None:
+                    entry[field] = round(entry[field] - current_time, 2)
+            entry['reentry_times'] = [round(t - current_time, 2) for t in rec.get('reentry_times', [])]
+            entry['staff_confidence'] = round(entry['staff_confidence'] or 0.0, 3)
+            slot = index.slots.get(cid) if index is not None else None
+            if slot is not None and current_time - index.times[slot] <= index.max_age:
+                entry['signature'] = [round(float(v), 4) for v in index.vectors[slot]]
+                entry['signature_time'] = round(index.times[slot] - current_time, 2)
+            people[str(cid)] = entry
+        return {'saved_at': time.time(), 'generation': self.generation, 'people': people}
+
+    def maybe_snapshot(self, path, current_time, interval, index=None):
+        """Write a snapshot at most every interval seconds; serialization and disk I/O
+        happen on a short-lived background thread"""
+        if self._last_snapshot is not None and current_time - self._last_snapshot < interval:
+            return
+        if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+            return
+        self._last_snapshot = current_time
+        snapshot = self.compact_snapshot(current_time, index)
+        self._snapshot_thread = threading.Thread(target=write_snapshot, args=(path, snapshot), daemon=True)
+        self._snapshot_thread.start()
+
+    def restore(self, path, current_time, max_age, index=None):
+        """Warm start from a snapshot written less than max_age seconds ago.
+
+        Tracker ids restart after a process restart, so restored people are kept
+        under 'prev:<generation>:<id>' keys (records restored by an earlier restart
+        keep theirs) and never collide with the new tracker's ids. Their saved
+        signatures go into index, so link_reentries aliases a returning person's new
+        track id to the restored record. Returns the number restored.
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except Exception as e:
+            print(f"✗ Error reading person snapshot: {e}")
+            return 0
+
+        gap = time.time() - snapshot.get('saved_at', 0)
+        if gap > max_age:
+            return 0
+
+        generation = snapshot.get('generation', 0)
+        self.generation = generation + 1
+        restored = 0
+        for cid, entry in snapshot.get('people', {}).items():
+            # Snapshot times are relative to save time; shift by the restart gap
+            shift = current_time - gap
+            rec = dict(entry)
+            for field in TIME_FIELDS:
+                if rec.get(field) is not None:
+                    rec[field] += shift
+            rec['reentry_times'] = [t + shift for t in rec.get('reentry_times', [])]
+            signature = rec.pop('signature', None)
+            signature_time = rec.pop('signature_time', None)
+            rec['in_view'] = False
+            if rec.get('last_exit') is None:
+                rec['last_exit'] = rec.get('last_seen')
+            key = cid if cid.startswith('prev:') else f"prev:{generation}:{cid}"
+            self.records[key] = rec
+            if index is not None and signature is not None and signature_time is not None:
+                index.add(key, signature, signature_time + shift)
+            restored += 1
+        print(f"✓ Restored {restored} person record(s) from {path} ({gap:.0f}s old)")
+        return restored
+
+
+def write_snapshot(path, snapshot):
+    """Atomic write so a crash mid-save never leaves a truncated snapshot"""
+    try:
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"✗ Error writing person snapshot: {e}")
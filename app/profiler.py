@@ -0,0 +1,256 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+from collections import Counter as StackCounter
+
+PROFILE_MODES = ("stages", "cprofile", "sampling")
+
+
+class StageTimer:
+    """Accumulates count / total / max for one pipeline stage"""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {
+            "count": self.count,
+            "total_s": round(self.total, 4),
+            "mean_ms": round(mean * 1000, 3),
+            "max_ms": round(self.max * 1000, 3)
+        }
+
+
+class _ProfileSnapshot:
+    """Lets pstats read a cProfile.Profile without disabling it: only the thread
+    that enabled a profile can switch it off"""
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def create_stats(self):
+        self.profile.snapshot_stats()
+        self.stats = self.profile.stats
+
+
+class LoopProfiler:
+    """Time-bounded profiling session for the prediction loop.
+
+    The control API only arms a session (start()). The prediction thread calls
+    tick() once per frame and every other pipeline thread (post-processing) calls
+    attach(); each joins the session from inside itself, enabling its own cProfile
+    (cProfile only sees the thread that enabled it) and registering for the stack
+    sampler, and lets go of its profile on its first call after the session ends.
+    record() may be called from any of these threads. A timer ends the session at
+    its deadline even when no frames arrive (source down), so status() never
+    reports a stale session and the report is still written. When no session is
+    active, tick(), attach() and record() are a couple of attribute checks.
+    """
+
+    def __init__(self, output_dir="profiles", sample_interval=0.005):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.active = False
+        self.mode = None
+        self.last_report = None
+        self._lock = threading.Lock()
+        self._stage_lock = threading.Lock()  # record() runs on several threads
+        self._local = threading.local()      # per thread: session it joined, its cProfile
+        self._session = 0
+        self._deadline = 0.0
+        self._started_at = 0.0
+        self._stages = {}
+        self._frames = 0
+        self._cprofiles = []
+        self._threads = {}  # thread ident: name
+        self._sampler = None
+        self._timer = None
+        self._samples = StackCounter()
+        self._sample_count = 0
+
+    def start(self, duration=30.0, mode="stages"):
+        """Arm a session; returns False if one is already running"""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {PROFILE_MODES}")
+        with self._lock:
+            if self.active:
+                return False
+            self.mode = mode
+            self._session += 1
+            self._stages = {}
+            self._frames = 0
+            self._samples = StackCounter()
+            self._sample_count = 0
+            self._cprofiles = []
+            self._threads = {}
+            self._sampler = None
+            self._started_at = time.time()
+            self._deadline = time.monotonic() + float(duration)
+            self.active = True
+            self._timer = threading.Timer(float(duration), self._expire, args=(self._session,))
+            self._timer.daemon = True
+            self._timer.start()
+        print(f"✓ Profiling session started ({mode}, {duration}s)")
+        return True
+
+    def status(self):
+        if self.active and time.monotonic() >= self._deadline:
+            self.finish()
+        with self._lock:
+            return {
+                "active": self.active,
+                "mode": self.mode,
+                "remaining_s": round(max(0.0, self._deadline - time.monotonic()), 1) if self.active else 0.0,
+                "last_report": self.last_report
+            }
+
+    def record(self, stage, seconds):
+        if not self.active:
+            return
+        with self._stage_lock:
+            timer = self._stages.get(stage)
+            if timer is None:
+                timer = self._stages[stage] = StageTimer()
+            timer.add(seconds)
+
+    def tick(self):
+        """Called by the prediction thread once per captured frame"""
+        if not self.active and getattr(self._local, "session", None) is None:
+            return
+        self._sync_thread()
+        if not self.active:
+            return
+        self._frames += 1
+        if time.monotonic() >= self._deadline:
+            self.finish()
+
+    def attach(self):
+        """Called once per frame by the other pipeline threads to be profiled too"""
+        if self.active or getattr(self._local, "session", None) is not None:
+            self._sync_thread()
+
+    def _expire(self, session):
+        """Timer callback: end the session at its deadline without waiting for a frame"""
+        if self.active and self._session == session:
+            self.finish()
+
+    def finish(self):
+        """Stop the session and write the report"""
+        with self._lock:
+            if not self.active:
+                return None
+            self.active = False
+            if self._timer is not None:
+                self._timer.cancel()
+        self._sync_thread()
+        if self._sampler is not None:
+            self._sampler.join(timeout=1.0)
+        try:
+            self.last_report = self._write_report()
+            print(f"✓ Profiling report written: {self.last_report}")
+        except Exception as e:
+            print(f"✗ Error writing profiling report: {e}")
+        return self.last_report
+
+    def _sync_thread(self):
+        """Join the current session from the calling thread, or let go of the
+        profile it enabled for an earlier one"""
+        local = self._local
+        session = self._session if self.active else None
+        if getattr(local, "session", None) == session:
+            return
+        cprofile = getattr(local, "cprofile", None)
+        if cprofile is not None:
+            cprofile.disable()
+            local.cprofile = None
+        local.session = None
+        if session is None:
+            return
+        with self._lock:
+            if not self.active or self._session != session:
+                return
+            local.session = session
+            self._threads[threading.get_ident()] = threading.current_thread().name
+            if self.mode == "cprofile":
+                cprofile = cProfile.Profile()
+                try:
+                    cprofile.enable()
+                except ValueError:
+                    # Python 3.12+: one enabled profile already sees every thread
+                    return
+                local.cprofile = cprofile
+                self._cprofiles.append(cprofile)
+            elif self.mode == "sampling" and self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+                self._sampler.start()
+
+    def _sample_loop(self):
+        """Statistical sampler: snapshot the stacks of the pipeline threads at a fixed interval"""
+        while self.active:
+            frames = sys._current_frames()
+            for ident, name in list(self._threads.items()):
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = traceback.extract_stack(frame)
+                key = (f"[{name}]",) + tuple(f"{f.name} ({os.path.basename(f.filename)}:{f.lineno})" for f in stack)
+                self._samples[key] += 1
+                self._sample_count += 1
+            time.sleep(self.sample_interval)
+
+    def _write_report(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile_{int(self._started_at * 1000)}_{self.mode}.txt")
+        elapsed = max(1e-9, time.time() - self._started_at)
+
+        lines = [
+            f"Prediction loop profile ({self.mode})",
+            f"Started: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self._started_at))}",
+            f"Duration: {elapsed:.1f}s, frames: {self._frames} ({self._frames / elapsed:.1f} fps)",
+            "",
+            "Per-stage timings:"
+        ]
+        with self._stage_lock:
+            stages = sorted(((name, timer.as_dict()) for name, timer in self._stages.items()),
+                            key=lambda kv: kv[1]["total_s"], reverse=True)
+        for stage, stats in stages:
+            share = 100.0 * stats["total_s"] / elapsed
+            lines.append(
+                f"  {stage:<12} count={stats['count']:<7} mean={stats['mean_ms']:>8.3f}ms "
+                f"max={stats['max_ms']:>8.3f}ms total={stats['total_s']:>8.3f}s ({share:.1f}% of wall)"
+            )
+
+        if self._cprofiles:
+            # One profile per pipeline thread, merged
+            buf = io.StringIO()
+            try:
+                stats = pstats.Stats(*(_ProfileSnapshot(p) for p in self._cprofiles), stream=buf)
+                stats.sort_stats("cumulative").print_stats(40)
+            except TypeError:
+                buf.write("  (no calls recorded)\n")
+            lines.extend(["", f"cProfile ({len(self._cprofiles)} thread(s), top 40 by cumulative time):", buf.getvalue()])
+
+        if self._sample_count:
+            lines.extend(["", f"Sampled stacks ({self._sample_count} samples, top 20):"])
+            for stack, count in self._samples.most_common(20):
+                lines.append(f"  {100.0 * count / self._sample_count:5.1f}%  {stack[0]} " + " > ".join(stack[1:][-6:]))
+
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return path
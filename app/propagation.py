@@ -0,0 +1,165 @@
+import numpy as np
+import cv2
+from app.helper_functions import get_center
+
+PROPAGATION_MODES = ("velocity", "flow")
+
+
+class BoxPropagator:
+    """Carries tracked boxes across the frames between detector keyframes.
+
+    On a keyframe, update() stores the detector output. On intermediate frames,
+    propagate() shifts every tracked box by either:
+    - "velocity": a constant-velocity model per track id, smoothed across keyframes;
+    - "flow": the median sparse Lucas-Kanade optical flow of a small grid of points
+      inside each box (one batched calcOpticalFlowPyrLK call per frame, on a
+      downscaled grayscale image), falling back to velocity if flow is lost.
+
+    Boxes without a track id (e.g. the counter) are carried over unchanged.
+    Propagated detections have the same shape as predict_frame output plus
+    'propagated': True, so analytics and rendering work on them unchanged.
+    """
+
+    GRID = 4  # GRID x GRID flow points per box
+
+    def __init__(self, mode="velocity", flow_scale=0.5, velocity_smoothing=0.5):
+        if mode not in PROPAGATION_MODES:
+            raise ValueError(f"propagation mode must be one of {PROPAGATION_MODES}")
+        self.mode = mode
+        self.flow_scale = flow_scale
+        self.velocity_smoothing = velocity_smoothing
+        self.detections = None
+        self.velocities = {}  # (class, track_id): (vx, vy) in px/s
+        self.last_time = None
+        self.prev_gray = None
+        # Last keyframe centers/time: velocities are measured keyframe to keyframe
+        self._key_centers = {}
+        self._key_time = None
+        self._lk_params = dict(
+            winSize=(15, 15),
+            maxLevel=2,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03)
+        )
+
+    def reset(self):
+        self.detections = None
+        self.velocities = {}
+        self.last_time = None
+        self.prev_gray = None
+        self._key_centers = {}
+        self._key_time = None
+
+    def _gray(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.flow_scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.flow_scale, fy=self.flow_scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def update(self, frame, detections, current_time):
+        """Adopt fresh detector output (keyframe) and refresh per-track velocities"""
+        centers = {
+            (cls_name, det['track_id']): det['center']
+            for cls_name, dets in detections.items()
+            for det in dets if det.get('track_id') is not None
+        }
+        if self._key_time is not None:
+            dt = current_time - self._key_time
+            if dt > 0:
+                previous = self._key_centers
+                velocities = {}
+                a = self.velocity_smoothing
+                for cls_name, dets in detections.items():
+                    for det in dets:
+                        key = (cls_name, det.get('track_id'))
+                        if key[1] is None or key not in previous:
+                            continue
+                        px, py = previous[key]
+                        cx, cy = det['center']
+                        vx, vy = (float(cx) - float(px)) / dt, (float(cy) - float(py)) / dt
+                        ox, oy = self.velocities.get(key, (vx, vy))
+                        velocities[key] = (a * vx + (1 - a) * ox, a * vy + (1 - a) * oy)
+                self.velocities = velocities
+
+        self._key_centers = centers
+        self._key_time = current_time
+        self.detections = detections
+        self.last_time = current_time
+        if self.mode == "flow":
+            self.prev_gray = self._gray(frame)
+
+    def propagate(self, frame, current_time):
+        """Detections for an intermediate frame, derived from the last known boxes"""
+        if self.detections is None:
+            return None
+        dt = current_time - self.last_time if self.last_time is not None else 0.0
+
+        shifts = {}
+        gray = None
+        if self.mode == "flow" and self.prev_gray is not None:
+            gray = self._gray(frame)
+            shifts = self._flow_shifts(gray)
+
+        propagated = {}
+        for cls_name, dets in self.detections.items():
+            out = []
+            for det in dets:
+                key = (cls_name, det.get('track_id'))
+                if key[1] is None:
+                    out.append(det)
+                    continue
+                if key in shifts:
+                    dx, dy = shifts[key]
+                else:
+                    vx, vy = self.velocities.get(key, (0.0, 0.0))
+                    dx, dy = vx * dt, vy * dt
+                box = det['box'] + np.array([dx, dy, dx, dy], dtype=det['box'].dtype)
+                out.append({
+                    'box': box,
+                    'conf': det['conf'],
+                    'track_id': det['track_id'],
+                    'center': get_center(box),
+                    'propagated': True
+                })
+            propagated[cls_name] = out
+
+        # Chain: the next intermediate frame propagates from these boxes
+        self.detections = propagated
+        self.last_time = current_time
+        if gray is not None:
+            self.prev_gray = gray
+        return propagated
+
+    def _flow_shifts(self, gray):
+        """Median flow (full-resolution px) per tracked box, from one batched LK call"""
+        keys, points = [], []
+        s = self.flow_scale
+        steps = (np.arange(self.GRID, dtype=np.float32) + 0.5) / self.GRID
+        for cls_name, dets in self.detections.items():
+            for det in dets:
+                if det.get('track_id') is None:
+                    continue
+                x1, y1, x2, y2 = (float(v) * s for v in det['box'][:4])
+                xs = x1 + (x2 - x1) * steps
+                ys = y1 + (y2 - y1) * steps
+                grid = np.stack(np.meshgrid(xs, ys), axis=-1).reshape(-1, 2)
+                keys.append((cls_name, det['track_id']))
+                points.append(grid)
+        if not points:
+            return {}
+
+        p0 = np.concatenate(points).astype(np.float32).reshape(-1, 1, 2)
+        p1, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, p0, None, **self._lk_params)
+        if p1 is None:
+            return {}
+        flow = (p1 - p0).reshape(-1, 2) / s
+        ok = status.reshape(-1).astype(bool)
+
+        shifts = {}
+        n = self.GRID * self.GRID
+        for i, key in enumerate(keys):
+            sel = ok[i * n:(i + 1) * n]
+            # Require a few agreeing points; otherwise fall back to the velocity model
+            if sel.sum() >= 3:
+                dx, dy = np.median(flow[i * n:(i + 1) * n][sel], axis=0)
+                shifts[key] = (float(dx), float(dy))
+        return shifts
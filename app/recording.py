@@ -0,0 +1,377 @@
+import glob
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import cv2
+import numpy as np
+from app.video_source import read_stream_metadata, camera_key
+from app.variables import RECORDING_PROFILES, RECORDING_PROFILE, CAMERA_RECORDING_PROFILES, RECORD_SEGMENT_SECONDS
+
+
+def recording_profile(camera):
+    """Recording profile for a camera: its CAMERA_RECORDING_PROFILES entry or the default"""
+    cameras = {camera_key(path): name for path, name in CAMERA_RECORDING_PROFILES.items()}
+    name = cameras.get(camera_key(camera), RECORDING_PROFILE)
+    if name not in RECORDING_PROFILES:
+        print(f"✗ Unknown recording profile '{name}', using '{RECORDING_PROFILE}'")
+        name = RECORDING_PROFILE
+    profile = {"width": None, "fps": None, "codec": "mp4v", "quality": None}
+    profile.update(RECORDING_PROFILES[name])
+    profile["name"] = name
+    return profile
+
+
+def output_size(profile, width, height):
+    """(width, height) of the clip: the source size, or scaled down to the profile width
+    (even dimensions, as most encoders require)"""
+    target = profile.get("width")
+    if not target or target >= width:
+        return (width, height)
+    target = int(target) // 2 * 2
+    return (target, max(2, int(round(height * target / width / 2)) * 2))
+
+
+def record_interval(profile, fps):
+    """Write every Nth of the frames arriving at fps to get close to the profile fps
+    (1 = all of them)"""
+    target = profile.get("fps")
+    if not target or target >= fps:
+        return 1
+    return max(1, int(round(fps / target)))
+
+
+def open_video_writer(path, codec, fps, size, quality=None, segment_seconds=0):
+    """cv2.VideoWriter that downscales to size when given larger frames; None if it
+    failed to open. With segment_seconds > 0 the clip is written as segments."""
+    if segment_seconds > 0:
+        writer = SegmentedVideoWriter(path, codec, fps, size, quality, segment_seconds)
+        return writer if writer.isOpened() else None
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*codec), fps, size)
+    if not writer.isOpened():
+        return None
+    if quality is not None:
+        # Ignored by backends/codecs without a quality knob
+        writer.set(cv2.VIDEOWRITER_PROP_QUALITY, float(quality))
+    return ScaledVideoWriter(writer, size)
+
+
+class ScaledVideoWriter:
+    """VideoWriter wrapper that resizes frames into one reused buffer before encoding.
+
+    Frames already at the output size are written as is. Integer downscales use
+    INTER_AREA, which OpenCV runs as a fast block average; other ratios use
+    INTER_LINEAR, which is cheaper than INTER_AREA's general path.
+    """
+
+    def __init__(self, writer, size):
+        self.writer = writer
+        self.size = tuple(size)
+        self._buffer = np.empty((self.size[1], self.size[0], 3), dtype=np.uint8)
+        self._interpolation = {}  # source (w, h) -> cv2 interpolation flag
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame):
+        height, width = frame.shape[:2]
+        if (width, height) != self.size:
+            interpolation = self._interpolation.get((width, height))
+            if interpolation is None:
+                integer = width % self.size[0] == 0 and height % self.size[1] == 0
+                interpolation = cv2.INTER_AREA if integer else cv2.INTER_LINEAR
+                self._interpolation[(width, height)] = interpolation
+            frame = cv2.resize(frame, self.size, dst=self._buffer, interpolation=interpolation)
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+def segment_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}.seg{index:04d}{ext}"
+
+
+def clip_files(path):
+    """Files holding a recording: its segments in order, or the single file"""
+    root, ext = os.path.splitext(path)
+    segments = sorted(glob.glob(f"{glob.escape(root)}.seg[0-9][0-9][0-9][0-9]{glob.escape(ext)}"))
+    if segments:
+        return segments
+    return [path] if os.path.exists(path) else []
+
+
+def discard_clip(path):
+    """Delete a recording and all of its segments"""
+    for file in clip_files(path) + [path]:
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+
+def save_clip(path, output_path):
+    """Move a recording to output_path; returns True on success.
+
+    Only renames (moves across drives), so saving never waits for video work: a
+    single file or segment becomes output_path, several segments become
+    output_path's segments. join_clip() (or a ClipJoiner) turns those into one file.
+    """
+    files = clip_files(path)
+    if not files:
+        return False
+    if len(files) == 1:
+        shutil.move(files[0], output_path)
+    else:
+        for index, file in enumerate(files):
+            shutil.move(file, segment_path(output_path, index))
+    discard_clip(path)
+    return True
+
+
+def join_clip(path, codec="mp4v", quality=None):
+    """Join the segments of a saved clip into path; returns True on success.
+
+    Uses ffmpeg's concat demuxer when ffmpeg is installed (stream copy, no
+    re-encoding), otherwise re-encodes through OpenCV with the recording's codec
+    and quality. The joined file replaces the segments atomically; if joining
+    fails they are left as they are (each one is playable).
+    """
+    files = clip_files(path)
+    if len(files) < 2 or files == [path]:
+        return True
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.joining{ext}"
+    if not (_concat_ffmpeg(files, tmp_path) or _concat_opencv(files, tmp_path, codec, quality)):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    for file in files:
+        os.remove(file)
+    return True
+
+
+class ClipJoiner:
+    """Background thread that joins saved segmented clips (join_clip), so closing a
+    sale only renames files. pending() lists the clips not joined yet, which the
+    retention sweep must leave alone."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, path, codec="mp4v", quality=None):
+        with self._lock:
+            self._pending.add(path)
+        self.queue.put((path, codec, quality))
+
+    def pending(self):
+        with self._lock:
+            return tuple(self._pending)
+
+    def _run(self):
+        while True:
+            path, codec, quality = self.queue.get()
+            try:
+                if join_clip(path, codec, quality):
+                    print(f"✓ Recording segments joined: {path}")
+                else:
+                    print(f"✗ Could not join recording segments, kept as segments: {path}")
+            except Exception as e:
+                print(f"✗ Error joining recording segments: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+
+
+def _concat_ffmpeg(files, output_path):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        return False
+    fd, list_path = tempfile.mkstemp(suffix=".txt", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for file in files:
+                escaped = os.path.abspath(file).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        result = subprocess.run(
+            [ffmpeg, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+             "-c", "copy", output_path],
+            capture_output=True, timeout=120
+        )
+        if result.returncode != 0:
+            print(f"✗ ffmpeg concat failed: {result.stderr.decode(errors='replace').strip()}")
+            return False
+        return True
+    except Exception as e:
+        print(f"✗ ffmpeg concat failed: {e}")
+        return False
+    finally:
+        os.remove(list_path)
+
+
+def _concat_opencv(files, output_path, codec="mp4v", quality=None):
+    out = None
+    try:
+        for file in files:
+            cap = cv2.VideoCapture(file)
+            if out is None:
+                size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+                out = open_video_writer(output_path, codec, cap.get(cv2.CAP_PROP_FPS), size, quality)
+                if out is None:
+                    cap.release()
+                    return False
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                out.write(frame)
+            cap.release()
+        return True
+    except Exception as e:
+        print(f"✗ Error joining recording segments: {e}")
+        return False
+    finally:
+        if out is not None:
+            out.release()
+
+
+class SegmentedVideoWriter:
+    """Writes a clip as short, individually finalized segments (path.seg0000.mp4, ...).
+
+    Each segment is closed once it holds segment_seconds of video, so a crash or
+    power cut mid-sale loses at most the open segment; everything before it is a
+    playable file. join_clip() joins the segments once the clip is kept.
+    """
+
+    def __init__(self, path, codec, fps, size, quality=None, segment_seconds=60.0):
+        self.path = path
+        self.codec = codec
+        self.fps = fps
+        self.size = tuple(size)
+        self.quality = quality
+        self.segment_frames = max(1, int(round(fps * segment_seconds)))
+        self.segments = 0
+        self.frames = 0
+        self.writer = self._next_segment()
+
+    def _next_segment(self):
+        writer = open_video_writer(segment_path(self.path, self.segments), self.codec, self.fps, self.size, self.quality)
+        self.segments += 1
+        self.frames = 0
+        return writer
+
+    def isOpened(self):
+        return self.writer is not None
+
+    def write(self, frame):
+        if self.writer is None:
+            return
+        if self.frames >= self.segment_frames:
+            self.writer.release()
+            self.writer = self._next_segment()
+            if self.writer is None:
+                print(f"✗ Failed to open recording segment {self.segments - 1} of {self.path}")
+                return
+        self.writer.write(frame)
+        self.frames += 1
+
+    def release(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class StreamRecorder:
+    """Records a second, higher-resolution stream straight to disk while a sale is open.
+
+    Used when inference runs on a camera substream: the mainstream is only opened
+    (and decoded) for the duration of a sale, on its own thread, so the prediction
+    loop never pays for high-resolution decoding. The recording profile applies
+    here too (size, codec, and every Nth frame for its fps).
+    """
+
+    def __init__(self, path, output_path, open_fn, profile=None, segment_seconds=RECORD_SEGMENT_SECONDS):
+        self.path = path
+        self.output_path = output_path
+        self.open_fn = open_fn  # path -> cv2.VideoCapture, configured like the inference capture
+        self.profile = profile or recording_profile(path)
+        self.interval = 1  # write every Nth mainstream frame (profile fps)
+        self.segment_seconds = segment_seconds
+        self.cap = None
+        self.out = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.frames_written = 0
+
+    def start(self):
+        self.cap = self.open_fn(self.path)
+        if not self.cap.isOpened():
+            print(f"✗ Failed to open recording stream: {self.path}")
+            self.cap.release()
+            return False
+
+        meta = read_stream_metadata(self.cap, self.path)
+        self.interval = record_interval(self.profile, meta["fps"])
+        self.out = open_video_writer(
+            self.output_path,
+            self.profile["codec"],
+            meta["fps"] / self.interval,
+            output_size(self.profile, meta["width"], meta["height"]),
+            self.profile["quality"],
+            self.segment_seconds
+        )
+        if self.out is None:
+            print("Error: Failed to initialize recording stream writer")
+            self.cap.release()
+            return False
+
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self):
+        try:
+            count = 0
+            while not self.stop_event.is_set():
+                # Frames between recorded ones are only grabbed, never decoded to BGR
+                if count % self.interval == 0:
+                    ret, frame = self.cap.read()
+                else:
+                    ret, frame = self.cap.grab(), None
+                if not ret:
+                    # Camera hiccup: reopen and keep recording into the same file
+                    self.cap.release()
+                    if self.stop_event.wait(1.0):
+                        break
+                    self.cap = self.open_fn(self.path)
+                    continue
+                count += 1
+                if frame is None:
+                    continue
+                self.out.write(frame)
+                self.frames_written += 1
+        except Exception as e:
+            print(f"Error recording stream: {e}")
+        finally:
+            try:
+                self.cap.release()
+            except Exception as e:
+                print(f"Error releasing recording stream: {e}")
+
+    def stop(self, timeout=10.0):
+        self.stop_event.set()
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+        if self.out is not None:
+            self.out.release()
+            self.out = None
+        print(f"✓ Stream recording stopped ({self.frames_written} frames)")
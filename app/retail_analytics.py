@@ -4,18 +4,12 @@ from app.variables import (
     CUSTOMER_DWELL_TIME,
     SCANNER_PHONE_DISTANCE,
     SCANNER_ITEM_DISTANCE,
-    SCANNER_MOVEMENT_THRESHOLD,
+    SCANNER_SPEED_THRESHOLD,
     PAYMENT_COMPLETE_TIME,
     SCAN_COOLDOWN,
-    STAFF_REENTRY_THRESHOLD,
-    STAFF_CUMULATIVE_TIME,
-    REENTRY_WINDOW,
-    STAFF_CONFIDENCE_THRESHOLD,
-    RECENT_BEHAVIOR_WINDOW,
-    CONFIDENCE_DECAY_RATE,
-    REENTRY_MIN_SESSIONS,
-    STAFF_TIME_MIN_SESSIONS
+    CASH_INTERACTION_GAP
 )
+from app.person_tracker import PersonBehaviorTracker
 
 class RetailAnalytics:
     # Configuration constants for memory management
@@ -23,16 +17,21 @@ class RetailAnalytics:
     MAX_PHONE_TRACKS = 60
     MAX_SCANNED_ITEMS = 500
     MAX_COMPLETED_PAYMENTS = 500
-    MAX_CASH_DETECTED = 500
+    MAX_CASH_SESSIONS = 500
     MAX_SERVICE_TIMES = 500
     MAX_LAST_SCAN_TIME_ENTRIES = 500
+
+    # Evidence kinds tracked in the running sale summary
+    EVIDENCE_KINDS = ('item_scan', 'scanner_motion', 'payment', 'cash', 'customer_visit', 'cashier')
     
-    def __init__(self, fps=30):
+    def __init__(self, fps=30, person_tracker=None):
         self.fps = fps
 
         # Scanner tracking
         self.scanner_positions = {}  # scanner_id: [last_positions]
+        self.scanner_last_seen = {}  # scanner_id: time of last position
         self.scanner_moving = {}     # scanner_id: bool
+        self.scanner_docked = {}     # scanner_id: bool, resting in a learned cradle
 
         # Item scanning
         self.scanned_items = []
@@ -44,267 +43,110 @@ class RetailAnalytics:
         self.completed_payments = []
         self.phone_tracks = defaultdict(list)
         self.payment_times = []
-        self.cash_detected = []
+        # Cash handovers: one session per (cash, customer) pair instead of one record per frame
+        self.cash_interactions = {}  # (cash_id, customer_id): {'start', 'last'}, still in progress
+        self.cash_sessions = []      # finished interactions with their duration
 
         # Customer
         self.customers_at_counter = {}
         self.customer_visits = []
         self.service_times = []
 
-        # Per-person behavior tracking for staff/customer differentiation
-        # Keyed by track_id
-        self.person_records = {}  # track_id: {first_seen, last_seen, cumulative_time, in_view, enter_count, last_exit, reentries, reentry_times, classification, staff_source, staff_confidence}
-        self.MAX_PERSON_RECORDS = 2000
-
-    def update_scanner_movement(self, scanners, current_time):
-        """Track if scanner is moving"""
+        # Per-person behavior tracking for staff/customer differentiation. Shared across
+        # sales (owned by Prediction) so shift-level signals survive the per-sale reset.
+        self.person_tracker = person_tracker if person_tracker is not None else PersonBehaviorTracker()
+
+        # Running per-sale evidence, updated as events happen so the sale summary is O(1).
+        # Counts are totals for the sale, unlike the capped history lists above.
+        self.evidence = {kind: {'count': 0, 'first': None, 'last': None} for kind in self.EVIDENCE_KINDS}
+
+    def _record_evidence(self, kind, current_time):
+        ev = self.evidence[kind]
+        ev['count'] += 1
+        if ev['first'] is None:
+            ev['first'] = current_time
+        ev['last'] = current_time
+
+    def get_sale_summary(self):
+        """Snapshot of the running sale summary (constant size, independent of sale length)"""
+        evidence = {kind: dict(ev) for kind, ev in self.evidence.items()}
+        return {
+            'items_scanned': evidence['item_scan']['count'],
+            'scanner_moving': evidence['scanner_motion']['count'] > 0,
+            'payments': evidence['payment']['count'],
+            'cash_detections': evidence['cash']['count'],
+            'customer_visits': evidence['customer_visit']['count'],
+            'cashier_seen': evidence['cashier']['count'] > 0,
+            'evidence': evidence
+        }
+
+    def update_scanner_movement(self, scanners, current_time, cradles=None):
+        """Track if scanner is moving.
+
+        Speed is in px/s so the decision doesn't depend on the processing fps: it uses
+        the optical-flow estimate ('flow_speed', see app/scanner_motion.py) when the
+        pipeline provides one, else the center displacement divided by elapsed time.
+        Scanners overlapping a learned cradle (app/static_scene.py) are marked docked.
+        """
         scanner_status = {}
 
         for scanner in scanners:
             scanner_id = scanner.get('track_id') or 0
             current_center = scanner['center']
+            if cradles:
+                self.scanner_docked[scanner_id] = any(
+                    get_box_iou(scanner['box'], cradle['box']) >= 0.5 for cradle in cradles
+                )
 
             if scanner_id not in self.scanner_positions:
                 self.scanner_positions[scanner_id] = [current_center]
+                self.scanner_last_seen[scanner_id] = current_time
                 scanner_status[scanner_id] = {'moving': False, 'speed': 0}
             else:
                 prev_center = self.scanner_positions[scanner_id][-1]
                 movement = get_distance(current_center, prev_center)
-
-                is_moving = movement > SCANNER_MOVEMENT_THRESHOLD
+                dt = current_time - self.scanner_last_seen.get(scanner_id, current_time)
+
+                speed = scanner.get('flow_speed')
+                if speed is None:
+                    if dt <= 0:
+                        # Same timestamp as the last update: keep the previous decision
+                        is_moving = self.scanner_moving.get(scanner_id, False)
+                        scanner_status[scanner_id] = {'moving': is_moving, 'speed': 0, 'center': current_center}
+                        continue
+                    speed = movement / dt
+
+                is_moving = speed > SCANNER_SPEED_THRESHOLD
                 self.scanner_moving[scanner_id] = is_moving
+                if is_moving:
+                    self._record_evidence('scanner_motion', current_time)
 
                 scanner_status[scanner_id] = {
                     'moving': is_moving,
-                    'speed': movement,
-                    'center': current_center
+                    'speed': speed,
+                    'center': current_center,
+                    'docked': self.scanner_docked.get(scanner_id, False)
                 }
 
                 # Keep last N positions for memory efficiency
                 self.scanner_positions[scanner_id].append(current_center)
+                self.scanner_last_seen[scanner_id] = current_time
                 if len(self.scanner_positions[scanner_id]) > self.MAX_SCANNER_POSITIONS:
                     self.scanner_positions[scanner_id].pop(0)
 
         return scanner_status
 
     def update_person_behavior(self, customers, current_time, cashiers=None):
-        """Track per-person on-screen sessions with improved staff/customer differentiation.
-        
-        IMPROVEMENTS:
-        - Confidence-based secondary staff classification (0-1 score)
-        - Better re-entry tracking: only counts recent re-entries within a window
-        - Minimum thresholds: need multiple sessions to qualify as staff
-        - Optimized for single-day operation (no persistence across restarts)
-        
-        customers: list of detection dicts with 'track_id' and 'center'
-        cashiers: list of cashier detection dicts with 'track_id' (primary staff indicator)
-        """
-        events = []
-        active_ids = set()
-        cashier_ids = set()
-
-        # FIRST PASS: Mark all detected cashiers as staff (primary indicator)
-        if cashiers is None:
-            cashiers = []
-        
-        for cashier in cashiers:
-            cid = cashier.get('track_id') or id(cashier)
-            cashier_ids.add(cid)
-            active_ids.add(cid)
-
-            rec = self.person_records.get(cid)
-            if rec is None:
-                # first time seeing this cashier
-                rec = {
-                    'first_seen': current_time,
-                    'last_seen': current_time,
-                    'cumulative_time': 0.0,
-                    'in_view': True,
-                    'enter_count': 1,
-                    'last_exit': None,
-                    'reentries': 0,
-                    'reentry_times': [],
-                    'classification': 'staff',
-                    'staff_source': 'primary',
-                    'staff_confidence': 1.0
-                }
-                rec['_session_start'] = current_time
-                self.person_records[cid] = rec
-                events.append(f"👷 PRIMARY STAFF: CASHIER DETECTED #{cid}")
-            else:
-                # Already-seen cashier still in view
-                if not rec.get('in_view'):
-                    rec['in_view'] = True
-                    rec['enter_count'] = rec.get('enter_count', 0) + 1
-                    rec['_session_start'] = current_time
-                    rec['staff_confidence'] = 1.0
-                
-                rec['last_seen'] = current_time
-                # Ensure classification is staff (primary staff cannot be downgraded)
-                if rec.get('classification') != 'staff' or rec.get('staff_source') != 'primary':
-                    rec['classification'] = 'staff'
-                    rec['staff_source'] = 'primary'
-                    rec['staff_confidence'] = 1.0
-                    events.append(f"👷 PRIMARY STAFF: CASHIER CONFIRMED #{cid}")
-
-        # SECOND PASS: Track customers & evaluate for secondary staff classification
-        for cust in customers:
-            cid = cust.get('track_id') or id(cust)
-            active_ids.add(cid)
-
-            # Skip if already marked as primary staff cashier
-            if cid in cashier_ids:
-                continue
-
-            rec = self.person_records.get(cid)
-            if rec is None:
-                # First time seeing this person as customer
-                rec = {
-                    'first_seen': current_time,
-                    'last_seen': current_time,
-                    'cumulative_time': 0.0,
-                    'in_view': True,
-                    'enter_count': 1,
-                    'last_exit': None,
-                    'reentries': 0,
-                    'reentry_times': [],
-                    'classification': 'customer',
-                    'staff_source': None,
-                    'staff_confidence': 0.0
-                }
-                rec['_session_start'] = current_time
-                self.person_records[cid] = rec
-            else:
-                if not rec.get('in_view'):
-                    # Person re-entered after being out of view
-                    rec['in_view'] = True
-                    rec['enter_count'] = rec.get('enter_count', 0) + 1
-                    
-                    # Track re-entry time (filter to recent window)
-                    if rec.get('last_exit') is not None:
-                        rec['reentry_times'] = rec.get('reentry_times', [])
-                        rec['reentry_times'].append(current_time)
-                        
-                        # Only keep recent re-entries within REENTRY_WINDOW
-                        rec['reentry_times'] = [t for t in rec['reentry_times'] 
-                                               if current_time - t <= REENTRY_WINDOW]
-                        
-                        # Update re-entry count based on recent window
-                        rec['reentries'] = len(rec['reentry_times'])
-                    
-                    # Start new session
-                    rec['_session_start'] = current_time
-                
-                # Update last seen while in view
-                rec['last_seen'] = current_time
-
-            # SECONDARY STAFF EVALUATION: Use confidence-based approach
-            if rec.get('classification') != 'staff' or rec.get('staff_source') == 'secondary':
-                confidence = self._calculate_staff_confidence(rec, current_time)
-                rec['staff_confidence'] = confidence
-                
-                # Classify based on confidence threshold
-                is_confident_staff = confidence >= STAFF_CONFIDENCE_THRESHOLD
-                is_currently_staff = rec.get('classification') == 'staff'
-                
-                if is_confident_staff and not is_currently_staff:
-                    # Promote to secondary staff
-                    rec['classification'] = 'staff'
-                    rec['staff_source'] = 'secondary'
-                    events.append(f"👷 SECONDARY STAFF: #{cid} (confidence: {confidence:.2f})")
-                
-                elif not is_confident_staff and is_currently_staff and rec.get('staff_source') == 'secondary':
-                    # Demote from secondary staff
-                    rec['classification'] = 'customer'
-                    rec['staff_source'] = None
-                    rec['staff_confidence'] = 0.0
-                    events.append(f"👤 CUSTOMER: #{cid} (confidence: {confidence:.2f})")
-
-        # THIRD PASS: Handle exits
-        for cid, rec in list(self.person_records.items()):
-            if rec.get('in_view') and cid not in active_ids:
-                # Person left the view
-                rec['in_view'] = False
-                rec['last_exit'] = current_time
-                
-                # Calculate this session's duration
-                start = rec.get('_session_start', rec.get('first_seen', current_time))
-                session_time = rec.get('last_seen', current_time) - start
-                
-                if session_time > 0:
-                    rec['cumulative_time'] = rec.get('cumulative_time', 0.0) + session_time
-                
-                rec.pop('_session_start', None)
-                
-                # Final secondary staff check at exit
-                if rec.get('classification') != 'staff' or rec.get('staff_source') == 'secondary':
-                    confidence = self._calculate_staff_confidence(rec, current_time)
-                    rec['staff_confidence'] = confidence
-                    
-                    if confidence >= STAFF_CONFIDENCE_THRESHOLD and rec.get('classification') != 'staff':
-                        rec['classification'] = 'staff'
-                        rec['staff_source'] = 'secondary'
-                        events.append(f"👷 SECONDARY STAFF: #{cid} confirmed on exit (confidence: {confidence:.2f})")
-
-        # Memory management
-        if len(self.person_records) > self.MAX_PERSON_RECORDS:
-            sorted_items = sorted(self.person_records.items(), key=lambda kv: kv[1].get('last_seen', 0))
-            for k, _ in sorted_items[: len(self.person_records) - self.MAX_PERSON_RECORDS]:
-                del self.person_records[k]
-
-        return events
-
-    def _calculate_staff_confidence(self, person_rec, current_time):
-        """
-        Calculate confidence score (0-1) that a person is staff based on behavioral patterns.
-        Single-day focused: recent re-entries and cumulative time within current session.
-        
-        Factors:
-        - Recent re-entries (multiple quick returns suggest staff restocking/breaks)
-        - Cumulative time across multiple sessions (staff often spend longer)
-        """
-        confidence = 0.0
-        
-        enter_count = person_rec.get('enter_count', 0)
-        reentries = person_rec.get('reentries', 0)
-        cumulative_time = person_rec.get('cumulative_time', 0.0)
-        reentry_times = person_rec.get('reentry_times', [])
-        
-        # Factor 1: Recent re-entry pattern (4+ entries within 10-min window = strong staff indicator)
-        recent_reentries = len([t for t in reentry_times if t])
-        if recent_reentries >= STAFF_REENTRY_THRESHOLD and enter_count >= REENTRY_MIN_SESSIONS:
-            # Scale: 4 reentries = 0.5 confidence, 6+ = higher
-            reentry_score = min(0.8, (recent_reentries / STAFF_REENTRY_THRESHOLD) * 0.6)
-            confidence += reentry_score
-        
-        # Factor 2: Cumulative time (15+ minutes across 3+ sessions = moderate staff indicator)
-        if enter_count >= STAFF_TIME_MIN_SESSIONS and cumulative_time >= STAFF_CUMULATIVE_TIME:
-            # Scale: at threshold = 0.4, double threshold = 0.7
-            time_score = min(0.8, (cumulative_time / (STAFF_CUMULATIVE_TIME * 2.0)) * 0.8)
-            confidence += time_score
-        
-        # Cap at 1.0
-        return min(1.0, confidence)
+        """Per-person staff/customer behavior lives in the shift-long PersonBehaviorTracker;
+        only the per-sale cashier evidence is recorded here."""
+        if cashiers:
+            self._record_evidence('cashier', current_time)
+        return self.person_tracker.update(customers, current_time, cashiers=cashiers)
 
     def get_person_label(self, track_id):
-        """Get display label for person: shows classification, source, and confidence for secondary staff"""
-        rec = self.person_records.get(track_id)
-        if not rec:
-            return 'unknown'
-        
-        classification = rec.get('classification', 'unknown')
-        source = rec.get('staff_source')
-        confidence = rec.get('staff_confidence', 0.0)
-        
-        if classification == 'staff':
-            if source == 'primary':
-                return f"{classification}-{source}"
-            else:
-                # Secondary staff: show confidence score (0-1)
-                return f"{classification}-2nd({confidence:.2f})"
-        return classification
+        return self.person_tracker.get_person_label(track_id)
 
-    def update_item_scanning(self, items, scanners, scanner_status, current_time):
+    def update_item_scanning(self, items, scanners, scanner_status, current_time, index=None):
         """
         NEW LOGIC: Scanner MOVES and overlaps/near Item = Item Scanned
 
@@ -312,6 +154,9 @@ class RetailAnalytics:
         1. Scanner bbox overlaps Item bbox OR distance < threshold
         2. Scanner was MOVING (approaching the item)
         3. Cooldown passed for this item
+
+        index (app/spatial_index.py) narrows the items checked per scanner to
+        those that can overlap it or lie within SCANNER_ITEM_DISTANCE.
         """
         events = []
         self.current_overlaps = []
@@ -324,7 +169,8 @@ class RetailAnalytics:
             scanner_box = scanner['box']
             scanner_center = scanner['center']
 
-            for item in items:
+            nearby = index.candidates('item', scanner_box, SCANNER_ITEM_DISTANCE) if index is not None else items
+            for item in nearby:
                 item_id = item.get('track_id') or id(item)
                 item_box = item['box']
                 item_center = item['center']
@@ -368,6 +214,7 @@ class RetailAnalytics:
                             self.scanned_items.pop(0)
                         
                         self.last_scan_time[item_id] = current_time
+                        self._record_evidence('item_scan', current_time)
                         # Clean up old scan time entries
                         if len(self.last_scan_time) > self.MAX_LAST_SCAN_TIME_ENTRIES:
                             oldest_key = min(self.last_scan_time.keys(), key=lambda k: self.last_scan_time[k])
@@ -376,7 +223,7 @@ class RetailAnalytics:
                         events.append(f"✓ ITEM #{item_id} SCANNED!")
         return events
 
-    def update_payment_scanning(self, phones, scanners, current_time):
+    def update_payment_scanning(self, phones, scanners, current_time, index=None):
         """Phone near scanner for 1s = payment complete (working well)"""
         events = []
         phone_near_scanner = False
@@ -391,7 +238,8 @@ class RetailAnalytics:
             if len(self.phone_tracks[phone_id]) > self.MAX_PHONE_TRACKS:
                 self.phone_tracks[phone_id].pop(0)
 
-            for scanner in scanners:
+            nearby = index.near('scanner', phone['center'], SCANNER_PHONE_DISTANCE) if index is not None else scanners
+            for scanner in nearby:
                 dist = get_distance(phone['center'], scanner['center'])
 
                 if dist < SCANNER_PHONE_DISTANCE:
@@ -416,6 +264,7 @@ class RetailAnalytics:
                                 self.completed_payments.pop(0)
                             
                             self.payment_times.append(duration)
+                            self._record_evidence('payment', current_time)
                             events.append("✓ PAYMENT COMPLETE (Mobile)")
                             self.payment_in_progress = None
                     break
@@ -425,44 +274,71 @@ class RetailAnalytics:
 
         return events
 
-    def detect_cash(self, cashes, customers, current_time):
-        """Detect cash near customers and generate events"""
+    def detect_cash(self, cashes, customers, current_time, index=None):
+        """Track cash/customer overlaps as interaction sessions.
+
+        A session starts (one CASH DETECTED event, one unit of cash evidence) the
+        first frame a cash box overlaps a customer, and ends with a single event
+        once the pair hasn't overlapped for CASH_INTERACTION_GAP seconds, so a
+        handover spanning many frames is one record with a start, end and duration.
+        Untracked boxes (no track id) are keyed by None so they can't open a new
+        session every frame.
+        """
         events = []
-        active_ids = set()
 
         for cash in cashes:
-            cash_id = cash.get('track_id') or id(cash)
-            active_ids.add(cash_id)
-
-            for customer in customers:
+            nearby = index.candidates('customer', cash['box']) if index is not None else customers
+            for customer in nearby:
                 if boxes_overlap(cash['box'], customer['box']):
-                    customer_id = customer.get('track_id') or id(customer)
-                    customer.setdefault('paid_with_cash', []).append(cash_id)
-                    
-                    self.cash_detected.append({
-                        'event': 'cash_detected',
-                        'customer_id': customer_id,
-                        'cash_id': cash_id,
-                        'time': current_time
-                    })
-                    # Clean up old cash detection history
-                    if len(self.cash_detected) > self.MAX_CASH_DETECTED:
-                        self.cash_detected.pop(0)
-                    
-                    events.append(f"💵 CASH DETECTED (Customer #{customer_id})")
+                    pair = (cash.get('track_id'), customer.get('track_id'))
+                    interaction = self.cash_interactions.get(pair)
+                    if interaction is None:
+                        self.cash_interactions[pair] = {'start': current_time, 'last': current_time}
+                        self._record_evidence('cash', current_time)
+                        events.append(f"💵 CASH DETECTED (Customer #{pair[1]})")
+                    else:
+                        interaction['last'] = current_time
                     break
+
+        for pair, interaction in list(self.cash_interactions.items()):
+            if current_time - interaction['last'] > CASH_INTERACTION_GAP:
+                events.append(self._end_cash_interaction(pair))
         return events
 
-    def update_customer_at_counter(self, customers, counters, current_time):
-        """Customer bbox overlapping counter"""
+    def close_cash_interactions(self):
+        """End every interaction still open (the sale is closing); returns their events"""
+        return [self._end_cash_interaction(pair) for pair in list(self.cash_interactions)]
+
+    def _end_cash_interaction(self, pair):
+        interaction = self.cash_interactions.pop(pair)
+        duration = interaction['last'] - interaction['start']
+        self.cash_sessions.append({
+            'event': 'cash_interaction',
+            'cash_id': pair[0],
+            'customer_id': pair[1],
+            'start': interaction['start'],
+            'end': interaction['last'],
+            'duration': duration
+        })
+        if len(self.cash_sessions) > self.MAX_CASH_SESSIONS:
+            self.cash_sessions.pop(0)
+        return f"💵 CASH INTERACTION ENDED (Customer #{pair[1]}, {duration:.1f}s)"
+
+    def update_customer_at_counter(self, customers, counters, current_time, index=None):
+        """Customer bbox overlapping counter.
+
+        Untracked customers (no track id yet) share the key None, like untracked
+        cash in detect_cash, so they can't arrive and leave again every frame.
+        """
         events = []
         active_ids = set()
 
         for customer in customers:
-            customer_id = customer.get('track_id') or id(customer)
+            customer_id = customer.get('track_id')
             active_ids.add(customer_id)
 
-            for counter in counters:
+            nearby = index.candidates('counter', customer['box']) if index is not None else counters
+            for counter in nearby:
                 has_overlap = boxes_overlap(customer['box'], counter['box'])
 
                 if has_overlap:
@@ -477,6 +353,7 @@ class RetailAnalytics:
                         if dwell >= CUSTOMER_DWELL_TIME and not self.customers_at_counter[customer_id]['counted']:
                             self.customers_at_counter[customer_id]['counted'] = True
                             self.customer_visits.append({'customer_id': customer_id})
+                            self._record_evidence('customer_visit', current_time)
                     break
 
         for cid in list(self.customers_at_counter.keys()):
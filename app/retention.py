@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+
+# Only media the service writes is ever deleted, whatever else lives in the directory
+RETENTION_EXTENSIONS = (".mp4", ".avi", ".mkv", ".jpg", ".jpeg")
+RETENTION_FILENAMES = ("manifest.json",)  # evidence bundle manifests
+
+
+class RetentionManager:
+    """Background disk budget for the clip directory.
+
+    Every interval seconds the directory tree is scanned once: files older than
+    max_age are deleted, then the oldest remaining files go until the total is
+    under max_bytes. Recordings still being written or saved (in_use() returns
+    their temp paths) are never touched, segments included. Deletion runs on its
+    own thread, so saving a clip never waits for a sweep.
+    """
+
+    def __init__(self, directory, max_bytes, max_age, interval=600.0, in_use=None, metrics=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.interval = interval
+        self.in_use = in_use or (lambda: ())
+        self.metrics = metrics
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"✗ Error enforcing clip retention: {e}")
+            self.stop_event.wait(self.interval)
+
+    def _files(self):
+        """(mtime, size, path) of every deletable media file, oldest first, and the
+        bytes held by recordings in use (they count against the quota)"""
+        protected = tuple(os.path.splitext(os.path.abspath(path))[0] for path in self.in_use() if path)
+        files = []
+        in_use_bytes = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.lower().endswith(RETENTION_EXTENSIONS) and name not in RETENTION_FILENAMES:
+                    continue
+                path = os.path.abspath(os.path.join(root, name))
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if protected and path.startswith(protected):
+                    in_use_bytes += stat.st_size
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        return files, in_use_bytes
+
+    def sweep(self, now=None):
+        """One retention pass; returns the number of files deleted"""
+        if not os.path.isdir(self.directory):
+            return 0
+        now = time.time() if now is None else now
+        files, in_use_bytes = self._files()
+        total = in_use_bytes + sum(size for _, size, _ in files)
+        deleted = 0
+        for mtime, size, path in files:
+            if self.max_age is not None and now - mtime > self.max_age:
+                reason = "age"
+            elif self.max_bytes is not None and total > self.max_bytes:
+                reason = "quota"
+            else:
+                # Sorted oldest first: nothing newer is expired either
+                break
+            if self._delete(path):
+                total -= size
+                deleted += 1
+                if self.metrics is not None:
+                    self.metrics.retention_deleted.inc(label_value=reason)
+        if self.metrics is not None:
+            self.metrics.record_dir_bytes.set(total)
+        if deleted:
+            self._remove_empty_dirs()
+            print(f"✓ Retention: deleted {deleted} file(s), {total / 1e9:.2f} GB in {self.directory}")
+        return deleted
+
+    @staticmethod
+    def _delete(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            # Locked by a player on Windows: retried on the next sweep
+            print(f"✗ Could not delete {path}: {e}")
+            return False
+
+    def _remove_empty_dirs(self):
+        for root, dirs, files in os.walk(self.directory, topdown=False):
+            if root != self.directory and not dirs and not files:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
@@ -0,0 +1,264 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from app.evidence import save_bundle, discard_bundle
+from app.recording import ClipJoiner, clip_files, save_clip, discard_clip
+from app.retention import RetentionManager
+from app.sale_session import SaleCloseTimeout
+from app.variables import (
+    SALE_TARGET_FPS,
+    RECORD_OUTPUT_DIR,
+    RECORD_MAX_BYTES,
+    RECORD_MAX_AGE,
+    RECORD_RETENTION_INTERVAL,
+    STOP_SALE_REPLAY_WINDOW,
+    INFERENCE_WORKER_TIMEOUT,
+    INFERENCE_WORKER_METHOD_TIMEOUTS
+)
+
+
+class SaleService:
+    """Control operations on a running Prediction.
+
+    The Flask app calls these directly in "inprocess" serving mode; in "worker"
+    mode the inference worker (worker.py) exposes the same methods over local IPC
+    and the web processes use app/ipc.py's InferenceClient instead. Methods return
+    plain data and raise on failure; HTTP concerns stay in main.py.
+    """
+
+    # Methods the inference worker accepts over IPC
+    RPC_METHODS = (
+        "readiness", "start_sale", "stop_sale", "metrics", "sales", "sale_events",
+        "profile_status", "start_profile"
+    )
+
+    MAX_STOP_RESULTS = 64  # recent stop_sale results kept for retries
+
+    def __init__(self, model, output_dir=RECORD_OUTPUT_DIR):
+        self.model = model
+        self.output_dir = output_dir
+        self._saving = set()  # temp clip / evidence paths of closed sales being saved or discarded
+        self._saving_lock = threading.Lock()
+        # Saved segmented clips are joined in the background; saving itself only renames
+        self.joiner = ClipJoiner()
+        # voucher: stop_sale in progress or recently finished, so a retry can't close the next sale
+        self._stops = OrderedDict()
+        self._stops_lock = threading.Lock()
+        # Disk quota and age policy for output_dir, enforced off the request path
+        self.retention = RetentionManager(
+            output_dir,
+            RECORD_MAX_BYTES,
+            RECORD_MAX_AGE,
+            RECORD_RETENTION_INTERVAL,
+            in_use=self._clips_in_use,
+            metrics=model.metrics
+        )
+        self.retention.start()
+
+    def _clips_in_use(self):
+        # Live session first: close_sale() claims a session's paths before swapping it out
+        session = self.model.session
+        with self._saving_lock:
+            saving = tuple(self._saving)
+        return (session.temp_video_path, session.evidence_path, *saving, *self.joiner.pending())
+
+    def _claim(self, session):
+        with self._saving_lock:
+            self._saving.update(path for path in (session.temp_video_path, session.evidence_path) if path)
+
+    def _unclaim(self, session):
+        with self._saving_lock:
+            self._saving.difference_update((session.temp_video_path, session.evidence_path))
+
+    def readiness(self):
+        model = self.model
+        return {
+            "ready": bool(model.ready and model.running),
+            "warmed_up": model.ready,
+            "running": model.running,
+            "source_up": model.source_down_since is None,
+            "recording": model.recording_enabled
+        }
+
+    def start_sale(self):
+        """Raise the processing rate and start recording; False if recording failed"""
+        self.model.set_target_fps(SALE_TARGET_FPS)
+        os.makedirs(self.output_dir, exist_ok=True)  # same disk as final storage
+        return self.model.enable_recording(output_dir=self.output_dir)
+
+    def stop_sale(self, pos_member, pos_wallet, voucher_number, cashier_id=None):
+        """Close the live sale, keep its clip if suspicious and persist the result.
+
+        Idempotent per voucher: a POS retry (e.g. after the web tier timed out)
+        while the first call is still running, or within STOP_SALE_REPLAY_WINDOW
+        seconds of it, gets the first call's result instead of closing the next sale.
+        A retry waits for the first call at most as long as the stop_sale IPC timeout
+        and then raises SaleCloseTimeout, as does every retry of a sale whose frames
+        never finished (see Prediction.close_sale()).
+        """
+        with self._stops_lock:
+            entry = self._stops.get(voucher_number)
+            if entry is not None and entry["done"].is_set() and \
+                    time.time() - entry["finished_at"] > STOP_SALE_REPLAY_WINDOW:
+                entry = None
+            owner = entry is None
+            if owner:
+                entry = {"done": threading.Event(), "result": None, "error": None, "finished_at": None}
+                self._stops[voucher_number] = entry
+                self._stops.move_to_end(voucher_number)
+                while len(self._stops) > self.MAX_STOP_RESULTS:
+                    self._stops.popitem(last=False)
+        if not owner:
+            timeout = INFERENCE_WORKER_METHOD_TIMEOUTS.get("stop_sale", INFERENCE_WORKER_TIMEOUT)
+            if not entry["done"].wait(timeout):
+                raise SaleCloseTimeout(f"The sale for voucher {voucher_number} is still closing")
+            if entry["error"] is not None:
+                raise entry["error"]
+            if entry["result"] is None:
+                raise RuntimeError(f"Closing the sale for voucher {voucher_number} failed")
+            print(f"✓ Repeated stop for voucher {voucher_number}: returning the first result")
+            return entry["result"]
+
+        try:
+            entry["result"] = self._stop_sale(pos_member, pos_wallet, voucher_number, cashier_id)
+            return entry["result"]
+        except SaleCloseTimeout as e:
+            # The sale was handed off but can't be summarized: a retry must not close the next one
+            entry["error"] = e
+            raise
+        except Exception:
+            # Nothing to replay: a retry closes the sale again
+            with self._stops_lock:
+                if self._stops.get(voucher_number) is entry:
+                    del self._stops[voucher_number]
+            raise
+        finally:
+            entry["finished_at"] = time.time()
+            entry["done"].set()
+
+    def _stop_sale(self, pos_member, pos_wallet, voucher_number, cashier_id):
+        model = self.model
+        # Hand off the sale: the loop continues into a fresh session while the
+        # closed one is frozen (recording finalized) for summarizing and saving
+        sale = model.close_sale(on_close=self._claim)
+        try:
+            return self._finish_sale(sale, pos_member, pos_wallet, voucher_number, cashier_id)
+        finally:
+            self._unclaim(sale)
+
+    def _finish_sale(self, sale, pos_member, pos_wallet, voucher_number, cashier_id):
+        """Summarize, save or discard and persist a closed sale (its files are claimed)"""
+        model = self.model
+        # Get prediction output with error handling
+        try:
+            output, developer_message = model.print_output(pos_wallet, pos_member, session=sale)
+        except Exception as e:
+            print(f"Error generating output summary: {e}")
+            output = {"error": "Failed to generate prediction output"}
+            developer_message = {"error": str(e)}
+
+        # Report camera outages during the sale: analytics may have missed events
+        sale_downtime = model.get_sale_downtime(sale)
+        if sale_downtime > 0:
+            developer_message["video_outage_seconds"] = round(sale_downtime, 1)
+
+        # Save video only if suspicious activity detected
+        video_saved = False
+        output_path = None
+        temp_path = sale.temp_video_path
+        safe_voucher = re.sub(r'[\\/:*?"<>|]', "_", voucher_number)
+        if sale.suspicious and temp_path and clip_files(temp_path):
+            try:
+                os.makedirs(self.output_dir, exist_ok=True)
+
+                output_path = os.path.join(self.output_dir, f"{safe_voucher}.mp4")
+
+                # Renames only; several segments are joined into output_path in the background
+                if save_clip(temp_path, output_path):
+                    video_saved = True
+                    if len(clip_files(output_path)) > 1:
+                        profile = model.recording_profile
+                        self.joiner.submit(output_path, profile["codec"], profile["quality"])
+                    print(f"✓ Suspicious activity recording saved: {output_path}")
+                else:
+                    print(f"✗ Could not save recording: {temp_path}")
+
+            except PermissionError as e:
+                print(f"✗ File is locked / still being written: {e}")
+            except Exception as e:
+                print(f"✗ Error saving video: {e}")
+        elif temp_path:
+            # Clean up temp file (and segments) if not saving
+            try:
+                discard_clip(temp_path)
+            except Exception as e:
+                print(f"Error removing temp video: {e}")
+
+        # Event snapshots follow the same rule: kept for suspicious sales only
+        evidence_path = None
+        if sale.evidence_path:
+            try:
+                if sale.suspicious:
+                    bundle_path = os.path.join(self.output_dir, f"{safe_voucher}_evidence")
+                    if save_bundle(sale.evidence_path, bundle_path):
+                        evidence_path = bundle_path
+                        print(f"✓ Evidence snapshots saved: {bundle_path}")
+                else:
+                    discard_bundle(sale.evidence_path)
+            except Exception as e:
+                print(f"✗ Error saving evidence snapshots: {e}")
+        stats = sale.stats()
+        if evidence_path:
+            stats["evidence_bundle"] = evidence_path
+
+        # Persist the result; queued for the background writer, never blocks the response
+        model.store.add_sale(
+            session_id=sale.session_id,
+            voucher_number=voucher_number,
+            cashier_id=cashier_id,
+            started_at=sale.started_at,
+            closed_at=sale.closed_at,
+            pos_member=pos_member,
+            pos_wallet=pos_wallet,
+            suspicious=sale.suspicious,
+            recording_saved=video_saved,
+            video_path=output_path if video_saved else None,
+            prediction_summary=output,
+            developer_message=developer_message,
+            stats=stats
+        )
+
+        return {
+            "prediction_summary": output,
+            "developer_message": developer_message,
+            "recording_saved": video_saved,
+            "evidence_saved": evidence_path is not None,
+            "sale_id": sale.session_id
+        }
+
+    def metrics(self):
+        # Rendering happens only here, so the prediction loop pays nothing when nobody scrapes
+        return self.model.metrics.render()
+
+    def sales(self, voucher_number=None, cashier_id=None, since=None, until=None, limit=100):
+        return self.model.store.query_sales(
+            voucher_number=voucher_number, cashier_id=cashier_id, since=since, until=until, limit=limit
+        )
+
+    def sale_events(self, sale_id, limit=1000):
+        return self.model.store.query_events(session_id=sale_id, limit=limit)
+
+    def subscribe(self):
+        """Live analytics event subscription (raises RuntimeError when full)"""
+        return self.model.event_bus.subscribe()
+
+    def profile_status(self):
+        return self.model.profiler.status()
+
+    def start_profile(self, duration, mode):
+        """Arm a profiling session; returns False if one is already running"""
+        if not self.model.running:
+            raise RuntimeError("Prediction is not running")
+        return self.model.profiler.start(duration=duration, mode=mode)
@@ -0,0 +1,91 @@
+import time
+import uuid
+from app.retail_analytics import RetailAnalytics
+
+
+class SaleCloseTimeout(TimeoutError):
+    """A closed sale's frames did not finish in time; the sale could not be summarized"""
+
+
+class SaleSession:
+    """Analytics and recording state scoped to one sale.
+
+    The prediction loop only ever writes into the live session. When a sale is
+    closed, Prediction swaps in a fresh session and waits until no frame is pinned
+    to the old one (in_flight); from then on the old session is frozen and can be summarized,
+    saved and finalized by the control API without any lock on the hot path.
+    """
+
+    def __init__(self, analytics=None):
+        self.session_id = uuid.uuid4().hex
+        self.analytics = analytics if analytics is not None else RetailAnalytics()
+        self.started_at = time.time()
+        self.closed_at = None
+
+        # Recording for this sale (either an inline writer or a mainstream StreamRecorder)
+        self.out = None
+        self.recorder = None
+        self.temp_video_path = None
+        # Event snapshots (EVIDENCE_MODE "snapshots"/"both"); the directory outlives the bundle
+        self.evidence = None
+        self.evidence_path = None
+        # Recording profile decimation: 0 = every captured frame, N = every Nth processed frame
+        self.record_interval = 0
+        self._processed_seen = 0
+
+        # Frames handed to post-processing with this session and not finished yet
+        self.in_flight = 0
+
+        self.suspicious = False
+        self.downtime = 0.0  # seconds the camera was unavailable during this sale
+
+    @property
+    def closed(self):
+        return self.closed_at is not None
+
+    @property
+    def recording(self):
+        return self.out is not None or self.recorder is not None or self.evidence is not None
+
+    def should_record(self, processed):
+        """Whether the frame goes into the clip. Decimated clips only take processed
+        frames, so they stay aligned with frame_skip_interval and carry overlays."""
+        if not self.record_interval:
+            return True
+        if not processed:
+            return False
+        self._processed_seen += 1
+        return (self._processed_seen - 1) % self.record_interval == 0
+
+    def stats(self):
+        """Per-sale stats persisted alongside the summary"""
+        end = self.closed_at or time.time()
+        return {
+            "duration_s": round(end - self.started_at, 2),
+            "video_outage_s": round(self.downtime, 2),
+            "evidence": self.analytics.get_sale_summary()["evidence"]
+        }
+
+    def release_recording(self):
+        """Finalize the clip so it is playable before it is moved or deleted"""
+        if self.out is not None:
+            try:
+                if self.out.isOpened():
+                    self.out.release()
+            except Exception as e:
+                print(f"Error releasing VideoWriter: {e}")
+            finally:
+                self.out = None
+        if self.recorder is not None:
+            self.recorder.stop()
+            self.recorder = None
+        if self.evidence is not None:
+            self.evidence.close()
+            self.evidence = None
+
+    def close(self):
+        """Freeze the session; must only be called once the loop no longer uses it"""
+        if self.closed_at is None:
+            self.closed_at = time.time()
+        self.release_recording()
+        return self
@@ -0,0 +1,52 @@
+import numpy as np
+from app.variables import SPATIAL_INDEX_MIN_OBJECTS
+
+
+class SpatialIndex:
+    """Per-frame sorted-sweep index over the detections, shared by the analytics rules.
+
+    Built once per frame from predict_frame output. Each class is indexed lazily
+    on its first query: its boxes are stacked into one array sorted by x1. A
+    query binary-searches the boxes starting left of the query's right edge and
+    filters the rest of the overlap test in one vectorized step, so the rules only
+    run their per-pair Python checks on boxes that can actually match.
+    candidates() keeps the original detection order, so rules that stop at the
+    first match decide exactly as a full scan would. Classes with at most
+    min_objects detections skip the index and return the plain list.
+    """
+
+    def __init__(self, detections, min_objects=SPATIAL_INDEX_MIN_OBJECTS):
+        self.detections = detections
+        self.min_objects = min_objects
+        self._classes = {}  # class -> (x1 sorted, boxes sorted by x1, original indices)
+
+    def _build(self, cls):
+        boxes = np.array([det['box'][:4] for det in self.detections[cls]], dtype=np.float32)
+        order = np.argsort(boxes[:, 0], kind='stable')
+        boxes = boxes[order]
+        entry = (boxes[:, 0].copy(), boxes, order)
+        self._classes[cls] = entry
+        return entry
+
+    def candidates(self, cls, box, margin=0.0):
+        """Detections of cls whose box touches box grown by margin px on every side"""
+        dets = self.detections.get(cls, [])
+        if len(dets) <= self.min_objects:
+            return dets
+        entry = self._classes.get(cls)
+        if entry is None:
+            entry = self._build(cls)
+        x1_sorted, boxes, order = entry
+        qx1, qy1 = box[0] - margin, box[1] - margin
+        qx2, qy2 = box[2] + margin, box[3] + margin
+        end = np.searchsorted(x1_sorted, qx2, side='right')
+        head = boxes[:end]
+        hits = order[:end][(head[:, 2] >= qx1) & (head[:, 1] <= qy2) & (head[:, 3] >= qy1)]
+        hits.sort()
+        return [dets[i] for i in hits]
+
+    def near(self, cls, point, radius):
+        """Detections of cls whose box comes within radius of point on both axes
+        (a superset of those whose center lies within radius)"""
+        x, y = point
+        return self.candidates(cls, (x, y, x, y), radius)
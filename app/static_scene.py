@@ -0,0 +1,172 @@
+import json
+import os
+import time
+import numpy as np
+from app.helper_functions import get_center, get_box_iou
+from app.video_source import camera_key
+
+FIXTURE_CLASSES = ("counter", "scanner_cradle")
+MAX_CLUSTERS = 32  # candidate locations kept per fixture class during warm-up
+
+
+class StaticSceneCache:
+    """Learns fixed fixture geometry per camera and serves it instead of detections.
+
+    During a warm-up window, counter boxes and scanner boxes are clustered by IoU.
+    A location present in at least min_presence of the warm-up frames becomes a
+    fixture: the counter, and the scanner cradle (where the scanner sits while not
+    in use; a scanner being waved around never stays in one cluster long enough).
+    The median box of each fixture is stored per camera in a JSON file, so a
+    restart skips the warm-up. Once learned, apply() replaces the per-frame
+    counter detections with the cached boxes. Classes with no stable location keep
+    using live detections.
+    """
+
+    def __init__(self, path, camera, frame_size, warmup=30.0, min_presence=0.6, match_iou=0.5, max_age=None):
+        self.path = path
+        self.camera = camera_key(camera)
+        self.frame_size = [int(frame_size[0]), int(frame_size[1])]
+        self.warmup = warmup
+        self.min_presence = min_presence
+        self.match_iou = match_iou
+        self.max_age = max_age  # seconds before a stored scene is re-learned
+        self.fixtures = None  # {class: [detection, ...]} once learned
+        self.reset()
+
+    @property
+    def ready(self):
+        return self.fixtures is not None
+
+    def reset(self):
+        """Forget the learned scene and start a new warm-up"""
+        self.fixtures = None
+        self._clusters = {cls: [] for cls in FIXTURE_CLASSES}
+        self._frames = {cls: 0 for cls in FIXTURE_CLASSES}
+        self._started = None
+
+    def set_frame_size(self, frame_size):
+        """Geometry is only valid for one resolution; re-learn if it changed"""
+        frame_size = [int(frame_size[0]), int(frame_size[1])]
+        if frame_size != self.frame_size:
+            self.frame_size = frame_size
+            self.reset()
+            self.load()
+
+    def load(self):
+        """Adopt the stored scene for this camera; returns True if one was found"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                scenes = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"✗ Error reading static scene cache: {e}")
+            return False
+
+        scene = scenes.get(self.camera)
+        if not scene or scene.get('frame_size') != self.frame_size:
+            return False
+        if self.max_age is not None and time.time() - scene.get('learned_at', 0) > self.max_age:
+            return False
+        self.fixtures = {
+            cls: [_fixture(box) for box in boxes]
+            for cls, boxes in scene.get('fixtures', {}).items()
+        }
+        print(f"✓ Static scene loaded: {self._describe()}")
+        return True
+
+    def observe(self, detections, current_time):
+        """Feed one frame of detections during warm-up; cheap no-op once learned"""
+        if self.fixtures is not None:
+            return
+        if self._started is None:
+            self._started = current_time
+
+        self._frames['counter'] += 1
+        self._accumulate('counter', detections.get('counter', []))
+        scanners = detections.get('scanner', [])
+        if scanners:
+            self._frames['scanner_cradle'] += 1
+            self._accumulate('scanner_cradle', scanners)
+
+        if current_time - self._started >= self.warmup:
+            self._finalize()
+
+    def apply(self, detections):
+        """Serve cached fixtures in place of per-frame counter detections"""
+        if self.fixtures is not None and self.fixtures.get('counter'):
+            detections['counter'] = self.fixtures['counter']
+        return detections
+
+    def cradles(self):
+        return self.fixtures.get('scanner_cradle', []) if self.fixtures else []
+
+    def _accumulate(self, cls, dets):
+        clusters = self._clusters[cls]
+        for det in dets:
+            box = np.asarray(det['box'][:4], dtype=np.float32)
+            best, best_iou = None, self.match_iou
+            for cluster in clusters:
+                iou = get_box_iou(box, cluster['anchor'])
+                if iou >= best_iou:
+                    best, best_iou = cluster, iou
+            if best is None:
+                if len(clusters) >= MAX_CLUSTERS:
+                    # Drop the least seen candidate to bound warm-up memory
+                    clusters.remove(min(clusters, key=lambda c: c['hits']))
+                clusters.append({'anchor': box, 'boxes': [box], 'hits': 1})
+            else:
+                best['boxes'].append(box)
+                best['hits'] += 1
+
+    def _finalize(self):
+        fixtures = {}
+        for cls in FIXTURE_CLASSES:
+            frames = self._frames[cls]
+            if not frames:
+                continue
+            stable = [
+                np.median(np.stack(c['boxes']), axis=0)
+                for c in self._clusters[cls]
+                if c['hits'] >= self.min_presence * frames
+            ]
+            if stable:
+                fixtures[cls] = [_fixture(box) for box in stable]
+        self.fixtures = fixtures
+        self._clusters = {cls: [] for cls in FIXTURE_CLASSES}
+        print(f"✓ Static scene learned: {self._describe()}")
+        self.save()
+
+    def save(self):
+        """Merge this camera's scene into the cache file (atomic replace)"""
+        try:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    scenes = json.load(f)
+            except (FileNotFoundError, ValueError):
+                scenes = {}
+            scenes[self.camera] = {
+                'frame_size': self.frame_size,
+                'learned_at': time.time(),
+                'fixtures': {
+                    cls: [[round(float(v), 1) for v in det['box']] for det in dets]
+                    for cls, dets in self.fixtures.items()
+                }
+            }
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(scenes, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"✗ Error writing static scene cache: {e}")
+
+    def _describe(self):
+        return ", ".join(f"{len(self.fixtures.get(cls, []))} {cls}" for cls in FIXTURE_CLASSES)
+
+
+def _fixture(box):
+    """Detection-shaped fixture with its center precomputed once"""
+    box = np.asarray(box, dtype=np.float32)
+    return {'box': box, 'conf': 1.0, 'track_id': None, 'center': get_center(box), 'static': True}
@@ -0,0 +1,130 @@
+import itertools
+import numpy as np
+from app.helper_functions import CLASS_NAMES, get_box_iou, get_center, result_detections, predict_frame
+from app.variables import CONF_THRESHOLD
+
+TRACKING_MODES = ("tracker", "iou", "none")
+
+# Ids handed out outside the model's tracker are negative, from one sequence for the
+# whole process, so they never collide with tracker ids or with each other
+_local_ids = itertools.count(-1, -1)
+
+
+class IoUTracker:
+    """Cheap frame-to-frame association: greedy IoU matching against the boxes of
+    the previous update. Ids survive up to max_missed updates without a match."""
+
+    def __init__(self, match_iou=0.3, max_missed=5):
+        self.match_iou = match_iou
+        self.max_missed = max_missed
+        self.tracks = []  # [{'id', 'box', 'missed'}]
+
+    def update(self, dets):
+        """Set 'track_id' on each detection dict"""
+        unmatched = list(self.tracks)
+        for det in sorted(dets, key=lambda d: -d['conf']):
+            best, best_iou = None, self.match_iou
+            for track in unmatched:
+                iou = get_box_iou(det['box'], track['box'])
+                if iou >= best_iou:
+                    best, best_iou = track, iou
+            if best is None:
+                best = {'id': next(_local_ids)}
+                self.tracks.append(best)
+            else:
+                unmatched.remove(best)
+            best['box'] = np.asarray(det['box'])
+            best['missed'] = 0
+            det['track_id'] = best['id']
+        for track in unmatched:
+            track['missed'] += 1
+        self.tracks = [t for t in self.tracks if t['missed'] <= self.max_missed]
+
+
+def _load_tracker(config, frame_rate=30):
+    """An ultralytics BYTETracker/BOTSORT built from a tracker YAML (name or path),
+    the same way model.track() builds its own"""
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import IterableSimpleNamespace
+    from ultralytics.utils.checks import check_yaml
+    try:
+        from ultralytics.utils import YAML
+        cfg = YAML.load(check_yaml(config))
+    except ImportError:
+        from ultralytics.utils import yaml_load
+        cfg = yaml_load(check_yaml(config))
+    cfg = IterableSimpleNamespace(**cfg)
+    if cfg.tracker_type not in TRACKER_MAP:
+        raise ValueError(f"Unsupported tracker_type '{cfg.tracker_type}' in {config}")
+    return TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=frame_rate)
+
+
+class DetectionTracker:
+    """Detector pass plus a per-class tracking policy.
+
+    policy maps class name -> "tracker" (the ultralytics tracker from
+    tracker_config, e.g. "bytetrack.yaml", "botsort.yaml" or a tuned copy),
+    "iou" (IoUTracker, for boxes that barely move between frames) or "none"
+    (track_id None, for fixtures). Tracker cost grows with the number of boxes it
+    is fed, so only the "tracker" classes are passed to it. When every class uses
+    the tracker this is exactly model.track(persist=True).
+    """
+
+    def __init__(self, model, policy, tracker_config="botsort.yaml", conf=CONF_THRESHOLD):
+        unknown = set(policy.values()) - set(TRACKING_MODES)
+        if unknown:
+            raise ValueError(f"Tracking modes must be one of {TRACKING_MODES}, got {sorted(unknown)}")
+        self.model = model
+        self.conf = conf
+        self.tracker_config = tracker_config
+        # Classes missing from the policy keep the full tracker
+        self.policy = {name: policy.get(name, "tracker") for name in CLASS_NAMES.values()}
+        self.full_tracking = all(mode == "tracker" for mode in self.policy.values())
+        self.tracked_ids = np.array(
+            [cid for cid, name in CLASS_NAMES.items() if self.policy[name] == "tracker"], dtype=int
+        )
+        self.iou_trackers = {name: IoUTracker() for name, mode in self.policy.items() if mode == "iou"}
+        self.tracker = None  # built on first use (needs ultralytics)
+
+    def __call__(self, frame, imgsz=None):
+        if self.full_tracking:
+            return predict_frame(self.model, frame, imgsz, tracker=self.tracker_config)
+
+        kwargs = {'imgsz': imgsz} if imgsz else {}
+        result = self.model.predict(frame, conf=self.conf, verbose=False, **kwargs)[0]
+        detections = result_detections(result)
+        if self.tracked_ids.size:
+            self._track(result, frame, detections)
+        for name, iou_tracker in self.iou_trackers.items():
+            iou_tracker.update(detections[name])
+        return detections
+
+    def _track(self, result, frame, detections):
+        """Run the ultralytics tracker on the "tracker" classes only and replace their
+        detections with its confirmed tracks (as model.track() does)"""
+        for name, mode in self.policy.items():
+            if mode == "tracker":
+                detections[name] = []
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            det = None
+        else:
+            det = boxes.cpu().numpy()
+            det = det[np.isin(det.cls.astype(int), self.tracked_ids)]
+        if det is None or len(det) == 0:
+            # model.track() skips the tracker update on frames without detections too
+            return
+        if self.tracker is None:
+            self.tracker = _load_tracker(self.tracker_config)
+        tracks = self.tracker.update(det, frame)
+        # Rows: x1, y1, x2, y2, track_id, score, cls, detection index
+        for row in tracks:
+            box = np.asarray(row[:4], dtype=np.float32)
+            name = CLASS_NAMES.get(int(row[6]), 'unknown')
+            detections[name].append({
+                'box': box,
+                'conf': float(row[5]),
+                'track_id': int(row[4]),
+                'center': get_center(box)
+            })
+
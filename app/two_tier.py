@@ -0,0 +1,106 @@
+import numpy as np
+from app.helper_functions import CLASS_NAMES, result_detections, get_box_iou
+from app.tracking import IoUTracker
+from app.variables import CONF_THRESHOLD
+
+MAX_CROP_FRACTION = 0.5  # a region this large is no closer than the full-frame pass; skip it
+
+
+class TwoTierDetector:
+    """High-resolution second pass for small objects, run only around the action.
+
+    After the fast full-frame pass, regions around roi_classes boxes (the
+    scanner, and the people whose hands hold cash, phones and items) are padded,
+    merged where they overlap, and cropped. The crops are run as one batch at
+    crop_imgsz, so a note or phone covering a few pixels of the wide view is seen
+    at several times its size. Only target_classes are kept from the crops. A box
+    that overlaps a first-pass box of its class by merge_iou or more is dropped.
+    The remaining boxes get ids from an IoUTracker per class (negative, so they
+    never collide with tracker ids), so the analytics can follow them across frames.
+    Crops use predict(), never track(), so the tracker state stays tied to the
+    full frames.
+    """
+
+    def __init__(self, model, roi_classes, target_classes, crop_imgsz=640, margin=0.5, min_crop=160,
+                 max_crops=4, merge_iou=0.5, conf=CONF_THRESHOLD, match_iou=0.3, max_missed=5):
+        self.model = model
+        self.roi_classes = tuple(roi_classes)
+        self.target_classes = tuple(target_classes)
+        self.class_ids = [cid for cid, name in CLASS_NAMES.items() if name in self.target_classes]
+        self.crop_imgsz = crop_imgsz
+        self.margin = margin      # padding on each side, as a fraction of the ROI box size
+        self.min_crop = min_crop  # px; tiny ROIs are grown to at least this size
+        self.max_crops = max_crops
+        self.merge_iou = merge_iou
+        self.conf = conf
+        # max_missed: refine() calls an unmatched id is kept for
+        self._trackers = {cls: IoUTracker(match_iou, max_missed) for cls in self.target_classes}
+
+    def regions(self, detections, frame_shape):
+        """Merged crop rectangles (x1, y1, x2, y2) around the ROI detections"""
+        height, width = frame_shape[:2]
+        rects = []
+        for cls in self.roi_classes:
+            for det in detections.get(cls, []):
+                x1, y1, x2, y2 = (float(v) for v in det['box'][:4])
+                pad_x = max((x2 - x1) * self.margin, (self.min_crop - (x2 - x1)) / 2, 0)
+                pad_y = max((y2 - y1) * self.margin, (self.min_crop - (y2 - y1)) / 2, 0)
+                rects.append([
+                    max(0, int(x1 - pad_x)), max(0, int(y1 - pad_y)),
+                    min(width, int(x2 + pad_x)), min(height, int(y2 + pad_y))
+                ])
+
+        # Union overlapping rectangles until none overlap (keeps ROI class priority order)
+        merged = []
+        for rect in rects:
+            while True:
+                for other in merged:
+                    if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                        merged.remove(other)
+                        rect = [min(rect[0], other[0]), min(rect[1], other[1]),
+                                max(rect[2], other[2]), max(rect[3], other[3])]
+                        break
+                else:
+                    break
+            merged.append(rect)
+
+        limit = MAX_CROP_FRACTION * width * height
+        crops = [tuple(r) for r in merged if r[2] > r[0] and r[3] > r[1] and (r[2] - r[0]) * (r[3] - r[1]) <= limit]
+        return crops[:self.max_crops]
+
+    def refine(self, frame, detections):
+        """Add second-pass detections to detections in place; returns how many were added"""
+        crops = self.regions(detections, frame.shape)
+        found = {cls: [] for cls in self.target_classes}
+        if crops:
+            results = self.model.predict(
+                [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in crops],
+                imgsz=self.crop_imgsz,
+                conf=self.conf,
+                classes=self.class_ids,
+                verbose=False
+            )
+            for (x1, y1, _, _), result in zip(crops, results):
+                for cls, dets in result_detections(result, offset=(x1, y1)).items():
+                    if cls in found:
+                        found[cls].extend(dets)
+
+        added = 0
+        for cls in self.target_classes:
+            existing = detections.setdefault(cls, [])
+            new = []
+            for det in sorted(found[cls], key=lambda d: -d['conf']):
+                # Seen by the first pass, or by an overlapping crop already
+                if any(get_box_iou(det['box'], other['box']) >= self.merge_iou for other in existing + new):
+                    continue
+                det['refined'] = True
+                new.append(det)
+            self._trackers[cls].update(new)
+            existing.extend(new)
+            added += len(new)
+        return added
+
+    def warmup(self, shape):
+        """One crop-sized inference so the second pass doesn't pay first-call costs mid-sale"""
+        crop = np.zeros((min(shape[0], self.min_crop), min(shape[1], self.min_crop), 3), dtype=np.uint8)
+        self.model.predict([crop], imgsz=self.crop_imgsz, conf=self.conf, classes=self.class_ids, verbose=False)
@@ -6,8 +6,29 @@ CUSTOMER_DWELL_TIME=3.0
 SCANNER_PHONE_DISTANCE=80
 SCANNER_ITEM_DISTANCE=100
 SCANNER_MOVEMENT_THRESHOLD=3
+SCANNER_SPEED_THRESHOLD=SCANNER_MOVEMENT_THRESHOLD * 25.0   # px/s; 3 px per frame at the old fixed 25 fps
+SCANNER_MOTION_MODE="flow"             # "flow" (optical flow in the scanner box) or "displacement" (box center)
+SALE_TARGET_FPS=25                     # Processing fps during a sale; speed-based scan detection tolerates lower values
+RECORD_OUTPUT_DIR=r"E:\IGS_record"      # Sale clips are recorded and kept here (temp files on the same disk)
+RECORD_SEGMENT_SECONDS=60.0            # Record in self-contained segments of this length (0 = one file per sale)
+RECORD_MAX_BYTES=200 * 1024**3         # Disk quota for RECORD_OUTPUT_DIR; oldest clips are deleted beyond it
+RECORD_MAX_AGE=30 * 86400.0            # Delete clips older than this (seconds)
+RECORD_RETENTION_INTERVAL=600.0        # Seconds between retention sweeps
+EVIDENCE_MODE="video"                  # Sale evidence: "video" (clip), "snapshots" (JPEG stills of key events,
+                                       # no video encoding at all) or "both"
+EVIDENCE_EVENT_TYPES=("item_scanned", "payment_started", "payment_complete", "cash_detected",
+                      "staff_primary", "staff_secondary")   # Event types that trigger a snapshot
+EVIDENCE_JPEG_QUALITY=80
+EVIDENCE_MAX_SIZE=640                  # Longest side of a stored snapshot (px)
+EVIDENCE_MARGIN=0.25                   # Padding around the event's objects, as a fraction of the crop
+EVIDENCE_COOLDOWN=1.0                  # Min stream seconds between snapshots of the same event type
+EVIDENCE_MAX_SNAPSHOTS=200             # Per sale
 SCAN_COOLDOWN=1.5
 PAYMENT_COMPLETE_TIME=1.0
+CASH_INTERACTION_GAP=1.0               # Seconds without cash/customer overlap before a cash interaction ends
+SPATIAL_INDEX_MIN_OBJECTS=8            # Per-frame spatial index for the analytics rules; classes with at most
+                                       # this many boxes are scanned directly (cheaper)
+CLOCK_MODE="auto"                      # Frame timestamps: "pts" (stream time), "monotonic" (capture time) or "auto"
 
 STAFF_REENTRY_THRESHOLD=4              # Need 4+ re-entries within recent window (was 3)
 REENTRY_WINDOW=600.0                   # 10-minute window for counting recent re-entries (was 1 hour)
@@ -19,4 +40,116 @@ STAFF_TIME_MIN_SESSIONS=3               # Must have at least 3 visits
 # Confidence scoring for secondary staff
 STAFF_CONFIDENCE_THRESHOLD=0.65         # Min confidence (0-1) to classify as secondary staff
 RECENT_BEHAVIOR_WINDOW=1800.0           # 30 minutes - window for evaluating recent behavior
-CONFIDENCE_DECAY_RATE=0.98              # Confidence decays at 2% per check (slower decay for single-day)
\ No newline at end of file
+CONFIDENCE_DECAY_RATE=0.98              # Confidence decays at 2% per check (slower decay for single-day)
+
+# Shift-long person tracking (survives per-sale analytics resets)
+PERSON_RECORD_TTL=43200.0               # Forget people not seen for 12 hours
+PERSON_SNAPSHOT_PATH="data/person_tracker.json"
+PERSON_SNAPSHOT_INTERVAL=60.0           # Seconds between compact snapshots
+PERSON_SNAPSHOT_MAX_AGE=3600.0          # Only warm-start from a snapshot younger than this
+
+# Appearance re-identification (link a new track id to a person who left and came back)
+REID_ENABLED=True
+REID_SIMILARITY_THRESHOLD=0.85          # Min cosine similarity of HSV histograms to call it the same person
+REID_WINDOW=REENTRY_WINDOW              # Signatures older than this are evicted
+REID_REFRESH_INTERVAL=2.0               # Seconds between signature refreshes for people in view
+REID_INDEX_CAPACITY=512                 # Max signatures kept
+
+# Capture / decoding
+CAPTURE_BACKEND="ffmpeg"               # "ffmpeg", "gstreamer" or "any" (OpenCV default)
+FFMPEG_CAPTURE_OPTIONS={               # Passed to the FFmpeg demuxer/decoder for every capture
+    "rtsp_transport": "tcp",           # No UDP packet loss / smearing on busy store networks
+    "fflags": "nobuffer",              # Don't build up a demuxer backlog
+    "flags": "low_delay",
+    "max_delay": "500000",             # Microseconds
+}
+DECODE_THREADS=2                       # Decoder threads per camera (0 = one per core)
+INFERENCE_STREAM_PATH=""               # Camera substream (e.g. 640x360) for inference; "" uses VIDEO_PATH
+RECORDING_SOURCE="inference"           # "inference": record the annotated inference frames
+                                       # "mainstream": record VIDEO_PATH at full resolution, opened only during sales
+FRAME_TRANSPORT="inline"               # "inline": decode, inference and encoding in one process
+                                       # "shared_memory": capture and encoder processes, frames passed by slot index
+FRAME_POOL_SLOTS=8                     # Shared frame slots (frames in flight between processes)
+PIPELINE_QUEUE_SIZE=0                  # >0: run analytics/render/recording on a second thread, overlapping
+                                       # inference of the next frame (frames queued between stages); 0 = serial
+SESSION_CLOSE_WARN_INTERVAL=5.0        # close_sale() waits for the closed sale's frames; warn this often (s)
+SESSION_CLOSE_TIMEOUT=120.0            # ...and gives up after this long (keep below the stop_sale IPC timeout)
+
+# Recording profiles: resolution, frame rate and codec of the sale clips, independent
+# of the analyzed stream. "width" downscales to that width (None = source size), "fps"
+# decimates to roughly that rate using analyzed frames only (None = every frame),
+# "quality" (0-100) is passed to encoders that support it (e.g. MJPG)
+RECORDING_PROFILES={
+    "full":   {"width": None, "fps": None, "codec": "mp4v", "quality": None},
+    "review": {"width": 960,  "fps": 10,   "codec": "mp4v", "quality": None},
+    "low":    {"width": 640,  "fps": 5,    "codec": "mp4v", "quality": None},
+}
+RECORDING_PROFILE="full"               # Profile for cameras not listed below
+CAMERA_RECORDING_PROFILES={}           # Camera URL -> profile name, e.g. {"rtsp://10.0.0.21/stream1": "review"}
+
+# Tracking: per-class policy. "tracker" = the ultralytics tracker from TRACKER_CONFIG,
+# "iou" = cheap IoU association between frames, "none" = no track ids (fixtures)
+TRACKER_CONFIG="botsort.yaml"          # "botsort.yaml", "bytetrack.yaml" or a path to a tuned tracker YAML
+TRACKING_POLICY={
+    "cashier": "tracker",
+    "customer": "tracker",
+    "phone": "tracker",
+    "scanner": "tracker",
+    "cash": "tracker",
+    "item": "iou",
+    "counter": "none",
+}
+
+# Two-tier inference: fast full-frame pass at TWO_TIER_BASE_IMGSZ, then one batched
+# high-resolution pass over crops around scanners and people for small objects
+TWO_TIER_ENABLED=False
+TWO_TIER_BASE_IMGSZ=640                # Full-frame input size (None = the model's own)
+TWO_TIER_CROP_IMGSZ=640                # Input size each crop is resized to
+TWO_TIER_ROI_CLASSES=("scanner", "cashier", "customer")   # Crops are centered on these, in priority order
+TWO_TIER_TARGET_CLASSES=("cash", "phone", "item")         # Classes kept from the crop pass
+TWO_TIER_MARGIN=0.5                    # Crop padding per side, as a fraction of the ROI box size
+TWO_TIER_MAX_CROPS=4                   # Crops per keyframe (after merging overlapping ones)
+
+# Keyframe detection: run the detector on every Nth processed frame and propagate
+# tracked boxes in between (1 = detect on every processed frame)
+KEYFRAME_INTERVAL=1
+PROPAGATION_MODE="flow"                # "flow" (sparse optical flow) or "velocity" (constant velocity)
+
+# Static scene: fixture geometry (counter, scanner cradle) learned once per camera
+STATIC_SCENE_ENABLED=True
+STATIC_SCENE_PATH="data/static_scene.json"
+STATIC_SCENE_WARMUP=30.0               # Seconds of stream time observed before fixtures are fixed
+STATIC_SCENE_MIN_PRESENCE=0.6          # Fraction of warm-up frames a location must be seen in
+STATIC_SCENE_MAX_AGE=604800.0          # Re-learn a stored scene after 7 days (camera may have moved)
+
+# Video source supervision (reconnect on stall / EOF)
+STREAM_OPEN_TIMEOUT=10.0               # Seconds to wait for the stream to open
+STREAM_READ_TIMEOUT=5.0                # Seconds without a frame before a read counts as failed (stall)
+MAX_READ_FAILURES=3                    # Consecutive failed reads before reconnecting
+RECONNECT_BASE_DELAY=1.0               # First reconnect backoff (seconds), doubled per attempt
+RECONNECT_MAX_DELAY=30.0               # Backoff cap (seconds)
+
+# Serving: "inprocess" runs the Prediction loop inside the Flask process (python main.py);
+# "worker" runs it in worker.py and the web processes talk to it over local IPC
+SERVING_MODE="inprocess"
+INFERENCE_WORKER_ADDRESS=("127.0.0.1", 6001)
+INFERENCE_WORKER_AUTHKEY_ENV="ERKE_WORKER_AUTHKEY"    # IPC shared secret from this environment variable, or else
+INFERENCE_WORKER_AUTHKEY_FILE="data/worker_authkey"   # from this file (created with a random key by worker.py)
+INFERENCE_WORKER_TIMEOUT=30.0          # Seconds a web request waits for the worker
+INFERENCE_WORKER_METHOD_TIMEOUTS={"stop_sale": 180.0}   # Slower calls: finalizing a clip can take a while
+STOP_SALE_REPLAY_WINDOW=600.0          # A repeated /stop_prediction for a voucher this recent returns the first result
+MODEL_WARMUP_RUNS=2                    # Blank-frame inferences before the worker reports ready
+
+# Analytics event stream (/events)
+EVENT_STREAM_QUEUE_SIZE=256            # Per-client buffer; oldest events are dropped for slow clients
+EVENT_STREAM_MAX_CLIENTS=16
+EVENT_STREAM_KEEPALIVE=15.0            # Seconds between SSE keep-alive comments
+
+# Local sale / event history (SQLite, WAL mode)
+EVENT_STORE_PATH="data/erke_events.db"
+EVENT_STORE_BATCH_SIZE=200             # Max rows committed per transaction
+EVENT_STORE_FLUSH_INTERVAL=1.0         # Seconds the writer waits for new rows
+
+# Runtime profiling (/profile endpoint)
+PROFILE_OUTPUT_DIR="profiles"          # Where profiling reports are written
+PROFILE_MAX_DURATION=300.0             # Upper bound (seconds) for one profiling session
@@ -0,0 +1,149 @@
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+import cv2
+
+LIVE_PREFIXES = ("rtsp://", "rtsps://", "rtmp://", "http://", "https://", "udp://", "tcp://")
+CLOCK_MODES = ("auto", "pts", "monotonic")
+CAPTURE_BACKENDS = {"any": "CAP_ANY", "ffmpeg": "CAP_FFMPEG", "gstreamer": "CAP_GSTREAMER"}
+
+# OPENCV_FFMPEG_CAPTURE_OPTIONS is read from the environment when a capture opens,
+# so concurrent opens with different options must not interleave
+_ffmpeg_env_lock = threading.Lock()
+
+
+def is_live_source(path):
+    """RTSP/HTTP/camera-index sources have no meaningful frame count or seek position"""
+    if isinstance(path, int) or str(path).isdigit():
+        return True
+    return str(path).lower().startswith(LIVE_PREFIXES)
+
+
+def camera_key(path):
+    """Stable per-camera key: host and stream path, without credentials or query"""
+    parts = urlsplit(str(path))
+    if parts.scheme and parts.netloc:
+        host = parts.netloc.rsplit('@', 1)[-1]
+        return f"{parts.scheme}://{host}{parts.path}"
+    return os.path.abspath(str(path))
+
+
+def format_ffmpeg_options(options):
+    """Render options in OpenCV's "key;value|key;value" env format"""
+    return "|".join(f"{key};{value}" for key, value in options.items())
+
+
+def open_capture(path, open_timeout=None, read_timeout=None, backend="any", ffmpeg_options=None, decode_threads=0):
+    """Open a VideoCapture with a chosen backend and decoder options.
+
+    Open/read timeouts are bounded so a stalled camera surfaces as a failed read
+    instead of blocking the prediction loop forever. ffmpeg_options are passed to
+    the FFmpeg demuxer/decoder (e.g. TCP transport, low-delay flags, lowres) and
+    decode_threads caps the decoder's thread pool so several cameras can share a box.
+    """
+    if backend not in CAPTURE_BACKENDS:
+        raise ValueError(f"capture backend must be one of {tuple(CAPTURE_BACKENDS)}")
+    api = getattr(cv2, CAPTURE_BACKENDS[backend], cv2.CAP_ANY)
+
+    options = dict(ffmpeg_options or {})
+    params = []
+    if open_timeout and hasattr(cv2, "CAP_PROP_OPEN_TIMEOUT_MSEC"):
+        params += [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(open_timeout * 1000)]
+    if read_timeout and hasattr(cv2, "CAP_PROP_READ_TIMEOUT_MSEC"):
+        params += [cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(read_timeout * 1000)]
+    if decode_threads:
+        if hasattr(cv2, "CAP_PROP_N_THREADS"):
+            params += [cv2.CAP_PROP_N_THREADS, int(decode_threads)]
+        else:
+            options.setdefault("threads", str(decode_threads))
+
+    use_ffmpeg_options = options and backend in ("any", "ffmpeg") and not isinstance(path, int)
+    with _ffmpeg_env_lock:
+        previous = os.environ.get("OPENCV_FFMPEG_CAPTURE_OPTIONS")
+        if use_ffmpeg_options:
+            os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = format_ffmpeg_options(options)
+        try:
+            if params:
+                return cv2.VideoCapture(path, api, params)
+            return cv2.VideoCapture(path, api)
+        finally:
+            if use_ffmpeg_options:
+                if previous is None:
+                    os.environ.pop("OPENCV_FFMPEG_CAPTURE_OPTIONS", None)
+                else:
+                    os.environ["OPENCV_FFMPEG_CAPTURE_OPTIONS"] = previous
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0):
+    """Exponential backoff with jitter (50-100% of the capped delay) so several
+    counters behind the same NVR don't reconnect in lockstep"""
+    delay = min(max_delay, base_delay * (2 ** attempt))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def read_stream_metadata(cap, path, fallback_fps=25):
+    """Query static stream properties once per (re)connect instead of on every frame"""
+    live = is_live_source(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0
+    # Some RTSP cameras report 90000 (the RTP clock) or 0 here
+    if fps <= 0 or fps > 240:
+        fps = fallback_fps
+    return {
+        "fps": fps,
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "total_frames": 0 if live else int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        "live": live
+    }
+
+
+class FrameClock:
+    """Produces per-frame timestamps (seconds) for the analytics timing rules.
+
+    - "pts": stream presentation timestamp (CAP_PROP_POS_MSEC), exact for files and
+      unaffected by how many frames we skip; falls back to frame index / fps when the
+      backend reports no PTS.
+    - "monotonic": time.monotonic() at capture, for live streams where frame indices
+      and PTS are unreliable and dropped frames must still advance time.
+    - "auto": "pts" for files, "monotonic" for live sources.
+
+    Timestamps never go backwards: if the source restarts (reconnect, PTS wrap) an
+    offset is applied so cooldown / dwell logic keeps working.
+    """
+
+    def __init__(self, metadata, mode="auto"):
+        if mode not in CLOCK_MODES:
+            raise ValueError(f"clock mode must be one of {CLOCK_MODES}")
+        if mode == "auto":
+            mode = "monotonic" if metadata["live"] else "pts"
+        self.mode = mode
+        self.metadata = metadata
+        self.frame_interval = 1.0 / metadata["fps"]
+        self.frame_index = 0
+        self._origin = time.monotonic()
+        self._offset = 0.0
+        self._last = None
+
+    def update_metadata(self, metadata):
+        """Adopt new stream properties after a reconnect without resetting time"""
+        self.metadata = metadata
+        self.frame_interval = 1.0 / metadata["fps"]
+
+    def stamp(self, cap):
+        """Timestamp for the frame just grabbed from cap"""
+        self.frame_index += 1
+        if self.mode == "monotonic":
+            raw = time.monotonic() - self._origin
+        else:
+            pts_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
+            raw = pts_ms / 1000.0 if pts_ms and pts_ms > 0 else self.frame_index * self.frame_interval
+
+        current = raw + self._offset
+        if self._last is not None and current < self._last:
+            # Source restarted: continue from where we were
+            self._offset += self._last - current + self.frame_interval
+            current = self._last + self.frame_interval
+        self._last = current
+        return current
@@ -0,0 +1,92 @@
+"""Steady-state per-frame allocation benchmark for the capture/recording path.
+
+Compares the old read path (cap.read() into a fresh array, frame.copy() before
+VideoWriter.write) with the pooled one (decode into a FrameBufferPool buffer,
+write the frame as is). numpy and OpenCV report array allocations to
+tracemalloc, so for every measured frame we record the peak traced memory
+above the level before the frame, also expressed in frame-sized arrays.
+
+Usage: python benchmark_allocations.py [video_path] [frames]
+Without a video path a synthetic 1080p clip is generated in the temp folder.
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+import cv2
+import numpy as np
+from app.buffer_pool import FrameBufferPool
+from app.helper_functions import preprocess_frame
+from app.video_source import FrameClock, read_stream_metadata
+
+WIDTH, HEIGHT, FPS = 1920, 1080, 25
+WARMUP_FRAMES = 20
+MEASURED_FRAMES = 100
+
+
+def make_synthetic_video(path, frames):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (WIDTH, HEIGHT))
+    base = np.random.default_rng(0).integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for i in range(frames):
+        writer.write(np.roll(base, i * 4, axis=1))
+    writer.release()
+
+
+def run(video_path, frames, pooled):
+    cap = cv2.VideoCapture(video_path)
+    meta = read_stream_metadata(cap, video_path)
+    clock = FrameClock(meta)
+    pool = FrameBufferPool((meta["height"], meta["width"], 3), 3)
+    writer_path = os.path.join(tempfile.gettempdir(), f"alloc_bench_{'pooled' if pooled else 'baseline'}.avi")
+    writer = cv2.VideoWriter(writer_path, cv2.VideoWriter_fourcc(*"MJPG"), meta["fps"], (meta["width"], meta["height"]))
+
+    def step():
+        buf = pool.acquire() if pooled else None
+        frame, frame_meta = preprocess_frame(cap, clock, out=buf)
+        if frame_meta is None:
+            return False
+        if pooled:
+            writer.write(frame)
+            pool.release(frame)
+        else:
+            frame_copy = frame.copy()
+            writer.write(frame_copy)
+        return True
+
+    for _ in range(WARMUP_FRAMES):
+        step()
+
+    tracemalloc.start()
+    allocated = []
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        if not step():
+            break
+        _, peak = tracemalloc.get_traced_memory()
+        allocated.append(peak - start)
+    tracemalloc.stop()
+
+    cap.release()
+    writer.release()
+    os.remove(writer_path)
+    return np.array(allocated), meta["width"] * meta["height"] * 3
+
+
+def report(name, allocated, frame_bytes):
+    print(f"{name:>9}: {len(allocated)} frames, "
+          f"allocated/frame median {np.median(allocated) / 1e6:.2f} MB (max {allocated.max() / 1e6:.2f} MB), "
+          f"= {np.median(allocated) / frame_bytes:.2f} frame-sized arrays")
+
+
+if __name__ == "__main__":
+    video_path = sys.argv[1] if len(sys.argv) > 1 else None
+    frames = int(sys.argv[2]) if len(sys.argv) > 2 else MEASURED_FRAMES
+    if video_path is None:
+        video_path = os.path.join(tempfile.gettempdir(), "alloc_bench_input.avi")
+        if not os.path.exists(video_path):
+            print(f"Generating synthetic {WIDTH}x{HEIGHT} clip: {video_path}")
+            make_synthetic_video(video_path, WARMUP_FRAMES + frames + 5)
+
+    report("baseline", *run(video_path, frames, pooled=False))
+    report("pooled", *run(video_path, frames, pooled=True))
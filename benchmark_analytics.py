@@ -0,0 +1,84 @@
+"""Per-frame cost of the pairwise analytics rules in crowded scenes.
+
+Runs the same synthetic frames (a queue of customers, their items, cash and
+phones at a counter) through the rules twice: with a full scan of every object
+pair (index=None) and with the per-frame SpatialIndex that analytics_step builds.
+The events of both runs are compared, so the index is checked to decide
+exactly like the scan.
+
+Usage: python benchmark_analytics.py [frames]
+"""
+import sys
+import time
+import numpy as np
+from app.helper_functions import get_center
+from app.retail_analytics import RetailAnalytics
+from app.spatial_index import SpatialIndex
+
+WIDTH, HEIGHT = 1920, 1080
+CROWD_SIZES = (5, 20, 50, 100, 200)
+FRAMES = 200
+
+
+def make_detection(rng, x, y, w, h, track_id):
+    box = np.array([x, y, x + w, y + h], dtype=np.float32)
+    return {'box': box, 'conf': 0.9, 'track_id': track_id, 'center': get_center(box)}
+
+
+def make_frames(customers, frames, seed=0):
+    """Customers shuffle along the frame; everyone carries items, some hold cash or a phone"""
+    rng = np.random.default_rng(seed)
+    xs = rng.uniform(0, WIDTH - 120, customers)
+    ys = rng.uniform(0, HEIGHT - 300, customers)
+    scenes = []
+    for f in range(frames):
+        xs = np.clip(xs + rng.normal(0, 4, customers), 0, WIDTH - 120)
+        dets = {'customer': [], 'item': [], 'cash': [], 'phone': [], 'scanner': [], 'counter': [], 'cashier': []}
+        for i in range(customers):
+            dets['customer'].append(make_detection(rng, xs[i], ys[i], 120, 300, i + 1))
+            for k in range(3):
+                dets['item'].append(make_detection(rng, xs[i] + 20 * k, ys[i] + 200, 30, 30, 1000 + i * 3 + k))
+            if i % 4 == 0:
+                dets['cash'].append(make_detection(rng, xs[i] + 60, ys[i] + 120, 25, 15, 5000 + i))
+            if i % 5 == 0:
+                dets['phone'].append(make_detection(rng, xs[i] + 40, ys[i] + 100, 20, 40, 6000 + i))
+        for s in range(3):
+            sx = 400 + 500 * s + 60 * np.sin(f / 3 + s)
+            dets['scanner'].append(make_detection(rng, sx, 800, 60, 60, 9000 + s))
+            dets['counter'].append(make_detection(rng, 300 + 500 * s, 750, 400, 250, None))
+        scenes.append(dets)
+    return scenes
+
+
+def run_rules(analytics, dets, t, index):
+    status = analytics.update_scanner_movement(dets['scanner'], t)
+    events = analytics.update_item_scanning(dets['item'], dets['scanner'], status, t, index)
+    events += analytics.update_payment_scanning(dets['phone'], dets['scanner'], t, index)
+    events += analytics.detect_cash(dets['cash'], dets['customer'], t, index)
+    events += analytics.update_customer_at_counter(dets['customer'], dets['counter'], t, index)
+    return events
+
+
+def run(scenes, indexed):
+    analytics = RetailAnalytics()
+    events = []
+    elapsed = 0.0
+    for f, dets in enumerate(scenes):
+        t = f / 25
+        t0 = time.perf_counter()
+        index = SpatialIndex(dets) if indexed else None
+        events.append(run_rules(analytics, dets, t, index))
+        elapsed += time.perf_counter() - t0
+    return events, elapsed / len(scenes)
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else FRAMES
+    for customers in CROWD_SIZES:
+        scenes = make_frames(customers, frames)
+        scan_events, scan_time = run(scenes, indexed=False)
+        index_events, index_time = run(scenes, indexed=True)
+        objects = sum(len(d) for d in scenes[0].values())
+        print(f"{customers:>4} customers ({objects} boxes): scan {scan_time * 1e3:.2f} ms/frame, "
+              f"index {index_time * 1e3:.2f} ms/frame ({scan_time / index_time:.1f}x), "
+              f"events identical: {scan_events == index_events}")
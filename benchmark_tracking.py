@@ -0,0 +1,71 @@
+"""Per-frame detect + track cost under different tracking policies.
+
+Runs the same video frames through DetectionTracker once per policy: every
+class on the full tracker (what model.track() did for all seven classes), the
+configured TRACKING_POLICY, and people only on the tracker. Each policy gets a
+fresh model so no tracker state carries over. Reported are the mean and p95
+ms/frame and the boxes handed to the tracker per frame, since tracker cost
+grows with that count. The first frames are skipped as warm-up.
+
+Usage: python benchmark_tracking.py model video [frames] [tracker_config]
+"""
+import sys
+import time
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from app.tracking import DetectionTracker
+from app.variables import TRACKING_POLICY, TRACKER_CONFIG
+
+FRAMES = 300
+WARMUP_FRAMES = 10
+POLICIES = {
+    "all tracker": {},
+    "configured": TRACKING_POLICY,
+    "people only": {
+        "cashier": "tracker", "customer": "tracker", "scanner": "iou", "phone": "iou",
+        "cash": "iou", "item": "iou", "counter": "none"
+    },
+}
+
+
+def read_frames(video, frames):
+    cap = cv2.VideoCapture(video)
+    out = []
+    while len(out) < frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        out.append(frame)
+    cap.release()
+    return out
+
+
+def run(model_path, frames, policy, tracker_config):
+    detector = DetectionTracker(YOLO(model_path), policy, tracker_config)
+    times, tracked = [], []
+    for i, frame in enumerate(frames):
+        t0 = time.perf_counter()
+        detections = detector(frame)
+        elapsed = time.perf_counter() - t0
+        if i >= WARMUP_FRAMES:
+            times.append(elapsed)
+            tracked.append(sum(len(dets) for cls, dets in detections.items() if detector.policy.get(cls) == "tracker"))
+    return np.array(times) * 1e3, float(np.mean(tracked))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        sys.exit(__doc__)
+    model_path, video = sys.argv[1], sys.argv[2]
+    frames = read_frames(video, int(sys.argv[3]) if len(sys.argv) > 3 else FRAMES)
+    tracker_config = sys.argv[4] if len(sys.argv) > 4 else TRACKER_CONFIG
+    if len(frames) <= WARMUP_FRAMES:
+        sys.exit(f"✗ Need more than {WARMUP_FRAMES} frames from {video}")
+    baseline = None
+    for name, policy in POLICIES.items():
+        times, tracked = run(model_path, frames, policy, tracker_config)
+        mean = times.mean()
+        baseline = baseline or mean
+        print(f"{name:>12} ({tracker_config}): {mean:.2f} ms/frame, p95 {np.percentile(times, 95):.2f} ms, "
+              f"{tracked:.1f} tracked boxes/frame ({baseline / mean:.2f}x)")
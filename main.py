@@ -1,22 +1,51 @@
-from pipeline import Prediction
-from app.variables import MODEL_PATH, VIDEO_PATH
-from app.retail_analytics import RetailAnalytics
-from flask import Flask, request, jsonify
-import os
-import re
+from app.sale_service import SaleService
+from app.sale_session import SaleCloseTimeout
+from app.ipc import InferenceClient, WorkerUnavailable, load_authkey
+from app.variables import (
+    MODEL_PATH,
+    VIDEO_PATH,
+    PROFILE_MAX_DURATION,
+    EVENT_STREAM_KEEPALIVE,
+    SALE_TARGET_FPS,
+    SERVING_MODE,
+    INFERENCE_WORKER_ADDRESS,
+    INFERENCE_WORKER_AUTHKEY_ENV,
+    INFERENCE_WORKER_AUTHKEY_FILE,
+    INFERENCE_WORKER_TIMEOUT,
+    INFERENCE_WORKER_METHOD_TIMEOUTS
+)
+from flask import Flask, Response, request, jsonify, stream_with_context
+import json
 app = Flask(__name__)
 model = None
+# Control operations: a local SaleService ("inprocess") or a proxy to worker.py ("worker")
+service = None
+
+if SERVING_MODE == "worker":
+    # The model lives in the inference worker; this process (and any number of
+    # WSGI workers) only forwards requests to it. No authkey, no start.
+    service = InferenceClient(
+        INFERENCE_WORKER_ADDRESS,
+        load_authkey(INFERENCE_WORKER_AUTHKEY_ENV, INFERENCE_WORKER_AUTHKEY_FILE),
+        timeout=INFERENCE_WORKER_TIMEOUT,
+        method_timeouts=INFERENCE_WORKER_METHOD_TIMEOUTS
+    )
+
 
 def initialize_model():
-    """Initialize the model and auto-start prediction at 10 fps"""
-    global model
+    """Initialize the model in this process, warm it up and auto-start prediction at 10 fps"""
+    global model, service
     try:
+        # Imported here so web processes in "worker" mode never load torch/ultralytics
+        from pipeline import Prediction
         model = Prediction(MODEL_PATH, VIDEO_PATH, target_fps=10)
         print("✓ Model loaded successfully at startup (target fps: 10)")
-        
+        model.warmup()
+
         # Auto-start prediction on startup
         model.start_prediction()
         print("✓ Prediction started automatically on startup")
+        service = SaleService(model)
     except Exception as e:
         print(f"✗ Error loading model at startup: {e}")
         raise
@@ -24,26 +53,39 @@ def initialize_model():
 
 @app.before_request
 def initialize_once():
-    if not hasattr(app, "_model_initialized"):
+    if SERVING_MODE == "inprocess" and not hasattr(app, "_model_initialized"):
         initialize_model()
         app._model_initialized = True
 
 
+def _error_response(e):
+    # The worker being down (restart, crash) or a sale still closing is a temporary
+    # condition, not a server bug
+    status = 503 if isinstance(e, (WorkerUnavailable, SaleCloseTimeout)) else 500
+    return jsonify({"error": str(e)}), status
+
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 200 once the model is warmed up and the prediction loop is running"""
+    try:
+        state = service.readiness()
+    except Exception as e:
+        return jsonify({"ready": False, "error": str(e)}), 503
+    return jsonify(state), 200 if state["ready"] else 503
+
+
 @app.route("/start_prediction", methods=["POST"])
 def start_prediction():
     try:
-        # Change fps to 25 when requested
-        model.set_target_fps(25)
-        output_dir = r"E:\IGS_record"  # same disk as final storage
-        os.makedirs(output_dir, exist_ok=True)
-
-        if not model.enable_recording(output_dir=output_dir):
+        # Raise the processing rate for the sale and start recording it
+        if not service.start_sale():
             return jsonify({"error": "Failed to enable recording"}), 500
-        
-        return jsonify({"message": "Recording started for sale at 25 fps"}), 200
+
+        return jsonify({"message": f"Recording started for sale at {SALE_TARGET_FPS} fps"}), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response(e)
 
 
 @app.route("/stop_prediction", methods=["POST"])
@@ -53,69 +95,142 @@ def stop_prediction():
         pos_member = data.get("pos_member")
         pos_wallet = data.get("pos_wallet")
         voucher_number = data.get("voucher_number")
+        cashier_id = data.get("cashier_id")
 
         if not isinstance(pos_member, bool) or not isinstance(pos_wallet, bool):
             return jsonify({"error": "pos_member and pos_wallet must be boolean"}), 400
 
         if not voucher_number:
             return jsonify({"error": "voucher_number is required"}), 400
-        
-        # Disable recording for this sale
-        model.disable_recording()
-        
-        # Get prediction output with error handling
+
+        result = service.stop_sale(
+            pos_member=pos_member,
+            pos_wallet=pos_wallet,
+            voucher_number=voucher_number,
+            cashier_id=cashier_id
+        )
+        return jsonify(result), 200
+
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    try:
+        return Response(service.metrics(), mimetype="text/plain; version=0.0.4")
+    except Exception as e:
+        return _error_response(e)
+
+
+def _float_arg(name):
+    value = request.args.get(name)
+    return float(value) if value not in (None, "") else None
+
+
+@app.route("/sales", methods=["GET"])
+def sales():
+    """Stored sale results, filtered by voucher_number, cashier_id and since/until (epoch seconds)"""
+    try:
+        results = service.sales(
+            voucher_number=request.args.get("voucher_number"),
+            cashier_id=request.args.get("cashier_id"),
+            since=_float_arg("since"),
+            until=_float_arg("until"),
+            limit=min(int(request.args.get("limit", 100)), 1000)
+        )
+        return jsonify({"sales": results}), 200
+    except ValueError:
+        return jsonify({"error": "since, until and limit must be numbers"}), 400
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route("/sales/<sale_id>/events", methods=["GET"])
+def sale_events(sale_id):
+    """Stored analytics events recorded during one sale"""
+    try:
+        results = service.sale_events(
+            sale_id=sale_id,
+            limit=min(int(request.args.get("limit", 1000)), 10000)
+        )
+        return jsonify({"sale_id": sale_id, "events": results}), 200
+    except ValueError:
+        return jsonify({"error": "limit must be a number"}), 400
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route("/events", methods=["GET"])
+def events():
+    """Server-sent event stream of analytics events as they happen"""
+    try:
+        subscription = service.subscribe()
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        return _error_response(e)
+
+    def stream():
         try:
-            output, developer_message = model.print_output(pos_wallet, pos_member)
-        except Exception as e:
-            print(f"Error generating output summary: {e}")
-            output = {"error": "Failed to generate prediction output"}
-            developer_message = {"error": str(e)}
-        
-        # Save video only if suspicious activity detected
-        video_saved = False
-        if model.suspicious and model.temp_video_path and os.path.exists(model.temp_video_path):
-            try:
-                output_dir = r"E:\IGS_record"
-                os.makedirs(output_dir, exist_ok=True)
-
-                safe_voucher = re.sub(r'[\\/:*?"<>|]', "_", voucher_number)
-                output_path = os.path.join(output_dir, f"{safe_voucher}.mp4")
-
-                if os.path.exists(model.temp_video_path):
-                    os.replace(model.temp_video_path, output_path)
-                    video_saved = True
-                    print(f"✓ Suspicious activity recording saved: {output_path}")
-                else:
-                    print(f"✗ Temp video not found: {model.temp_video_path}")
-
-            except PermissionError as e:
-                print(f"✗ File is locked / still being written: {e}")
-            except Exception as e:
-                print(f"✗ Error saving video: {e}")
-        else:
-            # Clean up temp file if not saving
-            if model.temp_video_path and os.path.exists(model.temp_video_path):
+            while True:
                 try:
-                    os.remove(model.temp_video_path)
-                except Exception as e:
-                    print(f"Error removing temp video: {e}")
-        
-        # Reset for next sale (thread-safe reset)
-        model.temp_video_path = None
-        model.suspicious = False
-        # Reset analytics for next transaction
-        with model._lock:
-            model.analytics = RetailAnalytics()
-        
-        return jsonify({
-            "prediction_summary": output,
-            "developer_message": developer_message,
-            "recording_saved": video_saved
-        }), 200
+                    event = subscription.get(timeout=EVENT_STREAM_KEEPALIVE)
+                except WorkerUnavailable:
+                    # Inference worker went away; end the stream so the client reconnects
+                    break
+                if event is None:
+                    # Keep proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                if subscription.dropped:
+                    event = dict(event, dropped=subscription.dropped)
+                yield f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            # Client disconnected
+            subscription.close()
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.route("/profile", methods=["GET", "POST"])
+def profile():
+    """POST arms a time-bounded profiling session of the prediction loop; GET reports its status"""
+    try:
+        if request.method == "GET":
+            return jsonify(service.profile_status()), 200
+
+        data = request.get_json(silent=True) or {}
+        duration = data.get("duration", 30)
+        mode = data.get("mode", "stages")
+
+        if not isinstance(duration, (int, float)) or isinstance(duration, bool) or duration <= 0:
+            return jsonify({"error": "duration must be a positive number of seconds"}), 400
+        if duration > PROFILE_MAX_DURATION:
+            return jsonify({"error": f"duration must not exceed {PROFILE_MAX_DURATION}s"}), 400
+        try:
+            started = service.start_profile(duration=duration, mode=mode)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except RuntimeError as e:
+            # Prediction is not running
+            return jsonify({"error": str(e)}), 409
+        if not started:
+            return jsonify({"error": "A profiling session is already running"}), 409
+
+        return jsonify({"message": f"Profiling started ({mode}, {duration}s)"}), 200
 
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        return _error_response(e)
 
 
 if __name__ == "__main__":
+    if SERVING_MODE == "inprocess":
+        # Load and warm up before accepting requests instead of on the first one
+        initialize_model()
+        app._model_initialized = True
     app.run(host="0.0.0.0", port=8000)
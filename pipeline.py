@@ -1,63 +1,242 @@
 from ultralytics import YOLO
-from app.helper_functions import preprocess_frame, predict_frame, analytics_step, debug_step, render_frame
-import cv2
+from app.helper_functions import preprocess_frame, analytics_step, debug_step, render_frame
+from app.metrics import PipelineMetrics
+from app.profiler import LoopProfiler
+from app.video_source import FrameClock, read_stream_metadata, open_capture, backoff_delay
+from app.evidence import EvidenceWriter, EvidenceBundle
+from app.recording import StreamRecorder, recording_profile, output_size, record_interval, open_video_writer, save_clip, join_clip
+from app.frame_transport import SharedFramePool, CaptureWorker, EncoderWorker
+from app.buffer_pool import FrameBufferPool
+from app.sale_session import SaleSession, SaleCloseTimeout
 from app.retail_analytics import RetailAnalytics
+from app.person_tracker import PersonBehaviorTracker
+from app.appearance import AppearanceIndex, link_reentries
+from app.propagation import BoxPropagator
+from app.scanner_motion import ScannerMotionEstimator
+from app.tracking import DetectionTracker
+from app.two_tier import TwoTierDetector
+from app.static_scene import StaticSceneCache
+from app.event_bus import EventBus
+from app.event_store import EventStore
+from app.variables import (
+    PROFILE_OUTPUT_DIR,
+    CLOCK_MODE,
+    CAPTURE_BACKEND,
+    FFMPEG_CAPTURE_OPTIONS,
+    DECODE_THREADS,
+    INFERENCE_STREAM_PATH,
+    RECORDING_SOURCE,
+    RECORD_SEGMENT_SECONDS,
+    EVIDENCE_MODE,
+    TRACKER_CONFIG,
+    TRACKING_POLICY,
+    TWO_TIER_ENABLED,
+    TWO_TIER_BASE_IMGSZ,
+    TWO_TIER_CROP_IMGSZ,
+    TWO_TIER_ROI_CLASSES,
+    TWO_TIER_TARGET_CLASSES,
+    TWO_TIER_MARGIN,
+    TWO_TIER_MAX_CROPS,
+    EVIDENCE_EVENT_TYPES,
+    EVIDENCE_JPEG_QUALITY,
+    EVIDENCE_MAX_SIZE,
+    EVIDENCE_MARGIN,
+    EVIDENCE_COOLDOWN,
+    EVIDENCE_MAX_SNAPSHOTS,
+    FRAME_TRANSPORT,
+    FRAME_POOL_SLOTS,
+    PIPELINE_QUEUE_SIZE,
+    SESSION_CLOSE_WARN_INTERVAL,
+    SESSION_CLOSE_TIMEOUT,
+    STREAM_OPEN_TIMEOUT,
+    STREAM_READ_TIMEOUT,
+    MAX_READ_FAILURES,
+    RECONNECT_BASE_DELAY,
+    RECONNECT_MAX_DELAY,
+    EVENT_STREAM_QUEUE_SIZE,
+    EVENT_STREAM_MAX_CLIENTS,
+    EVENT_STORE_PATH,
+    EVENT_STORE_BATCH_SIZE,
+    EVENT_STORE_FLUSH_INTERVAL,
+    PERSON_SNAPSHOT_PATH,
+    PERSON_SNAPSHOT_INTERVAL,
+    PERSON_SNAPSHOT_MAX_AGE,
+    REID_ENABLED,
+    REID_SIMILARITY_THRESHOLD,
+    REID_WINDOW,
+    REID_REFRESH_INTERVAL,
+    REID_INDEX_CAPACITY,
+    KEYFRAME_INTERVAL,
+    PROPAGATION_MODE,
+    SCANNER_MOTION_MODE,
+    STATIC_SCENE_ENABLED,
+    STATIC_SCENE_PATH,
+    STATIC_SCENE_WARMUP,
+    STATIC_SCENE_MIN_PRESENCE,
+    STATIC_SCENE_MAX_AGE,
+    MODEL_WARMUP_RUNS
+)
+import numpy as np
+import queue
 import threading
 import time
-import shutil
 import os
 import tempfile
 from pathlib import Path
 from typing import Tuple, Dict
 
 class Prediction:
-    def __init__(self, MODEL_PATH, VIDEO_PATH, confidence=0.7, target_fps=10):
+    def __init__(self, MODEL_PATH, VIDEO_PATH, confidence=0.7, target_fps=10,
+                 inference_path=INFERENCE_STREAM_PATH, recording_source=RECORDING_SOURCE):
         # Validate model path early to provide clear errors
         if not Path(MODEL_PATH).exists():
             raise FileNotFoundError(f"Model file not found: {MODEL_PATH}")
+        if recording_source not in ("inference", "mainstream"):
+            raise ValueError("recording_source must be 'inference' or 'mainstream'")
+        if FRAME_TRANSPORT not in ("inline", "shared_memory"):
+            raise ValueError("FRAME_TRANSPORT must be 'inline' or 'shared_memory'")
+        if EVIDENCE_MODE not in ("video", "snapshots", "both"):
+            raise ValueError("EVIDENCE_MODE must be 'video', 'snapshots' or 'both'")
         self.model = YOLO(MODEL_PATH)
         self.confidence = confidence
-        self.rtsp_path = VIDEO_PATH
+        # Set by warmup(); readiness probes report not-ready until the first inference has run
+        self.ready = False
+        # Inference may run on a low-resolution substream; VIDEO_PATH stays the mainstream
+        self.rtsp_path = inference_path or VIDEO_PATH
+        self.mainstream_path = VIDEO_PATH
+        self.recording_source = recording_source
+        # Per-camera clip size, frame rate and codec (keyed by the camera's main URL)
+        self.recording_profile = recording_profile(self.mainstream_path or self.rtsp_path)
         self.running = False
-        self.cap = cv2.VideoCapture(VIDEO_PATH)
+        self.cap = self._make_capture(self.rtsp_path)
+        # Shared-memory transport: capture and encoding run in their own processes
+        # (started with the loop); None with the inline transport
+        self.frame_pool = None
+        self.capture_worker = None
+        self.encoder = None
         self._lock = threading.Lock()
         self.thread = None
-        self.analytics=RetailAnalytics()
+        # Staff/customer behavior is tracked for the whole shift, across sales
+        self.person_tracker = PersonBehaviorTracker()
+        # Appearance signatures used to re-link people who come back with a new track id
+        self.appearance_index = AppearanceIndex(capacity=REID_INDEX_CAPACITY, max_age=REID_WINDOW)
+        self.person_tracker.restore(
+            PERSON_SNAPSHOT_PATH, current_time=0.0, max_age=PERSON_SNAPSHOT_MAX_AGE, index=self.appearance_index
+        )
+        # Keyframe mode: detector every keyframe_interval processed frames, boxes propagated in between
+        self.keyframe_interval = max(1, int(KEYFRAME_INTERVAL))
+        self.propagator = BoxPropagator(mode=PROPAGATION_MODE)
+        self.processed_count = 0
+        # Detector plus per-class tracking (full tracker, IoU association or none)
+        self.detector = DetectionTracker(self.model, TRACKING_POLICY, TRACKER_CONFIG)
+        # Optional high-resolution crop pass for small objects, on keyframes only
+        self.two_tier = None
+        self.detect_imgsz = None
+        if TWO_TIER_ENABLED:
+            self.detect_imgsz = TWO_TIER_BASE_IMGSZ
+            self.two_tier = TwoTierDetector(
+                self.model,
+                TWO_TIER_ROI_CLASSES,
+                TWO_TIER_TARGET_CLASSES,
+                crop_imgsz=TWO_TIER_CROP_IMGSZ,
+                margin=TWO_TIER_MARGIN,
+                max_crops=TWO_TIER_MAX_CROPS
+            )
+        # Optical-flow scanner speed (px/s) for frame-rate independent scan detection
+        self.scanner_motion = ScannerMotionEstimator() if SCANNER_MOTION_MODE == "flow" else None
+        # Live sale session; replaced atomically by close_sale(). Each frame pins the
+        # session it was handed to stage 2 with (SaleSession.in_flight), and
+        # close_sale() waits on this condition until the closed session is unpinned.
+        self.session = self._new_session()
+        self._session_cond = threading.Condition()
         # Event used to request the prediction loop to stop
         self.stop_event = threading.Event()
-        self.source_fps = int(self.cap.get(cv2.CAP_PROP_FPS)) or 25
+        # Static stream properties are read once here (and on reconnect), never per frame
+        self.stream_meta = read_stream_metadata(self.cap, self.rtsp_path)
+        self.clock = FrameClock(self.stream_meta, mode=CLOCK_MODE)
+        self.source_fps = int(round(self.stream_meta["fps"]))
         self.target_fps = target_fps  # FPS at which to process frames
         self.frame_skip_interval = max(1, int(round(self.source_fps / self.target_fps)))
-        self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        self.suspicious=False
+        self.total_frames = self.stream_meta["total_frames"]
+        self.width = self.stream_meta["width"]
+        self.height = self.stream_meta["height"]
+        # Inline transport: frames are decoded into reused arrays instead of fresh ones
+        self.frame_buffers = None
+        if FRAME_TRANSPORT == "inline":
+            self.frame_buffers = self._new_frame_buffers()
+        # Fixed fixtures (counter, scanner cradle), learned once per camera and cached on disk
+        self.static_scene = None
+        if STATIC_SCENE_ENABLED:
+            self.static_scene = StaticSceneCache(
+                STATIC_SCENE_PATH,
+                self.rtsp_path,
+                (self.width, self.height),
+                warmup=STATIC_SCENE_WARMUP,
+                min_presence=STATIC_SCENE_MIN_PRESENCE,
+                max_age=STATIC_SCENE_MAX_AGE
+            )
+            self.static_scene.load()
         self.frame= None
-        self.out = None
-        self.temp_video_path = None
         self.frame_count = 0
         self.recording_enabled = False
+        self.metrics = PipelineMetrics()
+        # Monotonic start of the current source outage (None while the source is up)
+        self.source_down_since = None
+        self.profiler = LoopProfiler(output_dir=PROFILE_OUTPUT_DIR)
+        # Push stream of analytics events (served as SSE by the control API)
+        self.event_bus = EventBus(maxsize=EVENT_STREAM_QUEUE_SIZE, max_subscribers=EVENT_STREAM_MAX_CLIENTS)
+        # Event snapshots are encoded to JPEG off the loop (EVIDENCE_MODE "snapshots"/"both")
+        self.evidence_writer = None
+        if EVIDENCE_MODE != "video":
+            self.evidence_writer = EvidenceWriter(quality=EVIDENCE_JPEG_QUALITY, max_size=EVIDENCE_MAX_SIZE)
+        # Durable sale/event history, written in batches by a background thread
+        self.store = EventStore(EVENT_STORE_PATH, batch_size=EVENT_STORE_BATCH_SIZE, flush_interval=EVENT_STORE_FLUSH_INTERVAL)
+
+    def _new_session(self):
+        """Fresh per-sale analytics sharing the shift-long person tracker"""
+        return SaleSession(RetailAnalytics(person_tracker=self.person_tracker))
+
+    @property
+    def analytics(self):
+        """Analytics of the live sale session"""
+        return self.session.analytics
+
+    @staticmethod
+    def _capture_options():
+        return dict(
+            open_timeout=STREAM_OPEN_TIMEOUT,
+            read_timeout=STREAM_READ_TIMEOUT,
+            backend=CAPTURE_BACKEND,
+            ffmpeg_options=FFMPEG_CAPTURE_OPTIONS,
+            decode_threads=DECODE_THREADS
+        )
+
+    def _make_capture(self, path):
+        """Open a capture with the configured backend, decoder options and timeouts"""
+        return open_capture(path, **self._capture_options())
 
     def set_target_fps(self, target_fps):
-        """Update the target FPS for frame processing"""
+        """Update the target FPS for frame processing (and the live clip's decimation)"""
         with self._lock:
             self.target_fps = target_fps
             self.frame_skip_interval = max(1, int(round(self.source_fps / self.target_fps)))
+            if self.capture_worker is not None:
+                self.capture_worker.set_skip_interval(self.frame_skip_interval)
+            session = self.session
+            if session.out is not None and session.record_interval:
+                # Keep the clip near the profile fps its writer was opened with
+                processing_fps = self.source_fps / self.frame_skip_interval
+                session.record_interval = record_interval(self.recording_profile, processing_fps)
             print(f"Target FPS updated to {target_fps} (processing every {self.frame_skip_interval} frame(s))")
 
-    def capture_video(self, reconnect_attempts=3, reconnect_delay=2.0):
-        attempt = 0
-        while attempt < reconnect_attempts:
-            self.cap = cv2.VideoCapture(self.rtsp_path)
-            if self.cap.isOpened():
+    def capture_video(self, reconnect_attempts=3, reconnect_delay=RECONNECT_BASE_DELAY):
+        """Open the video source at startup, retrying with backoff a bounded number of times"""
+        for attempt in range(reconnect_attempts):
+            if self._open_source():
                 return True
-            attempt += 1
-            print(f"Failed to open RTSP stream (attempt {attempt}/{reconnect_attempts}), retrying in {reconnect_delay}s...")
-            try:
-                self.cap.release()
-            except Exception as e:
-                print(f"Error releasing video capture: {e}")
-            time.sleep(reconnect_delay)
+            delay = backoff_delay(attempt, reconnect_delay, RECONNECT_MAX_DELAY)
+            print(f"Failed to open RTSP stream (attempt {attempt + 1}/{reconnect_attempts}), retrying in {delay:.1f}s...")
+            time.sleep(delay)
         # explicit failure
         try:
             if self.cap:
@@ -66,109 +245,620 @@ class Prediction:
             print(f"Error releasing video capture on final cleanup: {e}")
         return False
 
+    def _open_source(self):
+        """(Re)open the capture, releasing any previous handle first"""
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception as e:
+                print(f"Error releasing video capture: {e}")
+        self.metrics.reconnects.inc()
+        self.cap = self._make_capture(self.rtsp_path)
+        if not self.cap.isOpened():
+            return False
+        self._refresh_stream_meta()
+        self.metrics.source_up.set(1)
+        return True
+
+    def _reconnect(self):
+        """Supervisor for a running loop: reconnect with backoff until the source is
+        back or a stop is requested. Analytics state is left untouched, so an
+        in-progress sale continues where it left off. Returns False only on stop."""
+        self.source_down_since = time.monotonic()
+        self.metrics.source_up.set(0)
+        print("✗ Video source lost, reconnecting...")
+
+        attempt = 0
+        while self.running and not self.stop_event.is_set():
+            if self._open_source():
+                self._record_outage(time.monotonic() - self.source_down_since)
+                self._reset_motion_state()
+                return True
+            delay = backoff_delay(attempt, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY)
+            attempt += 1
+            print(f"Reconnect attempt {attempt} failed, retrying in {delay:.1f}s...")
+            self.stop_event.wait(delay)
+
+        self._record_outage(time.monotonic() - self.source_down_since)
+        return False
+
+    def _new_frame_buffers(self):
+        # One buffer being decoded, one in post-processing, the pipeline queue, and one spare
+        return FrameBufferPool((self.height, self.width, 3), PIPELINE_QUEUE_SIZE + 3)
+
+    def _reset_motion_state(self):
+        """Boxes and scanner patches from before an outage can't be carried into new frames"""
+        self.propagator.reset()
+        if self.scanner_motion is not None:
+            self.scanner_motion.reset()
+
+    def _start_frame_workers(self):
+        """Hand the source over to a capture process and start the encoder process.
+        Called once the source is known to open, so the pool can be sized from it."""
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self.frame_pool = SharedFramePool.create(FRAME_POOL_SLOTS, self.width * self.height * 3)
+        self.capture_worker = CaptureWorker(
+            self.frame_pool,
+            self.rtsp_path,
+            self._capture_options(),
+            CLOCK_MODE,
+            self.frame_skip_interval,
+            MAX_READ_FAILURES,
+            RECONNECT_BASE_DELAY,
+            RECONNECT_MAX_DELAY,
+            on_down=self._on_source_down,
+            on_up=self._on_source_restored
+        )
+        self.encoder = EncoderWorker(self.frame_pool)
+        self.encoder.start()
+        # Spawned children import cv2/numpy first, so allow more than the open timeout
+        meta = self.capture_worker.start(timeout=STREAM_OPEN_TIMEOUT + 30)
+        if meta is None:
+            print("✗ Capture process did not open the video source")
+            self._stop_frame_workers()
+            return False
+        self._apply_stream_meta(meta)
+        print(f"✓ Shared-memory frame transport started ({FRAME_POOL_SLOTS} slots)")
+        return True
+
+    def _stop_frame_workers(self):
+        self.frame = None
+        if self.capture_worker is not None:
+            self.capture_worker.stop()
+            self.capture_worker = None
+        if self.encoder is not None:
+            self.encoder.stop()
+            self.encoder = None
+        if self.frame_pool is not None:
+            self.frame_pool.close()
+            self.frame_pool = None
+
+    def _on_source_down(self):
+        """Capture process lost the source and is reconnecting"""
+        self.source_down_since = time.monotonic()
+        self.metrics.source_up.set(0)
+        print("✗ Video source lost, capture process reconnecting...")
+
+    def _on_source_restored(self, downtime, meta):
+        self.metrics.reconnects.inc()
+        self._apply_stream_meta(meta)
+        self._record_outage(downtime)
+        self.metrics.source_up.set(1)
+        self._reset_motion_state()
+
+    def _record_outage(self, downtime):
+        with self._lock:
+            self.source_down_since = None
+            if self.session.recording:
+                self.session.downtime += downtime
+        self.metrics.source_downtime.inc(downtime)
+        print(f"✓ Video source restored after {downtime:.1f}s downtime")
+
+    def get_sale_downtime(self, session=None):
+        """Seconds the camera was unavailable during a sale (the live one by default)"""
+        session = session or self.session
+        with self._lock:
+            downtime = session.downtime
+            # An outage still in progress counts against the live sale
+            if not session.closed and self.source_down_since is not None:
+                downtime += time.monotonic() - self.source_down_since
+            return downtime
+
+    def _refresh_stream_meta(self):
+        """Re-read static stream properties after (re)opening the capture"""
+        self._apply_stream_meta(read_stream_metadata(self.cap, self.rtsp_path))
+
+    def _apply_stream_meta(self, meta):
+        self.stream_meta = meta
+        self.clock.update_metadata(self.stream_meta)
+        source_fps = int(round(meta["fps"]))
+        if source_fps != self.source_fps:
+            # A reconnect can come back at another frame rate: keep the configured rates
+            print(f"Source FPS changed from {self.source_fps} to {source_fps}")
+            self.source_fps = source_fps
+            self.set_target_fps(self.target_fps)
+        self.width = self.stream_meta["width"]
+        self.height = self.stream_meta["height"]
+        if self.frame_buffers is not None and self.frame_buffers.shape != (self.height, self.width, 3):
+            # Buffers still in flight are dropped when released to the old pool
+            self.frame_buffers = self._new_frame_buffers()
+        self.total_frames = self.stream_meta["total_frames"]
+        if self.static_scene is not None:
+            self.static_scene.set_frame_size((self.width, self.height))
+
     def enable_recording(self, output_dir=None):
-        """Start recording video to temp file on the same drive as output_dir"""
+        """Start recording the sale's evidence (video to a temp file on the same drive as
+        output_dir, and/or event snapshots next to it, per EVIDENCE_MODE)"""
         with self._lock:
             if self.recording_enabled:
                 return True
 
+            session = self.session
             try:
                 if output_dir:
                     # Ensure output_dir exists
                     os.makedirs(output_dir, exist_ok=True)
                     # Temp file on same drive
-                    self.temp_video_path = os.path.join(
+                    temp_video_path = os.path.join(
                         output_dir,
                         f"txn_{int(time.time()*1000)}.mp4"
                     )
                 else:
                     # fallback to system temp folder
                     tmp = tempfile.NamedTemporaryFile(delete=False, suffix='.mp4')
-                    self.temp_video_path = tmp.name
+                    temp_video_path = tmp.name
                     tmp.close()
 
-                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-                self.out = cv2.VideoWriter(
-                    self.temp_video_path,
-                    fourcc,
-                    self.source_fps,
-                    (self.width, self.height)
-                )
+                if EVIDENCE_MODE == "snapshots":
+                    # Stills only: nothing is encoded and skipped frames stay undecoded
+                    pass
+                elif self.recording_source == "mainstream" and self.mainstream_path != self.rtsp_path:
+                    # Full-resolution evidence from the mainstream, decoded only during the sale
+                    recorder = StreamRecorder(self.mainstream_path, temp_video_path, self._make_capture,
+                                              self.recording_profile)
+                    if not recorder.start():
+                        return False
+                    session.recorder = recorder
+                else:
+                    out, interval = self._open_writer(temp_video_path)
+                    if out is None:
+                        print("Error: Failed to initialize video writer")
+                        return False
+                    session.record_interval = interval
+                    # Single attribute store: the loop picks the writer up on its next frame
+                    session.out = out
+                    if self.capture_worker is not None and not interval:
+                        # Skipped frames must now be decoded too
+                        self.capture_worker.set_recording(True)
 
-                if not self.out.isOpened():
-                    print("Error: Failed to initialize video writer")
-                    return False
+                if self.evidence_writer is not None:
+                    session.evidence_path = os.path.splitext(temp_video_path)[0] + "_evidence"
+                    session.evidence = EvidenceBundle(
+                        session.evidence_path,
+                        self.evidence_writer,
+                        EVIDENCE_EVENT_TYPES,
+                        margin=EVIDENCE_MARGIN,
+                        cooldown=EVIDENCE_COOLDOWN,
+                        max_snapshots=EVIDENCE_MAX_SNAPSHOTS
+                    )
 
+                session.temp_video_path = temp_video_path
+                session.started_at = time.time()  # the sale starts when recording does
+                session.downtime = 0.0
                 self.recording_enabled = True
+                self.metrics.recording_enabled.set(1)
                 self.frame_count = 0  # Reset frame counter for this sale
-                print(f"✓ Recording started: {self.temp_video_path}")
+                print(f"✓ Recording started: {temp_video_path}")
                 return True
             except Exception as e:
                 print(f"Error enabling recording: {e}")
                 return False
-        
+
+    def _open_writer(self, path):
+        """Sale clip writer for the recording profile, and its SaleSession.record_interval.
+        Frames are encoded (and downscaled) in the encoder process when it runs."""
+        profile = self.recording_profile
+        size = output_size(profile, self.width, self.height)
+        fps, interval = self.source_fps, 0
+        if profile["fps"]:
+            # Decimate over the processed frames only, so no extra frame is decoded
+            processing_fps = self.source_fps / self.frame_skip_interval
+            interval = record_interval(profile, processing_fps)
+            fps = processing_fps / interval
+        if self.encoder is not None:
+            out = self.encoder.open_writer(path, profile["codec"], fps, size, profile["quality"], RECORD_SEGMENT_SECONDS)
+        else:
+            out = open_video_writer(path, profile["codec"], fps, size, profile["quality"], RECORD_SEGMENT_SECONDS)
+        if out is not None:
+            print(f"✓ Recording profile '{profile['name']}': {size[0]}x{size[1]} @ {fps:.1f} fps, {profile['codec']}")
+        return out, interval
+
+    def close_sale(self, on_close=None):
+        """Atomically hand off the live sale session and return the closed one.
+
+        Frames pinned from now on go to a fresh session; this call waits (without
+        holding any lock the loop needs) until every frame pinned to the old session,
+        including frames still queued for post-processing, has been finished, then
+        finalizes its recording. A session is never closed under a frame still
+        writing into it, which would corrupt the summary: if its frames have not
+        finished after SESSION_CLOSE_TIMEOUT seconds (a wedged stage), SaleCloseTimeout
+        is raised and the session is finalized in the background once they do.
+        on_close(session) is called with the session being closed just before it is
+        swapped out, so callers can claim its files before anyone else sees it as
+        closed. The returned session is frozen and safe to summarize and save.
+        """
+        with self._lock:
+            if on_close is not None:
+                on_close(self.session)
+            with self._session_cond:
+                closed = self.session
+                self.session = self._new_session()
+            self.recording_enabled = False
+            self.metrics.recording_enabled.set(0)
+            if self.capture_worker is not None:
+                self.capture_worker.set_recording(False)
+            # Charge an outage still in progress to the sale being closed
+            if closed.recording and self.source_down_since is not None:
+                closed.downtime += time.monotonic() - self.source_down_since
+
+        if not self._wait_idle(closed, SESSION_CLOSE_TIMEOUT):
+            threading.Thread(target=self._close_when_idle, args=(closed,), daemon=True).start()
+            raise SaleCloseTimeout(
+                f"Closed sale still has {closed.in_flight} frame(s) in flight after {SESSION_CLOSE_TIMEOUT:.0f}s"
+            )
+
+        # Interactions still open end with the sale, so its summary and event log are
+        # complete; subscribers see them as events of a sale that is already closed
+        cash_times = [i['last'] for i in closed.analytics.cash_interactions.values()]
+        events = closed.analytics.close_cash_interactions()
+        if events:
+            current_time = max(cash_times)
+            self.metrics.observe_events(events)
+            self.event_bus.publish(events, current_time, sale_open=False)
+            self.store.add_events(closed.session_id, events, current_time)
+
+        closed.close()
+        print("✓ Sale session closed")
+        return closed
+
+    def _wait_idle(self, session, timeout=None):
+        """Wait until no frame is pinned to session; False if timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._session_cond:
+            while session.in_flight:
+                wait = SESSION_CLOSE_WARN_INTERVAL
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        print(f"✗ Gave up waiting for {session.in_flight} frame(s) of the closed sale")
+                        return False
+                if not self._session_cond.wait(timeout=wait):
+                    print(f"✗ Still waiting for {session.in_flight} frame(s) of the closed sale")
+        return True
+
+    def _close_when_idle(self, session):
+        """Finalize a sale that close_sale() gave up on, once its last frame is done"""
+        self._wait_idle(session)
+        session.close()
+        print("✓ Late sale session closed")
+
     def disable_recording(self):
+        """Stop recording the live session (used when the loop exits)"""
         with self._lock:
             if not self.recording_enabled:
                 return
             self.recording_enabled = False
-            if self.out is not None and self.out.isOpened():
-                self.out.release()
-                self.out = None
+            self.metrics.recording_enabled.set(0)
+            if self.capture_worker is not None:
+                self.capture_worker.set_recording(False)
+            self.session.release_recording()
             print("✓ Recording stopped and flushed")
 
+    def _detect(self, frame, current_time):
+        """Detector output for a processed frame, or propagated boxes between keyframes.
+        Returns (detections, is_keyframe)."""
+        is_keyframe = self.keyframe_interval == 1 or self.processed_count % self.keyframe_interval == 0
+        self.processed_count += 1
+        if not is_keyframe:
+            detections = self.propagator.propagate(frame, current_time)
+            if detections is not None:
+                return detections, False
+        detections = self.detector(frame, self.detect_imgsz)
+        if self.two_tier is not None:
+            t0 = time.perf_counter()
+            self.two_tier.refine(frame, detections)
+            self.profiler.record("refine", time.perf_counter() - t0)
+        if self.keyframe_interval > 1:
+            self.propagator.update(frame, detections, current_time)
+        return detections, True
+
     def _run_prediction_loop(self):
         """Thread target: runs the prediction loop (continuous monitoring)"""
+        post_queue, post_thread = None, None
         try:
             self.frame_count = 0
+            read_failures = 0
+            if PIPELINE_QUEUE_SIZE > 0:
+                post_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+                post_thread = threading.Thread(target=self._post_loop, args=(post_queue,), daemon=True)
+                post_thread.start()
             # Loop continuously while prediction is running
             while self.running and not self.stop_event.is_set():
                 try:
-                    self.frame, meta = preprocess_frame(self.cap, self.source_fps)
-                    if self.frame is None:
-                        break
-                    
-                    # Only process frames based on target FPS
-                    should_process = (self.frame_count % self.frame_skip_interval) == 0
-                    
+                    t_read = time.perf_counter()
+                    if self.capture_worker is not None:
+                        # Decoded straight into a shared slot by the capture process,
+                        # which also applies the fps decimation and supervises the source
+                        self.frame, meta = self.capture_worker.read(timeout=STREAM_READ_TIMEOUT)
+                        if meta is None:
+                            if self.capture_worker.eof:
+                                print("✓ End of video file reached")
+                                break
+                            if self.capture_worker.error:
+                                print(f"✗ Capture process stopped: {self.capture_worker.error}")
+                                break
+                            if not self.capture_worker.process.is_alive():
+                                print("✗ Capture process exited")
+                                break
+                            continue
+                        should_process = meta["process"]
+                        passed = meta["skipped"] + meta["dropped"]
+                        self.frame_count += passed
+                        self.metrics.frames_captured.inc(passed)
+                        self.metrics.frames_skipped.inc(meta["skipped"])
+                        self.metrics.frames_dropped.inc(meta["dropped"])
+                    else:
+                        # Only process frames based on target FPS
+                        should_process = (self.frame_count % self.frame_skip_interval) == 0
+                        # Skipped frames are only grabbed (still timestamped) unless they are being recorded
+                        session = self.session
+                        retrieve = should_process or (session.out is not None and not session.record_interval)
+
+                        buffers = self.frame_buffers
+                        buf = buffers.acquire() if retrieve else None
+                        self.frame, meta = preprocess_frame(self.cap, self.clock, retrieve=retrieve, out=buf)
+                        if buf is not None and self.frame is not buf:
+                            # Failed read or a size change: the buffer wasn't decoded into
+                            buffers.release(buf)
+                        if meta is None:
+                            if not self.stream_meta["live"]:
+                                print("✓ End of video file reached")
+                                break
+                            # Live source stalled (read timeout) or hit EOF: tolerate a few
+                            # transient failures, then hand over to the reconnect supervisor
+                            read_failures += 1
+                            if read_failures < MAX_READ_FAILURES:
+                                continue
+                            read_failures = 0
+                            if not self._reconnect():
+                                break
+                            continue
+                        read_failures = 0
+                    self.profiler.tick()
+                    self.profiler.record("decode", time.perf_counter() - t_read)
+                    self.metrics.frames_captured.inc()
+                    self.metrics.capture_rate.tick()
+                    self.frame_count += 1
+
+                    # Stage 1: inference (or propagation). The tracker only ever runs
+                    # here, in frame order, so its state persists exactly as before.
+                    detections, is_keyframe = None, False
                     if should_process:
-                        current_time = meta["current_time"]
-                        detections = predict_frame(self.model, self.frame)
-                        events = analytics_step(self.analytics, detections, current_time)
-                        render_frame(
-                            self.frame,
-                            detections,
-                            self.analytics,
-                            events,
-                            current_time,
-                            self.width,
-                            self.height
-                        )
-
-                    # Only record if recording is enabled (during active sales)
-                    if self.recording_enabled and self.frame is not None:
-                        with self._lock:
-                            if self.out is not None and self.out.isOpened():
-                                frame_copy = self.frame.copy()
-                                self.out.write(frame_copy)
+                        t0 = time.perf_counter()
+                        detections, is_keyframe = self._detect(self.frame, meta["current_time"])
+                        t1 = time.perf_counter()
+                        if is_keyframe:
+                            self.metrics.inference_latency.observe(t1 - t0)
+                            self.profiler.record("inference", t1 - t0)
+                        else:
+                            self.metrics.frames_propagated.inc()
+                            self.profiler.record("propagation", t1 - t0)
+
+                    # Stage 2: analytics, rendering and recording, inline or on the
+                    # post-processing thread while the next frame is being inferred
+                    # The frame belongs to the sale that is live now, even if it is
+                    # closed while the frame waits in the post-processing queue
+                    frame, self.frame = self.frame, None
+                    item = (self._pin_session(), frame, meta, should_process, detections, is_keyframe)
+                    if post_queue is not None:
+                        self._submit(post_queue, item)
+                    else:
+                        self._finish_frame(*item)
+                    # Don't keep the frame's shared slot referenced until the next read
+                    frame = item = buf = None
                 except Exception as e:
+                    self.metrics.frame_errors.inc()
                     print(f"Error processing frame: {e}")
+                    self._release_frame(self.frame)
+                    self.frame = None
                     continue
 
         except Exception as e:
             print(f"Error in prediction loop: {e}")
         finally:
+            if post_thread is not None:
+                # Let the post-processing stage finish the frames already handed to it
+                post_queue.put(None)
+                post_thread.join(timeout=10)
             try:
                 if self.cap:
                     self.cap.release()
             except Exception as e:
                 print(f"Error releasing video capture: {e}")
-            
+
+            # Flush any profiling session that was still running
+            self.profiler.finish()
+
             # Disable recording on loop exit
             self.disable_recording()
+            # Recording is finalized, so the encoder has nothing left to write.
+            # Drop the last frame views first, or the shared block can't be unmapped.
+            frame = item = buf = self.frame = None
+            self._stop_frame_workers()
             
             # Ensure running flag is cleared so callers know thread finished
             self.running = False
+            self.metrics.source_up.set(0)
+            print("✓ Prediction loop exited")
+
+    def _submit(self, post_queue, item):
+        """Hand a frame to the post-processing stage; blocks while it is PIPELINE_QUEUE_SIZE
+        frames behind, so inference never runs away from analytics"""
+        while True:
+            try:
+                post_queue.put(item, timeout=0.5)
+                break
+            except queue.Full:
+                if self.stop_event.is_set():
+                    self._unpin_session(item[0])
+                    self._release_frame(item[1])
+                    return
+        self.metrics.pipeline_queue_depth.set(post_queue.qsize())
+
+    def _post_loop(self, post_queue):
+        """Post-processing stage thread: consumes frames in submission order"""
+        while True:
+            item = post_queue.get()
+            if item is None:
+                break
+            try:
+                self.profiler.attach()
+                self._finish_frame(*item)
+            except Exception as e:
+                self.metrics.frame_errors.inc()
+                print(f"Error processing frame: {e}")
+            self.metrics.pipeline_queue_depth.set(post_queue.qsize())
+        # Frames left behind by an early exit still own shared slots
+        while True:
+            try:
+                item = post_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._unpin_session(item[0])
+                self._release_frame(item[1])
+
+    def _pin_session(self):
+        """The live session, held until _unpin_session(); close_sale() waits for it"""
+        with self._session_cond:
+            session = self.session
+            session.in_flight += 1
+            return session
+
+    def _unpin_session(self, session):
+        with self._session_cond:
+            session.in_flight -= 1
+            if session.in_flight == 0:
+                self._session_cond.notify_all()
+
+    def _release_frame(self, frame):
+        if frame is None:
+            return
+        if self.capture_worker is not None:
+            # Return the slot; the encoder holds its own reference if it was recorded
+            self.capture_worker.release(frame)
+        elif self.frame_buffers is not None:
+            self.frame_buffers.release(frame)
+
+    def _finish_frame(self, session, frame, meta, should_process, detections, is_keyframe):
+        """Everything after inference for one frame: re-id, analytics, rendering,
+        event fan-out and recording, into the session pinned when the frame was handed
+        over (released here)"""
+        try:
+            if should_process:
+                current_time = meta["current_time"]
+                t1 = time.perf_counter()
+                # New track ids only appear on keyframes
+                if REID_ENABLED and is_keyframe:
+                    linked = link_reentries(
+                        frame,
+                        detections,
+                        self.person_tracker,
+                        self.appearance_index,
+                        current_time,
+                        REID_SIMILARITY_THRESHOLD,
+                        REID_REFRESH_INTERVAL
+                    )
+                    if linked:
+                        self.metrics.reid_links.inc(linked)
+                    t_reid = time.perf_counter()
+                    self.profiler.record("reid", t_reid - t1)
+                    t1 = t_reid
+                if self.scanner_motion is not None:
+                    self.scanner_motion.estimate(frame, detections['scanner'], current_time)
+                cradles = None
+                if self.static_scene is not None:
+                    if self.static_scene.ready:
+                        self.static_scene.apply(detections)
+                        cradles = self.static_scene.cradles()
+                    elif is_keyframe:
+                        self.static_scene.observe(detections, current_time)
+                events = analytics_step(session.analytics, detections, current_time, cradles)
+                if session.evidence is not None and events:
+                    # Crops are taken before render_frame draws the overlays
+                    session.evidence.capture(frame, detections, events, current_time)
+                self.person_tracker.maybe_snapshot(
+                    PERSON_SNAPSHOT_PATH, current_time, PERSON_SNAPSHOT_INTERVAL, self.appearance_index
+                )
+                t2 = time.perf_counter()
+                render_frame(
+                    frame,
+                    detections,
+                    session.analytics,
+                    events,
+                    current_time,
+                    self.width,
+                    self.height
+                )
+                t3 = time.perf_counter()
+                self.metrics.analytics_latency.observe(t2 - t1)
+                self.metrics.render_latency.observe(t3 - t2)
+                self.profiler.record("analytics", t2 - t1)
+                self.profiler.record("render", t3 - t2)
+                self.metrics.frames_processed.inc()
+                if events:
+                    self.metrics.observe_events(events)
+                    self.event_bus.publish(events, current_time, sale_open=session.recording)
+                    self.store.add_events(session.session_id, events, current_time)
+            else:
+                self.metrics.frames_skipped.inc()
+
+            # Only record if recording is enabled (during active sales).
+            # The writer belongs to the session, so no lock is needed here.
+            out = session.out
+            if out is not None and frame is not None and session.should_record(should_process):
+                t0 = time.perf_counter()
+                # VideoWriter.write encodes synchronously (and the encoder process only
+                # takes a slot reference), so the frame is written without a copy
+                out.write(frame)
+                t1 = time.perf_counter()
+                self.metrics.recording_latency.observe(t1 - t0)
+                self.profiler.record("recording", t1 - t0)
+                encoder = self.encoder
+                if encoder is not None:
+                    # Frames handed to the encoder process but not yet encoded
+                    depth = encoder.backlog()
+                    if depth is not None:
+                        self.metrics.recording_queue_depth.set(depth)
+        finally:
+            self._unpin_session(session)
+            self._release_frame(frame)
+
+    def warmup(self, runs=MODEL_WARMUP_RUNS):
+        """Run the detector on blank frames of the stream size so lazy initialization
+        (weights to device, layer fusion, first allocations) happens before the first
+        real frame rather than inside a sale"""
+        frame = np.zeros((self.height or 640, self.width or 640, 3), dtype=np.uint8)
+        t0 = time.perf_counter()
+        kwargs = {'imgsz': self.detect_imgsz} if self.detect_imgsz else {}
+        for _ in range(max(1, runs)):
+            self.model.predict(frame, conf=self.confidence, verbose=False, **kwargs)
+            if self.two_tier is not None:
+                self.two_tier.warmup(frame.shape)
+        self.ready = True
+        print(f"✓ Model warmed up in {time.perf_counter() - t0:.2f}s")
 
     def start_prediction(self):
         with self._lock:
@@ -181,30 +871,43 @@ class Prediction:
         if not self.capture_video():
             self.running = False
             return
+        if FRAME_TRANSPORT == "shared_memory" and not self._start_frame_workers():
+            self.running = False
+            return
 
         # Create and start prediction thread
         self.thread = threading.Thread(target=self._run_prediction_loop, daemon=False)
         self.thread.start()
 
-    def save_video(self, OUTPUT_PATH):
-        if not self.temp_video_path or not os.path.exists(self.temp_video_path):
+    def save_video(self, OUTPUT_PATH, session=None):
+        session = session or self.session
+        if not session.temp_video_path:
             print("Error: No temporary video recording found to save")
             return False
 
         try:
-            shutil.move(self.temp_video_path, OUTPUT_PATH)  # ✅ works across drives
+            # Moved (works across drives), then the segments are joined into one file
+            if not save_clip(session.temp_video_path, OUTPUT_PATH):
+                print("Error: No temporary video recording found to save")
+                return False
+            if not join_clip(OUTPUT_PATH, self.recording_profile["codec"], self.recording_profile["quality"]):
+                print(f"✗ Could not join recording segments, kept as segments: {OUTPUT_PATH}")
             print(f"✓ Video saved to {OUTPUT_PATH}")
             return True
         except Exception as e:
             print(f"✗ Error saving video: {e}")
             return False
         
-    def print_output(self, pos_wallet: bool = False, pos_member: bool = False) -> Tuple[Dict, Dict]:
+    def print_output(self, pos_wallet: bool = False, pos_member: bool = False, session: SaleSession = None) -> Tuple[Dict, Dict]:
+        """Summarize a sale; pass the frozen session returned by close_sale()"""
+        session = session or self.session
+        # Running summary maintained by RetailAnalytics: constant time regardless of sale length
+        summary = session.analytics.get_sale_summary()
 
         output = {
-            "items_scanned": True,
-            "cashier": True,
-            "scanner_moving": True,
+            "items_scanned": summary["items_scanned"] > 0,
+            "cashier": summary["cashier_seen"],
+            "scanner_moving": summary["scanner_moving"],
             "pos_member": pos_member,
             "suspicious_activity": False,
             "customer_paid_wallet": pos_wallet,
@@ -214,7 +917,7 @@ class Prediction:
         }
 
         developer_message = {}
-        self.suspicious = False
+        session.suspicious = False
 
         # WALLET PAYMENT (POS CONFIRMED – NO CASH REQUIRED)
         if pos_wallet:
@@ -227,16 +930,16 @@ class Prediction:
         # CASH FLOW
         # 🔒 Enforce CV only if POS says member
         if pos_member:
-            has_customer = bool(self.analytics.customer_visits)
-            has_cash = bool(self.analytics.cash_detected)
-            has_member_scan = len(self.analytics.completed_payments) > 0
+            has_customer = summary["customer_visits"] > 0
+            has_cash = summary["cash_detections"] > 0
+            has_member_scan = summary["payments"] > 0
 
             if has_customer and has_cash and has_member_scan:
                 output["purchasing_customer"] = True
                 output["member_use"] = True
             else:
                 output["suspicious_activity"] = True
-                self.suspicious = True
+                session.suspicious = True
 
                 if not has_customer:
                     developer_message["customer_detection"] = "POSM1-MODELC0"
@@ -263,15 +966,10 @@ class Prediction:
 
         # Force close writer
         with self._lock:
-            if self.out is not None:
-                try:
-                    if self.out.isOpened():
-                        self.out.release()
-                except Exception as e:
-                    print(f"Error releasing VideoWriter: {e}")
-                finally:
-                    self.out = None
+            self.session.release_recording()
             self.recording_enabled = False
+            self.metrics.recording_enabled.set(0)
 
+        self.store.flush()
         self.stop_event.clear()
         print("✓ Prediction stopped cleanly")
\ No newline at end of file
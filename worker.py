@@ -0,0 +1,46 @@
+"""Long-lived inference worker for SERVING_MODE="worker".
+
+Loads and warms up the model eagerly, starts the prediction loop and serves the
+control operations to the web processes (main.py under any WSGI server) over
+local IPC. Restarting or scaling the web tier never touches inference.
+"""
+from pipeline import Prediction
+from app.ipc import InferenceServer, load_authkey
+from app.sale_service import SaleService
+from app.variables import (
+    MODEL_PATH,
+    VIDEO_PATH,
+    INFERENCE_WORKER_ADDRESS,
+    INFERENCE_WORKER_AUTHKEY_ENV,
+    INFERENCE_WORKER_AUTHKEY_FILE
+)
+import signal
+
+
+def main():
+    # Resolved before the model loads, so a misconfigured worker fails fast
+    authkey = load_authkey(INFERENCE_WORKER_AUTHKEY_ENV, INFERENCE_WORKER_AUTHKEY_FILE, create=True)
+    model = Prediction(MODEL_PATH, VIDEO_PATH, target_fps=10)
+    print("✓ Model loaded (target fps: 10)")
+    model.warmup()
+    model.start_prediction()
+    print("✓ Prediction started")
+
+    server = InferenceServer(SaleService(model), INFERENCE_WORKER_ADDRESS, authkey)
+
+    def shutdown(signum, frame):
+        server.close()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        model.stop_prediction()
+        print("✓ Inference worker stopped")
+
+
+if __name__ == "__main__":
+    main()